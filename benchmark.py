@@ -0,0 +1,470 @@
+"""
+提取流水线基准测试：在冻结的页面语料上测量各阶段和端到端的速度
+
+    python benchmark.py snapshot --corpus benchmarks/corpus                 # 收集仓库内的样例页面
+    python benchmark.py snapshot --corpus benchmarks/corpus --db --limit 500 # 再加上数据库中的页面
+    python benchmark.py run --corpus benchmarks/corpus --output benchmarks/$(git rev-parse --short HEAD).json
+    python benchmark.py compare benchmarks/a1b2c3d.json benchmarks/e4f5a6b.json
+    python benchmark.py startup --target 0.5                                 # 各模块冷启动时间
+
+语料用 page_archive 格式保存（<corpus>.zdict/.pages/.idx），另有 <corpus>.json 记录每个页面的来源。
+每个阶段在单独的spawn子进程中运行，峰值RSS只包含该阶段自己的导入和运行；
+结果JSON带有提交号和语料摘要，语料不同的两次结果不能直接比较。
+"""
+import argparse
+import ast
+import asyncio
+import datetime
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASE_MODEL = os.path.join(ROOT, 'pipeline', 'base_model')
+# 流水线模块按文件名导入，插在搜索路径最前面，不会被已安装的同名包抢先
+if BASE_MODEL not in sys.path:
+    sys.path.insert(0, BASE_MODEL)
+from page_archive import PageArchive, PageArchiveWriter
+from page_decoding import decode_row
+
+# 内联样例页面所在的文件，只用ast读取字符串常量，不导入这些模块
+SAMPLE_SOURCES = (
+    'plan_b.py',
+    'detial_page_worker.py',
+    'extractor2.py',
+    'pipeline/base_model/LLMUtils.py',
+    'pipeline/base_model/html_break_down.py',
+    'pipeline/base_model/video_detect.py',
+    'pipeline/base_model/test.py',
+    'pipeline/base_model/newspapaer3k_demo.py',
+)
+SAMPLE_FILES = 'pipeline/base_model/*.html'
+# 短于这个长度的字符串常量不当作页面
+MIN_PAGE_CHARS = 512
+
+PERCENTILES = (50, 95, 99)
+# 运行一个阶段前从子进程环境中去掉的开关，避免缓存、去重和模板学习让重复运行越跑越快
+PIPELINE_SWITCHES = ('RESULT_CACHE_PATH', 'NEAR_DUP_INDEX', 'SITE_TEMPLATE_DB', 'BLOCK_MODEL_PATH')
+
+
+def _looks_like_page(text: str) -> bool:
+    head = text[:4096].lower()
+    return len(text) >= MIN_PAGE_CHARS and ('<html' in head or '<body' in text.lower())
+
+
+def inline_samples(root: str = ROOT) -> List[Dict]:
+    """仓库中内联的HTML样例和 .html 文件，按内容去重"""
+    pages = []
+    for relative in SAMPLE_SOURCES:
+        path = os.path.join(root, relative)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf8') as f:
+            tree = ast.parse(f.read(), filename=relative)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and _looks_like_page(node.value):
+                pages.append({'source': f'{relative}:{node.lineno}', 'html': node.value})
+    for path in sorted(glob.glob(os.path.join(root, SAMPLE_FILES))):
+        with open(path, encoding='utf8', errors='replace') as f:
+            pages.append({'source': os.path.relpath(path, root), 'html': f.read()})
+
+    unique, seen = [], set()
+    for page in pages:
+        digest = hashlib.blake2b(page['html'].encode('utf8', 'surrogatepass'), digest_size=16).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(page)
+    return unique
+
+
+async def database_pages(args) -> List[Dict]:
+    """按 --since / --ids 从数据库读取最多 --limit 个页面"""
+    import storage
+    from incremental import parse_ids
+
+    backend = await storage.open_backend(args.backend)
+    pages = []
+    try:
+        sql, params = backend.build_query('id', args.since, parse_ids(args.ids))
+        async for batch in backend.stream(sql, params, batch_size=min(args.limit, 500)):
+            for row in batch:
+                pages.append({'source': f"db:{row['id']}", 'html': row['result_text'] or ''})
+            if len(pages) >= args.limit:
+                break
+    finally:
+        await backend.close()
+    return pages[:args.limit]
+
+
+def snapshot(corpus: str, pages: List[Dict]) -> Dict:
+    """把页面写成一个归档，页面id为在语料中的序号"""
+    manifest = []
+    with PageArchiveWriter(corpus) as writer:
+        for page_id, page in enumerate(pages):
+            writer.add(page_id, page['html'])
+            manifest.append({'id': page_id, 'source': page['source'], 'chars': len(page['html'])})
+    with open(corpus + '.json', 'w', encoding='utf8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return {'pages': writer.count, 'raw_bytes': writer.raw_bytes, 'compressed_bytes': writer.compressed_bytes}
+
+
+def load_corpus(corpus: str) -> List[Dict]:
+    """
+    按id顺序读出语料，格式与driver解码后的行相同 {'id', 'result_text', 'result_bytes', 'encoding'}，
+    另外 raw_bytes 为归档中的原始字节（替换过非法字节的页面 result_bytes 为None），作为解码阶段的输入
+    """
+    rows = []
+    with PageArchive(corpus) as archive:
+        for page_id in sorted(archive.ids()):
+            raw = archive.get_bytes(int(page_id))
+            row = {'id': int(page_id), 'result_text': raw}
+            decode_row(row)
+            row['raw_bytes'] = raw
+            rows.append(row)
+    return rows
+
+
+def corpus_digest(rows: List[Dict]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(row['result_text'].encode('utf8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+# ---------------- 阶段 ----------------
+# 每个阶段是一个工厂函数，在子进程中导入模块并返回 fn(row)；导入时间不计入延迟
+
+def _decode():
+    from page_decoding import decode_html
+    return lambda row: decode_html(row['raw_bytes'])
+
+
+def _clean_html():
+    from LLMUtils import clean_html
+    return lambda row: clean_html(row['result_text'])
+
+
+def _heuristic():
+    from html_content_extractor import extract_text_from_html
+    return lambda row: extract_text_from_html(row['result_text'])
+
+
+def _plan_b_extract():
+    from plan_b_fromdb import extract_text_from_html
+    return lambda row: extract_text_from_html(row['result_text'])
+
+
+def _streaming():
+    from streaming_extractor import extract_main_content
+    return lambda row: extract_main_content(row['result_text'])
+
+
+def _analyze():
+    from html_break_down_from_DB import XPathHTMLAnalyzer
+    return lambda row: XPathHTMLAnalyzer().analyze_structure(row['result_text'])
+
+
+def _trafilatura():
+    import trafilatura
+    return lambda row: trafilatura.extract(row['result_text'], output_format='json', with_metadata=True)
+
+
+def _run_async(process):
+    loop = asyncio.new_event_loop()
+    return lambda row: loop.run_until_complete(process(row))
+
+
+def _plan_b_end_to_end():
+    # 直接调用 process_data，不经过结果缓存和近重复检测
+    from plan_b_fromdb import process_data
+    return _run_async(process_data)
+
+
+def _break_down_end_to_end():
+    from html_break_down_from_DB import print_analysis
+    return _run_async(print_analysis)
+
+
+def _registry(mode):
+    # 不需要模型服务的三个策略，结果缓存关闭，每次都实际运行
+    def factory():
+        import web_content_extractor.registry as registry
+        loop = asyncio.new_event_loop()
+        strategies = ('heuristic', 'xpath', 'trafilatura')
+        return lambda row: loop.run_until_complete(registry.extract(dict(row), strategies, mode))
+    return factory
+
+
+STAGES: Dict[str, Callable] = {
+    'decode': _decode,
+    'clean_html': _clean_html,
+    'heuristic': _heuristic,
+    'plan_b_extract': _plan_b_extract,
+    'streaming': _streaming,
+    'analyze': _analyze,
+    'trafilatura': _trafilatura,
+    'plan_b_e2e': _plan_b_end_to_end,
+    'break_down_e2e': _break_down_end_to_end,
+    'cascade': _registry('cascade'),
+    'ensemble': _registry('ensemble'),
+}
+
+
+def _peak_rss_mb() -> float:
+    # Linux上 ru_maxrss 单位为KB，macOS上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_stage(name: str, corpus: str, repeat: int, warmup: int) -> Dict:
+    """在当前进程中运行一个阶段，返回吞吐、延迟分位数和峰值RSS"""
+    for switch in PIPELINE_SWITCHES:
+        os.environ.pop(switch, None)
+    rows = load_corpus(corpus)
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        fn = STAGES[name]()
+    except ImportError as e:
+        return {'skipped': f'{type(e).__name__}: {e}'}
+    import_seconds = time.perf_counter() - start
+
+    for _ in range(warmup):
+        for row in rows:
+            try:
+                fn(row)
+            except Exception:
+                pass
+
+    latencies = []
+    errors = 0
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            page_start = time.perf_counter()
+            try:
+                fn(row)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - page_start)
+    total = time.perf_counter() - total_start
+
+    latencies_ms = np.asarray(latencies) * 1000
+    report = {
+        'pages': len(latencies),
+        'errors': errors,
+        'seconds': total,
+        'pages_per_sec': len(latencies) / total if total else 0.0,
+        'import_seconds': import_seconds,
+        'mean_ms': float(latencies_ms.mean()) if len(latencies_ms) else 0.0,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+    for q, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES) if len(latencies_ms) else [0.0] * 3):
+        report[f'p{q}_ms'] = float(value)
+    return report
+
+
+def _git_commit() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def run(corpus: str, stages: List[str], repeat: int = 3, warmup: int = 1) -> Dict:
+    rows = load_corpus(corpus)
+    report = {
+        **_git_commit(),
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {
+            'path': corpus,
+            'pages': len(rows),
+            'chars': sum(len(row['result_text']) for row in rows),
+            'digest': corpus_digest(rows),
+        },
+        'repeat': repeat,
+        'warmup': warmup,
+        'stages': {},
+    }
+    # spawn：每个阶段在全新的解释器中运行，互不共享导入的模块和内存峰值
+    context = multiprocessing.get_context('spawn')
+    for name in stages:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_stage, (name, corpus, repeat, warmup))
+        report['stages'][name] = result
+        if 'skipped' in result:
+            print(f'{name:16s} 跳过: {result["skipped"]}')
+        else:
+            print(f'{name:16s} {result["pages_per_sec"]:9.1f} 页/秒  p50 {result["p50_ms"]:8.2f}ms  '
+                  f'p95 {result["p95_ms"]:8.2f}ms  p99 {result["p99_ms"]:8.2f}ms  '
+                  f'峰值RSS {result["peak_rss_mb"]:.0f}MB  错误 {result["errors"]}')
+    return report
+
+
+# ---------------- 冷启动 ----------------
+# worker进程和以库方式使用时会导入的模块
+STARTUP_MODULES = (
+    'web_content_extractor',
+    'plan_b_fromdb',
+    'html_break_down_from_DB',
+    'html_content_extractor',
+    'streaming_extractor',
+    'extractor2',
+    'plan_b',
+    'detial_page_worker',
+    'LLMUtils',
+    'newspapaer3k_demo',
+)
+# 这些模块导入慢，只应在真正用到时导入
+HEAVY_MODULES = ('openai', 'trafilatura', 'htmldate', 'pyarrow', 'aiomysql', 'asyncpg', 'newspaper', 'zstandard')
+DEFAULT_STARTUP_TARGET = 0.5
+
+_STARTUP_SNIPPET = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(json.dumps({"import_seconds": time.perf_counter() - start,
+                  "heavy": sorted(name for name in sys.argv[2:] if name in sys.modules)}))
+'''
+
+
+def measure_startup(module: str, repeat: int = 5) -> Dict:
+    """在全新的解释器中导入模块 repeat 次，返回进程总耗时和导入耗时的中位数，以及被导入的慢模块"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, BASE_MODEL]))
+    walls, imports, heavy = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', _STARTUP_SNIPPET, module, *HEAVY_MODULES],
+                                   cwd=ROOT, env=env, capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            return {'error': (completed.stderr.strip().splitlines() or ['?'])[-1]}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        imports.append(result['import_seconds'])
+        heavy = result['heavy']
+    return {'wall_seconds': float(np.median(walls)), 'import_seconds': float(np.median(imports)), 'heavy': heavy}
+
+
+def startup(modules: List[str], repeat: int = 5, target: float = DEFAULT_STARTUP_TARGET) -> Dict:
+    """测量各模块的冷启动时间（解释器启动 + 导入），超过 target 秒或导入失败的模块记为不合格"""
+    report = {**_git_commit(), 'python': platform.python_version(), 'target_seconds': target,
+              'repeat': repeat, 'modules': {}, 'failed': []}
+    for module in modules:
+        result = measure_startup(module, repeat)
+        report['modules'][module] = result
+        if 'error' in result:
+            report['failed'].append(module)
+            print(f'{module:26s} 导入失败: {result["error"]}')
+            continue
+        over = result['wall_seconds'] > target
+        if over:
+            report['failed'].append(module)
+        print(f'{module:26s} 冷启动 {result["wall_seconds"] * 1000:7.0f}ms  导入 {result["import_seconds"] * 1000:7.0f}ms'
+              f'  {"超出目标" if over else "ok":8s} {", ".join(result["heavy"])}')
+    return report
+
+
+def compare(base: Dict, head: Dict) -> None:
+    """打印两次结果中各阶段吞吐和p95的变化"""
+    if base['corpus']['digest'] != head['corpus']['digest']:
+        print('警告: 两次运行使用的语料不同')
+    print(f"{'阶段':14s} {'页/秒':>22s} {'p95(ms)':>24s} {'峰值RSS(MB)':>16s}")
+    for name, after in head['stages'].items():
+        before = base['stages'].get(name)
+        if not before or 'skipped' in before or 'skipped' in after:
+            continue
+        speed = after['pages_per_sec'] / before['pages_per_sec'] - 1 if before['pages_per_sec'] else 0.0
+        p95 = after['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        print(f"{name:16s} {before['pages_per_sec']:8.1f} -> {after['pages_per_sec']:8.1f} ({speed:+6.1%})"
+              f" {before['p95_ms']:8.2f} -> {after['p95_ms']:8.2f} ({p95:+6.1%})"
+              f" {before['peak_rss_mb']:6.0f} -> {after['peak_rss_mb']:6.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='提取流水线基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='冻结一份页面语料')
+    snapshot_parser.add_argument('--corpus', default='benchmarks/corpus', help='语料归档路径前缀')
+    snapshot_parser.add_argument('--no-inline', action='store_true', help='不收集仓库内的样例页面')
+    snapshot_parser.add_argument('--from-archive', default=None, help='从已有页面归档中复制页面')
+    snapshot_parser.add_argument('--db', action='store_true', help='从数据库读取页面')
+    snapshot_parser.add_argument('--backend', default=None, help='存储后端，默认读取环境变量 STORAGE_BACKEND')
+    snapshot_parser.add_argument('--since', default=None, help='只取id大于该值的页面')
+    snapshot_parser.add_argument('--ids', default=None, help='只取这些id，逗号分隔')
+    snapshot_parser.add_argument('--limit', type=int, default=1000, help='从归档或数据库最多取多少个页面')
+
+    run_parser = subparsers.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('--corpus', default='benchmarks/corpus')
+    run_parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    run_parser.add_argument('--repeat', type=int, default=3, help='每个阶段在语料上跑几遍')
+    run_parser.add_argument('--warmup', type=int, default=1, help='计时前预热几遍')
+    run_parser.add_argument('--output', default=None, help='结果JSON，默认 benchmarks/<提交号>.json')
+
+    compare_parser = subparsers.add_parser('compare', help='比较两次结果')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+
+    startup_parser = subparsers.add_parser('startup', help='测量各模块在新进程中的冷启动时间')
+    startup_parser.add_argument('--modules', nargs='+', default=list(STARTUP_MODULES))
+    startup_parser.add_argument('--repeat', type=int, default=5, help='每个模块测几次，取中位数')
+    startup_parser.add_argument('--target', type=float, default=DEFAULT_STARTUP_TARGET,
+                                help='冷启动时间目标（秒），有模块超出时退出码为1')
+    startup_parser.add_argument('--output', default=None, help='结果JSON')
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        pages = [] if args.no_inline else inline_samples()
+        if args.from_archive:
+            with PageArchive(args.from_archive) as source:
+                for page_id in sorted(source.ids())[:args.limit]:
+                    pages.append({'source': f'{args.from_archive}:{page_id}', 'html': source.get(int(page_id))})
+        if args.db:
+            pages.extend(asyncio.run(database_pages(args)))
+        if not pages:
+            parser.error('语料为空')
+        stats = snapshot(args.corpus, pages)
+        print(f"语料 {args.corpus}: {stats['pages']} 个页面, {stats['raw_bytes']} -> {stats['compressed_bytes']} 字节")
+    elif args.command == 'run':
+        if not os.path.exists(args.corpus + '.idx'):
+            parser.error(f'语料不存在，先运行: python benchmark.py snapshot --corpus {args.corpus}')
+        report = run(args.corpus, args.stages, args.repeat, args.warmup)
+        output = args.output
+        if output is None:
+            commit = (report['commit'] or 'unknown')[:7] + ('-dirty' if report['dirty'] else '')
+            output = os.path.join(os.path.dirname(args.corpus) or '.', f'{commit}.json')
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {output}')
+    elif args.command == 'startup':
+        report = startup(args.modules, args.repeat, args.target)
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+            with open(args.output, 'w', encoding='utf8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if report['failed']:
+            sys.exit(1)
+    else:
+        with open(args.base, encoding='utf8') as f:
+            base = json.load(f)
+        with open(args.head, encoding='utf8') as f:
+            head = json.load(f)
+        compare(base, head)
@@ -0,0 +1,145 @@
+import re
+
+from bs4 import Comment, Tag
+
+# 干扰元素标签，与 extractor2.is_likely_noise 保持一致
+NOISE_TAGS = frozenset({
+    'script', 'style', 'iframe', 'noscript', 'option', 'button',
+    'form', 'input', 'textarea', 'select', 'svg', 'canvas'
+})
+
+# 直接判定为header/footer的标签
+HEADER_FOOTER_TAGS = frozenset({'header', 'footer', 'nav'})
+
+# class/id 中出现即判定为header/footer的关键词，与 extractor2.is_likely_header_or_footer 保持一致
+SUSPICIOUS_TERMS = (
+    'header', 'footer', 'navigation', 'nav', 'menu', 'banner',
+    'copyright', 'logo', 'social', 'sidebar', 'widget', 'breadcrumb',
+    'pagination', 'comment', 'advertisement', 'ad-', '-ad', 'share'
+)
+
+# 纯符号文本视为无意义，与 extractor2.has_meaningful_text 保持一致
+SPECIAL_CHARS = frozenset(',.!?;:()[]{}|/\\<>+=_-*&^%$#@~`"\'')
+
+# 常见的噪音文本，均从文本开头匹配
+NOISE_TEXT_PATTERNS = (
+    r'[0-9\W]+$',  # 纯数字或特殊字符
+    r'(powered by|copyright|\(c\)|©|all rights reserved)',  # 版权信息
+    r'(share|like|follow|subscribe|sign up|login|register)',  # 行动号召
+    r'(previous|next|page|[0-9]+ of [0-9]+)',  # 导航元素
+)
+
+_term_matchers = {}
+
+
+def compile_term_matcher(terms=SUSPICIOUS_TERMS):
+    """
+    把关键词列表编译成一个正则，等价于 any(term in text for term in terms)
+    同一组关键词只编译一次
+    """
+    terms = tuple(terms)
+    matcher = _term_matchers.get(terms)
+    if matcher is None:
+        matcher = re.compile('|'.join(re.escape(term) for term in terms))
+        _term_matchers[terms] = matcher
+    return matcher
+
+
+def is_suspicious_attrs(classes, element_id, terms=SUSPICIOUS_TERMS):
+    """
+    检查class/id字符串中是否包含header/footer关键词
+    classes 为空格分隔的class字符串（lxml风格）或class列表（BeautifulSoup风格）
+    """
+    if not isinstance(classes, str):
+        classes = ' '.join(classes) if classes else ''
+    # 关键词都不含空格，所以把class和id拼在一起搜索不会产生跨边界的误匹配
+    haystack = f"{classes} {element_id or ''}".lower()
+    return compile_term_matcher(terms).search(haystack) is not None
+
+
+def is_header_or_footer_tag(element, header_tags=HEADER_FOOTER_TAGS, terms=SUSPICIOUS_TERMS):
+    """
+    判断BeautifulSoup元素是否可能是header或footer，规则同 extractor2.is_likely_header_or_footer
+    """
+    if element.name in header_tags:
+        return True
+    return is_suspicious_attrs(element.get('class') or '', element.get('id', ''), terms)
+
+
+def prune_noise_and_boilerplate(root, noise_tags=NOISE_TAGS, header_tags=HEADER_FOOTER_TAGS,
+                                terms=SUSPICIOUS_TERMS):
+    """
+    一次遍历完成三轮清理：移除注释、干扰标签、header/footer
+    结果与依次执行三次 find_all + extract/decompose 相同；
+    一个节点被删除后不再访问它的子孙节点
+    """
+    stack = list(root.contents)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Tag):
+            if node.name in noise_tags or is_header_or_footer_tag(node, header_tags, terms):
+                node.decompose()
+            else:
+                stack.extend(node.contents)
+        elif isinstance(node, Comment):
+            node.extract()
+    return root
+
+
+class TextQualityClassifier:
+    """
+    判断文本是否有意义：排除过短、纯符号和常见噪音文本
+    噪音模式只编译一次，合并成一个锚定在开头的正则；实例创建后不再改变，可以在线程和页面间共用。
+    按节点缓存判断结果见 text_cache.NodeTextCache.is_meaningful，缓存只在一个页面内有效
+    """
+
+    def __init__(self, min_length=10, noise_patterns=NOISE_TEXT_PATTERNS, special_chars=SPECIAL_CHARS):
+        self.min_length = min_length
+        self.special_chars = frozenset(special_chars)
+        self._noise = re.compile('(?:' + '|'.join(f'(?:{p})' for p in noise_patterns) + ')')
+
+    def is_meaningful_text(self, text, min_length=None):
+        """判断一段已提取的文本（get_text(strip=True) 的结果）"""
+        if min_length is None:
+            min_length = self.min_length
+        if not text or len(text) < min_length:
+            return False
+        if set(text) <= self.special_chars:
+            return False
+        return self._noise.match(text.lower()) is None
+
+
+_default_classifier = TextQualityClassifier()
+
+
+def is_meaningful_text(text, min_length=None):
+    """用默认规则判断一段已提取的文本"""
+    return _default_classifier.is_meaningful_text(text, min_length)
+
+if __name__ == '__main__':
+    # 微基准：对比旧的 has_meaningful_text 写法（每次调用建集合、逐个 re.match 未编译的模式）
+    import timeit
+
+    samples = [
+        '黑龙江日报10月25日讯 高温、高压、高转速下可靠、持久的运转',
+        'Copyright © 2001-2017 WWW.DBW.CN All Rights Reserved.',
+        '024-23187042 024-23186204',
+        'Share this article with your friends',
+        '新闻热线 024-23187042 值班电话',
+        '1 of 12',
+    ] * 50
+
+    def legacy(text, min_length=10):
+        if not text or len(text) < min_length:
+            return False
+        special_chars = set(',.!?;:()[]{}|/\\<>+=_-*&^%$#@~`"\'')
+        if all(char in special_chars for char in set(text)):
+            return False
+        noise_patterns = [r'^' + p for p in NOISE_TEXT_PATTERNS]
+        return not any(re.match(pattern, text.lower()) for pattern in noise_patterns)
+
+    assert [legacy(t) for t in samples] == [is_meaningful_text(t) for t in samples]
+    runs = 200
+    old = timeit.timeit(lambda: [legacy(t) for t in samples], number=runs)
+    new = timeit.timeit(lambda: [is_meaningful_text(t) for t in samples], number=runs)
+    print(f'每页 {len(samples)} 个节点: 旧 {old / runs * 1e3:.3f} ms, 新 {new / runs * 1e3:.3f} ms, 提速 {old / new:.1f}x')
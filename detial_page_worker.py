@@ -1,4 +1,3 @@
-from openai import OpenAI
 from bs4 import BeautifulSoup
 import re
 
@@ -2494,28 +2493,39 @@ def clean_attributes(html):
     return html
 
 
-xx = clean_attributes(html_content)
-
-response = client.chat.completions.create(
-    model= model_name,
-    messages=[
-        {
-            "role": "user", 
-            "content": html_str
-        }
-    ],
-    temperature=temperature,
-    top_p  =1,
-    extra_body={
-        "repetition_penalty": repetition_penalty,
-        "max_tokens": max_tokens,
-        "top_k": -1,
-        "presence_penalty": 0.25
-        # "guided_json": guided_json_format
-    },
+if __name__ == '__main__':
+    # 演示：把去掉无用属性的样例页面交给模型；导入本模块时不创建客户端、不发请求
+    # 服务地址和生成参数与 LLMUtils.py 的演示相同
+    from openai import OpenAI
+
+    client = OpenAI(base_url="http://172.17.141.17:11431/v1/", api_key="sk-xxxxxxxxxxxxxxxxxxxx")
+    model_name = "reader-lm-1.5q"
+    temperature = 0
+    repetition_penalty = 1.08
+    max_tokens = 4096
+
+    html_str = clean_attributes(html_content)
+
+    response = client.chat.completions.create(
+        model= model_name,
+        messages=[
+            {
+                "role": "user", 
+                "content": html_str
+            }
+        ],
+        temperature=temperature,
+        top_p  =1,
+        extra_body={
+            "repetition_penalty": repetition_penalty,
+            "max_tokens": max_tokens,
+            "top_k": -1,
+            "presence_penalty": 0.25
+            # "guided_json": guided_json_format
+        },
    
-    # max_length=4096,
-)
+        # max_length=4096,
+    )
 
 
-print(response)
\ No newline at end of file
+    print(response)
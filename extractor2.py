@@ -1,5 +1,11 @@
 from bs4 import BeautifulSoup, Comment
 import re
+from content_rules import is_meaningful_text, prune_noise_and_boilerplate
+from text_cache import NodeTextCache
+from streaming_extractor import extract_main_content as extract_main_content_streaming
+
+# 超过这个长度（字符数）的页面使用流式提取
+STREAMING_THRESHOLD = 2 * 1024 * 1024
 
 def is_likely_header_or_footer(element):
     """
@@ -54,37 +60,24 @@ def is_content_tag(tag):
     }
     return tag.name in content_tags
 
-def has_meaningful_text(element, min_length=10):
+def has_meaningful_text(element, min_length=10, text=None, text_cache=None):
     """
     检查元素是否包含有意义的文本
     排除纯空格、纯符号等无意义内容
+    已经提取过文本时通过 text 传入，或传入页面共用的 text_cache（判断结果也按节点缓存在其中），避免再次遍历子树
     """
-    text = element.get_text(strip=True)
-    if not text or len(text) < min_length:
-        return False
-        
-    # 检查是否全是特殊字符
-    special_chars = set(',.!?;:()[]{}|/\\<>+=_-*&^%$#@~`"\'')
-    text_chars = set(text)
-    if all(char in special_chars for char in text_chars):
-        return False
-        
-    # 检查是否是常见的噪音文本
-    noise_patterns = [
-        r'^[0-9\W]+$',  # 纯数字或特殊字符
-        r'^(powered by|copyright|\(c\)|©|all rights reserved)',  # 版权信息
-        r'^(share|like|follow|subscribe|sign up|login|register)',  # 行动号召
-        r'^(previous|next|page|[0-9]+ of [0-9]+)',  # 导航元素
-    ]
-    
-    return not any(re.match(pattern, text.lower()) for pattern in noise_patterns)
+    if text is None and text_cache is not None:
+        return text_cache.is_meaningful(element, min_length)
+    if text is None:
+        text = element.get_text(strip=True)
+    return is_meaningful_text(text, min_length)
 
-def get_text_density(element):
+def get_text_density(element, text_cache=None):
     """
     计算元素的文本密度
     文本密度 = 文本长度 / 标签数量
     """
-    text_length = len(element.get_text(strip=True))
+    text_length = text_cache.text_length(element) if text_cache else len(element.get_text(strip=True))
     tags_count = len(element.find_all())
     if tags_count == 0:
         return text_length
@@ -96,19 +89,17 @@ def extract_main_content(html):
     """
     if not html:
         return ""
+
+    # 超大页面走流式解析，不构建完整的DOM树
+    if len(html) >= STREAMING_THRESHOLD:
+        return extract_main_content_streaming(html, strip=True)
         
     soup = BeautifulSoup(html, 'html.parser')
     
-    # 移除注释和无用标签
-    for element in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        element.extract()
-    
-    for element in soup.find_all(is_likely_noise):
-        element.decompose()
-    
-    # 移除header和footer
-    for element in soup.find_all(is_likely_header_or_footer):
-        element.decompose()
+    # 一次遍历移除注释、无用标签以及header和footer
+    prune_noise_and_boilerplate(soup)
+    # 本页面所有启发式规则共用的文本缓存，节点的判断结果也缓存在其中
+    text_cache = NodeTextCache(soup)
     
     def extract_text_from_element(element, depth=0, max_depth=10):
         """
@@ -120,10 +111,8 @@ def extract_main_content(html):
         texts = []
         
         # 如果元素本身包含有意义的文本，直接添加
-        if has_meaningful_text(element):
-            text = element.get_text(strip=True)
-            if text:
-                texts.append(text)
+        if has_meaningful_text(element, text_cache=text_cache):
+            texts.append(text_cache.text(element))
         
         # 递归处理子元素
         # for child in element.children:
@@ -394,4 +383,5 @@ var _hmt = _hmt || [];
 """
 
 
-print(extract_text_from_html(html_content))
\ No newline at end of file
+if __name__ == '__main__':
+    print(extract_text_from_html(html_content))
\ No newline at end of file
@@ -1,5 +1,31 @@
-from bs4 import BeautifulSoup, Comment
+from bs4 import BeautifulSoup, Comment, Tag
+from bisect import bisect_left
+import heapq
 import re
+from content_rules import prune_noise_and_boilerplate
+from text_cache import NodeTextCache
+
+# 本提取器使用的干扰标签和header/footer关键词
+NOISE_TAGS = frozenset({'script', 'style', 'iframe', 'noscript'})
+SUSPICIOUS_TERMS = (
+    'header', 'footer', 'navigation', 'nav', 'menu', 'banner',
+    'copyright', 'logo', 'social', 'sidebar', 'widget'
+)
+
+# 常见的模板内容关键词
+BOILERPLATE_PATTERNS = [
+    r'©.*?\d{4}',  # 版权信息（非贪婪，便于ContentStats求最短匹配；是否匹配与贪婪写法相同）
+    r'all rights reserved',
+    r'terms of (use|service)',
+    r'privacy policy',
+    r'cookie policy',
+    r'subscribe to our newsletter',
+    r'follow us on',
+    r'share this'
+]
+
+HEADING_TAGS = frozenset({'h1', 'h2', 'h3', 'h4', 'h5', 'h6'})
+CONTAINER_TAGS = frozenset({'article', 'main', 'div', 'section'})
 
 def is_likely_header_or_footer(element):
     """
@@ -9,22 +35,17 @@ def is_likely_header_or_footer(element):
     if element.name in ['header', 'footer', 'nav']:
         return True
     
-    suspicious_terms = [
-        'header', 'footer', 'navigation', 'nav', 'menu', 'banner', 
-        'copyright', 'logo', 'social', 'sidebar', 'widget'
-    ]
-    
     # 检查class和id中的关键词
     element_classes = ' '.join(element.get('class', [])).lower()
     element_id = element.get('id', '').lower()
     
-    for term in suspicious_terms:
+    for term in SUSPICIOUS_TERMS:
         if term in element_classes or term in element_id:
             return True
             
     return False
 
-def has_high_link_density(element):
+def has_high_link_density(element, text_cache=None):
     """
     检查元素中的链接密度是否过高
     """
@@ -32,46 +53,36 @@ def has_high_link_density(element):
     if not links:
         return False
         
-    text_length = len(element.get_text(strip=True))
+    get_text = text_cache.text if text_cache else lambda node: node.get_text(strip=True)
+    text_length = len(get_text(element))
     if text_length == 0:
         return True
         
-    link_text_length = sum(len(link.get_text(strip=True)) for link in links)
+    link_text_length = sum(len(get_text(link)) for link in links)
     link_density = link_text_length / text_length
     
     return link_density > 0.5
 
-def is_boilerplate_content(element):
+def is_boilerplate_content(element, text_cache=None):
     """
     检查是否是模板内容
     """
-    text = element.get_text(strip=True)
+    text = text_cache.text(element) if text_cache else element.get_text(strip=True)
     if not text:
         return True
         
     # 检查是否包含常见的模板内容关键词
-    boilerplate_patterns = [
-        r'©.*\d{4}',  # 版权信息
-        r'all rights reserved',
-        r'terms of (use|service)',
-        r'privacy policy',
-        r'cookie policy',
-        r'subscribe to our newsletter',
-        r'follow us on',
-        r'share this'
-    ]
-    
-    for pattern in boilerplate_patterns:
+    for pattern in BOILERPLATE_PATTERNS:
         if re.search(pattern, text, re.IGNORECASE):
             return True
             
     return False
 
-def calculate_content_score(element):
+def calculate_content_score(element, text_cache=None):
     """
     计算内容的质量分数
     """
-    text = element.get_text(strip=True)
+    text = text_cache.text(element) if text_cache else element.get_text(strip=True)
     if not text:
         return 0
         
@@ -84,7 +95,7 @@ def calculate_content_score(element):
     structure_score = (p_tags * 50) + (h_tags * 30)
     
     # 链接密度惩罚
-    if has_high_link_density(element):
+    if has_high_link_density(element, text_cache):
         return 0
         
     # 计算最终分数
@@ -92,62 +103,159 @@ def calculate_content_score(element):
     
     return final_score
 
-def extract_main_content(html):
+class ContentStats(NodeTextCache):
     """
-    提取HTML中的主要文本内容
+    在文本缓存的同一次遍历中，后序汇总每个标签的p/h数量和链接文本长度
+    打分结果与 calculate_content_score / is_boilerplate_content 完全相同，
+    但不会对嵌套的div反复遍历子树
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self._containers = []
+        self._ensure()
+
+    @property
+    def containers(self):
+        """文档顺序的 article/main/div/section"""
+        self._ensure()
+        return self._containers
+
+    def _on_build_start(self):
+        self._containers = []
+
+    def _new_entry(self, node, pos):
+        if node.name in CONTAINER_TAGS and node is not self.root:
+            self._containers.append(node)
+        # [start, end, p数, h数, a数, 链接文本长度]
+        return [pos, pos, 0, 0, 0, 0]
+
+    def _leave(self, node, entry):
+        # 子节点都已算完，汇总到当前节点（find_all 不包含自身）
+        for child in node.contents:
+            if not isinstance(child, Tag):
+                continue
+            child_entry = self._entries[id(child)]
+            entry[2] += child_entry[2] + (child.name == 'p')
+            entry[3] += child_entry[3] + (child.name in HEADING_TAGS)
+            entry[4] += child_entry[4] + (child.name == 'a')
+            entry[5] += child_entry[5] + (child_entry[1] - child_entry[0] if child.name == 'a' else 0)
+
+    def _on_build_end(self):
+        self._boilerplate_starts, self._boilerplate_ends = self._index_boilerplate(self.page_text)
+
+    @staticmethod
+    def _index_boilerplate(page_text):
+        """找出所有模板关键词的匹配起点及对应的最短匹配终点，按起点排序并求后缀最小终点"""
+        matches = {}
+        for pattern in BOILERPLATE_PATTERNS:
+            for match in re.finditer(f'(?=({pattern}))', page_text, re.IGNORECASE):
+                start, end = match.start(1), match.end(1)
+                if end < matches.get(start, end + 1):
+                    matches[start] = end
+        starts = sorted(matches)
+        suffix_min_ends = [matches[start] for start in starts]
+        for i in range(len(suffix_min_ends) - 2, -1, -1):
+            suffix_min_ends[i] = min(suffix_min_ends[i], suffix_min_ends[i + 1])
+        return starts, suffix_min_ends
+
+    def has_high_link_density(self, element):
+        """等价于 has_high_link_density(element)"""
+        entry = self.entry(element)
+        if entry is None:
+            return has_high_link_density(element, self)
+        start, end, _, _, link_count, link_text_length = entry
+        if not link_count:
+            return False
+        if end == start:
+            return True
+        return link_text_length / (end - start) > 0.5
+
+    def is_boilerplate(self, element):
+        """等价于 is_boilerplate_content(element)：区间内存在完整的关键词匹配即为模板内容"""
+        entry = self.entry(element)
+        if entry is None:
+            return is_boilerplate_content(element, self)
+        start, end = entry[:2]
+        if start == end:
+            return True
+        i = bisect_left(self._boilerplate_starts, start)
+        return i < len(self._boilerplate_starts) and self._boilerplate_ends[i] <= end
+
+    def score(self, element):
+        """等价于 calculate_content_score(element)"""
+        entry = self.entry(element)
+        if entry is None:
+            return calculate_content_score(element, self)
+        start, end, p_tags, h_tags = entry[:4]
+        if start == end:
+            return 0
+        if self.has_high_link_density(element):
+            return 0
+        return (end - start) + (p_tags * 50) + (h_tags * 30)
+
+def select_top_containers(stats, k=1):
+    """
+    流式选出分数最高的k个非模板容器，结果与按分数稳定降序排序后取前k个相同
+    只有分数能进入前k的容器才做模板内容判断；k必须至少为1
+    """
+    if k < 1:
+        raise ValueError(f'k必须至少为1，实际为{k}')
+    heap = []  # 小顶堆，元素为 (分数, -文档序号, 容器)；序号越靠前越优先
+    for index, container in enumerate(stats.containers):
+        score = stats.score(container)
+        if len(heap) >= k and (score, -index) <= heap[0][:2]:
+            continue
+        if stats.is_boilerplate(container):
+            continue
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -index, container))
+        else:
+            heapq.heapreplace(heap, (score, -index, container))
+    return [container for _, _, container in sorted(heap, reverse=True)]
+
+def _collect_text_parts(stats, elements):
+    """
+    收集非模板元素的文本
     """
+    return [stats.text(element) for element in elements if not stats.is_boilerplate(element)]
+
+def extract_content_sections(html, top_k=3):
+    """
+    提取分数最高的top_k个内容容器的文本，用于多段落/多区块的文章
+    返回按分数降序的列表，第一个元素与 extract_main_content 的结果相同；
+    注意外层容器通常包含内层容器，排名相邻的结果可能有重叠；top_k小于1时抛出ValueError
+    """
+    if top_k < 1:
+        raise ValueError(f'top_k必须至少为1，实际为{top_k}')
     soup = BeautifulSoup(html, 'html.parser')
     
-    # 移除script、style等标签
-    for tag in soup.find_all(['script', 'style', 'iframe', 'noscript']):
-        tag.decompose()
-        
-    # 移除注释
-    for comment in soup.find_all(text=lambda text: isinstance(text, Comment)):
-        comment.extract()
-        
-    # 移除明显的header和footer
-    for element in soup.find_all(is_likely_header_or_footer):
-        element.decompose()
+    # 一次遍历移除script、style等标签、注释以及明显的header和footer
+    prune_noise_and_boilerplate(soup, noise_tags=NOISE_TAGS, terms=SUSPICIOUS_TERMS)
         
-    # 找到可能的内容容器
-    potential_containers = soup.find_all(['article', 'main', 'div', 'section'])
+    # 一次遍历统计所有容器的文本长度、结构和链接信息
+    stats = ContentStats(soup)
     
-    # 计算每个容器的内容分数
-    scored_containers = []
-    for container in potential_containers:
-        if not is_boilerplate_content(container):
-            score = calculate_content_score(container)
-            scored_containers.append((container, score))
-            
-    # 按分数排序
-    scored_containers.sort(key=lambda x: x[1], reverse=True)
+    # 只保留分数最高的top_k个容器，不对全部容器排序
+    top_containers = select_top_containers(stats, top_k)
     
-    # 如果找到了内容容器，返回分数最高的容器的文本
-    if scored_containers:
-        main_content = scored_containers[0][0]
-        
-        # 清理内容
-        for element in main_content.find_all(is_likely_header_or_footer):
-            element.decompose()
-            
-        # 提取并清理文本
-        text_parts = []
-        for element in main_content.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            text = element.get_text(strip=True)
-            if text and not is_boilerplate_content(element):
-                text_parts.append(text)
-                
-        return '\n\n'.join(text_parts)
+    # 剪枝时已用同样的规则删除了所有header/footer，容器内无需再清理，stats也保持有效
+    sections = []
+    for container in top_containers:
+        text_parts = _collect_text_parts(stats, container.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']))
+        sections.append('\n\n'.join(text_parts))
     
     # 如果没有找到合适的容器，返回body中的所有段落文本
-    text_parts = []
-    for p in soup.find_all('p'):
-        text = p.get_text(strip=True)
-        if text and not is_boilerplate_content(p):
-            text_parts.append(text)
-            
-    return '\n\n'.join(text_parts)
+    if not sections:
+        sections.append('\n\n'.join(_collect_text_parts(stats, soup.find_all('p'))))
+        
+    return sections
+
+def extract_main_content(html):
+    """
+    提取HTML中的主要文本内容
+    """
+    return extract_content_sections(html, top_k=1)[0]
 
 def clean_extracted_text(text):
     """
@@ -1,13 +1,6 @@
-from openai import OpenAI
 from bs4 import BeautifulSoup
 import re
 
-client = OpenAI(
-    # base_url="https://blankxyz-exqauoou6xw1.gear-c1.openbayes.net/v1/", 
-    base_url="http://172.17.141.17:11431/v1/", 
-    api_key="sk-xxxxxxxxxxxxxxxxxxxx"
-)
-
 guided_json_format = {
     "type": "object",
     "properties": {
@@ -2567,32 +2560,41 @@ your task is extract title.
 """
 
 
-response = client.chat.completions.create(
-    model="reader-lm-1.5q",
-    messages=[
-        {
-            "role": "system", 
-            "content": system_prompt
+if __name__ == '__main__':
+    # 导入本模块（只用 clean_html）时不加载openai、不创建客户端
+    from openai import OpenAI
+
+    client = OpenAI(
+        # base_url="https://blankxyz-exqauoou6xw1.gear-c1.openbayes.net/v1/", 
+        base_url="http://172.17.141.17:11431/v1/", 
+        api_key="sk-xxxxxxxxxxxxxxxxxxxx"
+    )
+    response = client.chat.completions.create(
+        model="reader-lm-1.5q",
+        messages=[
+            {
+                "role": "system", 
+                "content": system_prompt
+            },
+            {
+                "role": "user", 
+                "content": clean_html(html_content)
+            }
+        ],
+        temperature=0,
+        top_p=0.5,
+        extra_body={
+            "repetition_penalty": 1.08,
+            "presence_penalty": 0.25,
+            "top_k":-1,
+            # "guided_json": guided_json_format
         },
-        {
-            "role": "user", 
-            "content": clean_html(html_content)
-        }
-    ],
-    temperature=0,
-    top_p=0.5,
-    extra_body={
-        "repetition_penalty": 1.08,
-        "presence_penalty": 0.25,
-        "top_k":-1,
-        # "guided_json": guided_json_format
-    },
-    # max_length=4096,
-)
-import json
-# rs = json.loads(response.choices[0].message.content)
-print(response.choices[0].message.content)
-tag = response.choices[0].message.content
+        # max_length=4096,
+    )
+    import json
+    # rs = json.loads(response.choices[0].message.content)
+    print(response.choices[0].message.content)
+    tag = response.choices[0].message.content
 # import bs4
 # # 创建 BS4 对象
 # soup = bs4.BeautifulSoup(html_content,  'html.parser')
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import numpy as np
+from typing import Dict, List, Tuple
+
+from block_features import ANALYSIS_FEATURE_NAMES, featurize_analysis
+
+# 模型文件路径，设置后 print_analysis 用模型代替 if 规则判断正文块
+MODEL_PATH_ENV = 'BLOCK_MODEL_PATH'
+
+# XPathHTMLAnalyzer._get_element_role 可能返回的角色
+ROLES = ('页头', '导航', '主要内容', '文章', '区块', '侧边栏', '页脚', '头部', '普通元素')
+# 单独编码的标签，其余归为 other
+TAGS = ('div', 'p', 'ul', 'li', 'table', 'span', 'a', 'section', 'article', 'h1', 'h2', 'h3', 'form', 'img')
+
+
+def _digit_ratio(text: str) -> float:
+    """数字所占比例，热线电话、日期之类的块数字很多"""
+    if not text:
+        return 0.0
+    return sum(ch.isdigit() for ch in text) / len(text)
+
+
+def build_feature_matrix(results: Dict) -> Tuple[List[Dict], np.ndarray]:
+    """
+    在 featurize_analysis 的数值特征基础上追加：长度的对数、数字比例、角色和标签的one-hot
+    """
+    elements, numeric = featurize_analysis(results)
+    n = len(elements)
+    logs = np.log1p(numeric[:, [0, 1, 4]])
+    digits = np.array([[_digit_ratio((e.get('text_analysis') or {}).get('text_content', ''))] for e in elements],
+                      dtype=np.float64).reshape(n, 1)
+    roles = np.zeros((n, len(ROLES)), dtype=np.float64)
+    tags = np.zeros((n, len(TAGS) + 1), dtype=np.float64)
+    for i, elem in enumerate(elements):
+        role = elem.get('role')
+        if role in ROLES:
+            roles[i, ROLES.index(role)] = 1
+        tag = elem.get('tag')
+        tags[i, TAGS.index(tag) if tag in TAGS else len(TAGS)] = 1
+    return elements, np.hstack([numeric, logs, digits, roles, tags])
+
+
+def feature_names() -> List[str]:
+    return (list(ANALYSIS_FEATURE_NAMES)
+            + ['log_text_length', 'log_link_text_length', 'log_word_counts_without_lnks', 'digit_ratio']
+            + [f'role={r}' for r in ROLES] + [f'tag={t}' for t in TAGS] + ['tag=other'])
+
+
+class BlockClassifier:
+    """正文块二分类：标准化后的逻辑回归，纯NumPy实现，一个页面的所有块一次向量化推理"""
+
+    def __init__(self, weights=None, bias=0.0, mean=None, std=None, threshold=0.5):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+        self.threshold = threshold
+
+    def fit(self, features: np.ndarray, labels: np.ndarray, epochs: int = 500,
+            learning_rate: float = 0.1, l2: float = 1e-3) -> 'BlockClassifier':
+        """批量梯度下降；正负样本按数量加权，正文块通常远少于其它块"""
+        labels = labels.astype(np.float64)
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0)
+        self.std[self.std == 0] = 1.0
+        x = (features - self.mean) / self.std
+        positives = max(labels.sum(), 1.0)
+        negatives = max(len(labels) - labels.sum(), 1.0)
+        sample_weight = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+
+        self.weights = np.zeros(x.shape[1])
+        self.bias = 0.0
+        for _ in range(epochs):
+            error = (self._sigmoid(x @ self.weights + self.bias) - labels) * sample_weight
+            self.weights -= learning_rate * (x.T @ error / len(labels) + l2 * self.weights)
+            self.bias -= learning_rate * error.mean()
+        return self
+
+    @staticmethod
+    def _sigmoid(z: np.ndarray) -> np.ndarray:
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        if not len(features):
+            return np.zeros(0)
+        return self._sigmoid(((features - self.mean) / self.std) @ self.weights + self.bias)
+
+    def classify_analysis(self, results: Dict) -> Tuple[List[Dict], np.ndarray]:
+        """对 analyze_structure 的全部元素一次推理，返回 (元素列表, 是否正文的布尔数组)"""
+        elements, features = build_feature_matrix(results)
+        return elements, self.predict_proba(features) >= self.threshold
+
+    def save(self, path: str) -> None:
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 threshold=self.threshold, feature_names=np.array(feature_names()))
+
+    @classmethod
+    def load(cls, path: str) -> 'BlockClassifier':
+        data = np.load(path)
+        if list(data['feature_names']) != feature_names():
+            raise ValueError(f"模型特征与当前代码不一致，请重新训练: {path}")
+        return cls(data['weights'], float(data['bias']), data['mean'], data['std'], float(data['threshold']))
+
+
+_default_classifier = None
+
+
+def get_block_classifier():
+    """按环境变量 BLOCK_MODEL_PATH 加载模型（只加载一次），未配置时返回None"""
+    global _default_classifier
+    path = os.environ.get(MODEL_PATH_ENV)
+    if not path:
+        return None
+    if _default_classifier is None:
+        _default_classifier = BlockClassifier.load(path)
+    return _default_classifier
+
+
+def load_labeled_pages(path: str):
+    """
+    读取标注数据，每行一个JSON：{"html": 页面源码, "content_xpaths": [正文块的xpath, ...]}
+    xpath 使用 analyze_structure 输出中的写法
+    """
+    with open(path, encoding='utf8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def precision_recall(predicted: np.ndarray, labels: np.ndarray) -> Tuple[float, float]:
+    """正文块的精确率和召回率；没有预测为正文或没有正文块时对应值记为0"""
+    true_positives = float((predicted & labels).sum())
+    predicted_count, label_count = float(predicted.sum()), float(labels.sum())
+    return (true_positives / predicted_count if predicted_count else 0.0,
+            true_positives / label_count if label_count else 0.0)
+
+
+def train(labels_path: str, model_path: str, epochs: int = 500,
+          holdout: float = 0.2, seed: int = 1) -> BlockClassifier:
+    """
+    用标注页面训练模型并保存
+    按页面随机留出 holdout 比例不参与训练，在留出页面上对比模型和 print_analysis 原有if规则的精确率/召回率，
+    模型不优于规则时不应设置 BLOCK_MODEL_PATH
+    """
+    from html_break_down_from_DB import XPathHTMLAnalyzer, classify_by_rules
+
+    if not 0 < holdout < 1:
+        raise ValueError(f"holdout 必须在0和1之间: {holdout}")
+    analyzer = XPathHTMLAnalyzer()
+    pages = []
+    for page in load_labeled_pages(labels_path):
+        results = analyzer.analyze_structure(page['html'])
+        if 'error' in results:
+            continue
+        elements, features = build_feature_matrix(results)
+        content_xpaths = set(page.get('content_xpaths', []))
+        rule_xpaths = set(classify_by_rules(results)[1])
+        pages.append((features,
+                      np.array([elem.get('xpath') in content_xpaths for elem in elements], dtype=bool),
+                      np.array([elem.get('xpath') in rule_xpaths for elem in elements], dtype=bool)))
+    if len(pages) < 2:
+        raise ValueError(f"可用的标注页面不足两个，无法留出验证集: {labels_path}")
+
+    # 同一页面的块高度相关，按页面而不是按块划分
+    order = np.random.RandomState(seed).permutation(len(pages))
+    held_out = max(1, min(len(pages) - 1, int(round(len(pages) * holdout))))
+    train_pages = [pages[i] for i in order[held_out:]]
+    test_pages = [pages[i] for i in order[:held_out]]
+
+    features = np.vstack([p[0] for p in train_pages])
+    labels = np.concatenate([p[1] for p in train_pages])
+    classifier = BlockClassifier().fit(features, labels, epochs=epochs)
+    print(f"训练完成: {len(train_pages)} 个页面 {len(labels)} 个块, 正文块 {int(labels.sum())} 个")
+
+    test_labels = np.concatenate([p[1] for p in test_pages])
+    model_predicted = classifier.predict_proba(np.vstack([p[0] for p in test_pages])) >= classifier.threshold
+    rule_predicted = np.concatenate([p[2] for p in test_pages])
+    print(f"留出验证: {len(test_pages)} 个页面 {len(test_labels)} 个块, 正文块 {int(test_labels.sum())} 个")
+    for name, predicted in (('模型', model_predicted), ('if规则', rule_predicted)):
+        precision, recall = precision_recall(predicted, test_labels)
+        print(f"  {name}: 精确率 {precision:.3f}, 召回率 {recall:.3f}")
+    classifier.save(model_path)
+    return classifier
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='正文块分类模型')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='用标注页面训练模型')
+    train_parser.add_argument('--labels', required=True, help='标注数据 JSONL')
+    train_parser.add_argument('--model', default='block_model.npz', help='模型输出路径')
+    train_parser.add_argument('--epochs', type=int, default=500)
+    train_parser.add_argument('--holdout', type=float, default=0.2, help='按页面留出、只用于验证的比例')
+    train_parser.add_argument('--seed', type=int, default=1, help='划分留出页面的随机种子')
+    predict_parser = subparsers.add_parser('predict', help='输出页面中被判为正文的块')
+    predict_parser.add_argument('--model', default='block_model.npz')
+    predict_parser.add_argument('html_file')
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train(args.labels, args.model, args.epochs, args.holdout, args.seed)
+    else:
+        from html_break_down_from_DB import XPathHTMLAnalyzer
+
+        with open(args.html_file, encoding='utf8') as f:
+            results = XPathHTMLAnalyzer().analyze_structure(f.read())
+        elements, is_content = BlockClassifier.load(args.model).classify_analysis(results)
+        for elem, flag in zip(elements, is_content):
+            if flag:
+                print(elem['xpath'], elem['text_analysis']['text_content'][:80])
@@ -0,0 +1,222 @@
+import os
+import sys
+
+import numpy as np
+from bs4 import BeautifulSoup, Tag
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 文本遍历和关键词与仓库根目录下的提取器共用，训练和线上的特征不会不一致；
+# 仓库根目录插在搜索路径最前面，不会导入到已安装的同名模块
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+from content_rules import SUSPICIOUS_TERMS
+from text_cache import NodeTextCache
+
+# 候选内容块的标签
+BLOCK_TAGS = frozenset({'article', 'main', 'div', 'section'})
+HEADING_TAGS = frozenset({'h1', 'h2', 'h3', 'h4', 'h5', 'h6'})
+
+# 特征矩阵的列，顺序固定，学习型打分器按列号取特征
+FEATURE_NAMES = (
+    'text_length',        # len(get_text(strip=True))
+    'link_text_length',   # 所有后代<a>的文本长度之和
+    'link_count',         # 后代<a>数量
+    'link_density',       # link_text_length / text_length
+    'p_count',            # 后代<p>数量
+    'h_count',            # 后代<h1>~<h6>数量
+    'tag_count',          # 后代标签数量，即 len(find_all())
+    'text_density',       # 同 extractor2.get_text_density
+    'depth',              # 距离根节点的层数
+    'class_term_hits',    # class/id 命中的header/footer关键词个数
+)
+COLUMN = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+BlockScorer = Callable[[np.ndarray], np.ndarray]
+
+
+class BlockStats(NodeTextCache):
+    """
+    在 NodeTextCache 的同一次遍历中，后序汇总每个标签的p/h/a数量、链接文本长度、后代标签数，
+    先序记录深度；文本长度取自缓存的起止位置，与 get_text(strip=True) 一致
+    """
+
+    def __init__(self, root, block_tags=BLOCK_TAGS):
+        super().__init__(root)
+        self.block_tags = block_tags
+        self.blocks = []
+        self._ensure()
+
+    def _on_build_start(self):
+        self.blocks = []
+
+    def _new_entry(self, node, pos):
+        if node is self.root:
+            depth = 0
+        else:
+            depth = self._entries[id(node.parent)][7] + 1
+            if node.name in self.block_tags:
+                self.blocks.append(node)
+        # [start, end, p数, h数, a数, 链接文本长度, 后代标签数, 深度]
+        return [pos, pos, 0, 0, 0, 0, 0, depth]
+
+    def _leave(self, node, entry):
+        for child in node.contents:
+            if not isinstance(child, Tag):
+                continue
+            child_entry = self._entries[id(child)]
+            entry[2] += child_entry[2] + (child.name == 'p')
+            entry[3] += child_entry[3] + (child.name in HEADING_TAGS)
+            entry[4] += child_entry[4] + (child.name == 'a')
+            entry[5] += child_entry[5] + (child_entry[1] - child_entry[0] if child.name == 'a' else 0)
+            entry[6] += child_entry[6] + 1
+
+
+class BlockFeaturizer:
+    """把页面中的候选内容块展开成特征矩阵（每行一个块，每列一个特征），供向量化打分"""
+
+    def __init__(self, block_tags=BLOCK_TAGS, terms=SUSPICIOUS_TERMS):
+        self.block_tags = frozenset(block_tags)
+        self.terms = tuple(terms)
+
+    def _class_term_hits(self, element: Tag) -> int:
+        classes = element.get('class') or ''
+        if not isinstance(classes, str):
+            classes = ' '.join(classes)
+        haystack = f"{classes} {element.get('id', '') or ''}".lower()
+        return sum(term in haystack for term in self.terms)
+
+    def featurize_soup(self, root) -> Tuple[List[Tag], np.ndarray]:
+        """用 BlockStats 一次遍历计算所有候选块的特征，返回 (块列表, 特征矩阵)，块按文档顺序排列"""
+        stats = BlockStats(root, self.block_tags)
+        blocks = stats.blocks
+        raw = np.array(
+            [stats.entry(block) for block in blocks] or np.zeros((0, 8)), dtype=np.float64
+        ).reshape(-1, 8)
+        features = np.zeros((len(blocks), len(FEATURE_NAMES)), dtype=np.float64)
+        text_length = raw[:, 1] - raw[:, 0]
+        features[:, COLUMN['text_length']] = text_length
+        features[:, COLUMN['link_text_length']] = raw[:, 5]
+        features[:, COLUMN['link_count']] = raw[:, 4]
+        features[:, COLUMN['link_density']] = np.divide(
+            raw[:, 5], text_length, out=np.zeros_like(text_length), where=text_length > 0
+        )
+        features[:, COLUMN['p_count']] = raw[:, 2]
+        features[:, COLUMN['h_count']] = raw[:, 3]
+        features[:, COLUMN['tag_count']] = raw[:, 6]
+        features[:, COLUMN['text_density']] = np.where(
+            raw[:, 6] == 0, text_length, text_length / (raw[:, 6] + 1)
+        )
+        features[:, COLUMN['depth']] = raw[:, 7]
+        features[:, COLUMN['class_term_hits']] = [self._class_term_hits(block) for block in blocks]
+        return blocks, features
+
+    def featurize_html(self, html_content: str) -> Tuple[List[Tag], np.ndarray]:
+        soup = BeautifulSoup(html_content, 'html.parser')
+        return self.featurize_soup(soup)
+
+    def featurize_batch(self, pages: Iterable[str]) -> Tuple[List[List[Tag]], np.ndarray, np.ndarray]:
+        """
+        把多个页面的候选块拼成一个矩阵
+        返回 (每页的块列表, 特征矩阵, 每行所属页面的下标)
+        """
+        page_blocks = []
+        matrices = []
+        page_index = []
+        for i, html_content in enumerate(pages):
+            blocks, features = self.featurize_html(html_content)
+            page_blocks.append(blocks)
+            matrices.append(features)
+            page_index.append(np.full(len(blocks), i, dtype=np.int64))
+        if not matrices:
+            return [], np.zeros((0, len(FEATURE_NAMES))), np.zeros(0, dtype=np.int64)
+        return page_blocks, np.vstack(matrices), np.concatenate(page_index)
+
+
+def score_blocks(features: np.ndarray) -> np.ndarray:
+    """
+    向量化的 html_content_extractor.calculate_content_score：
+    长度 + p数*50 + h数*30，无文本或链接密度>0.5的块记0分
+    """
+    text_length = features[:, COLUMN['text_length']]
+    score = text_length + features[:, COLUMN['p_count']] * 50 + features[:, COLUMN['h_count']] * 30
+    high_link_density = (features[:, COLUMN['link_count']] > 0) & (features[:, COLUMN['link_density']] > 0.5)
+    return np.where((text_length == 0) | high_link_density, 0, score)
+
+
+def threshold_blocks(features: np.ndarray, min_length: int = 100, min_density: float = 5) -> np.ndarray:
+    """extractor2 中候选容器的筛选条件：文本长度>min_length 且文本密度>min_density"""
+    return (features[:, COLUMN['text_length']] > min_length) & (features[:, COLUMN['text_density']] > min_density)
+
+
+def best_block_per_page(scores: np.ndarray, page_index: np.ndarray, page_count: int) -> np.ndarray:
+    """
+    返回每个页面得分最高的块在矩阵中的行号，没有候选块的页面为-1
+    同分时取文档中靠前的块，与稳定降序排序后取第一个一致
+    """
+    best = np.full(page_count, -1, dtype=np.int64)
+    if not len(scores):
+        return best
+    # 按 (页面, -分数, 行号) 排序后每页的第一行就是最佳块
+    order = np.lexsort((np.arange(len(scores)), -scores, page_index))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = page_index[order][1:] != page_index[order][:-1]
+    best[page_index[order][first]] = order[first]
+    return best
+
+
+def score_pages(pages: Iterable[str], scorer: BlockScorer = score_blocks,
+                featurizer: BlockFeaturizer = None) -> List[Dict]:
+    """
+    批量打分：所有页面的块一次性交给 scorer，scorer 可以替换成学习型模型
+    返回每个页面的最佳块及其分数
+    """
+    featurizer = featurizer or BlockFeaturizer()
+    page_blocks, features, page_index = featurizer.featurize_batch(pages)
+    scores = np.asarray(scorer(features), dtype=np.float64)
+    best = best_block_per_page(scores, page_index, len(page_blocks))
+    results = []
+    for i, row in enumerate(best):
+        if row < 0:
+            results.append({'block': None, 'score': 0.0})
+            continue
+        offset = int(row) - int(np.searchsorted(page_index, i))
+        results.append({'block': page_blocks[i][offset], 'score': float(scores[row])})
+    return results
+
+
+# XPathHTMLAnalyzer.analyze_structure 输出的元素特征
+ANALYSIS_FEATURE_NAMES = (
+    'text_length',               # text_analysis.text_length
+    'link_text_length',          # 链接文字数 = text_length - word_counts_without_lnks
+    'link_count',                # text_analysis.link_count
+    'link_ratio',                # link_text_length / text_length
+    'word_counts_without_lnks',  # 去掉链接后的文字数
+    'level',                     # 1=body的子元素，2=孙元素
+    'xpath_depth',               # xpath 的层数
+)
+
+
+def featurize_analysis(results: Dict) -> Tuple[List[Dict], np.ndarray]:
+    """
+    把 analyze_structure 的 first_level/second_level 元素展开成特征矩阵
+    返回 (元素列表, 特征矩阵)，元素顺序为先第一层后第二层
+    """
+    elements = list(results.get('first_level', [])) + list(results.get('second_level', []))
+    levels = [1] * len(results.get('first_level', [])) + [2] * len(results.get('second_level', []))
+    features = np.zeros((len(elements), len(ANALYSIS_FEATURE_NAMES)), dtype=np.float64)
+    if not elements:
+        return elements, features
+    analysis = [elem.get('text_analysis') or {} for elem in elements]
+    text_length = np.array([a.get('text_length', 0) for a in analysis], dtype=np.float64)
+    without_links = np.array([a.get('word_counts_without_lnks', 0) for a in analysis], dtype=np.float64)
+    link_text_length = text_length - without_links
+    features[:, 0] = text_length
+    features[:, 1] = link_text_length
+    features[:, 2] = [a.get('link_count', 0) for a in analysis]
+    features[:, 3] = np.divide(link_text_length, text_length,
+                               out=np.zeros_like(text_length), where=text_length > 0)
+    features[:, 4] = without_links
+    features[:, 5] = levels
+    features[:, 6] = [len([part for part in (elem.get('xpath') or '').split('/') if part]) for elem in elements]
+    return elements, features
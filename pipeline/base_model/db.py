@@ -0,0 +1,129 @@
+"""
+MySQL存储后端：读取和写回结果共用一个aiomysql连接池
+
+- acquire(): 从池中取连接，记录等待时间，用于观察池是否过小
+- stream(): 服务端游标分批读取，不把整张表一次读进内存
+- ResultWriter: 缓冲结果，攒够 batch_size 条或每隔 flush_interval 秒用 executemany 批量upsert
+"""
+import os
+
+import aiomysql
+
+import incremental
+from storage import DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL, BufferedResultWriter, StorageBackend
+
+MYSQL_CONFIG = {
+    'host': os.environ.get('MYSQL_HOST', '60.205.251.23'),
+    'port': int(os.environ.get('MYSQL_PORT', 3306)),
+    'user': os.environ.get('MYSQL_USER', 'pom'),
+    'password': os.environ.get('MYSQL_PASSWORD', 'Bohui#123'),
+    'db': os.environ.get('MYSQL_DB', 'spider_test'),
+    'charset': 'utf8mb4',
+}
+
+POOL_MINSIZE = int(os.environ.get('MYSQL_POOL_MINSIZE', 2))
+POOL_MAXSIZE = int(os.environ.get('MYSQL_POOL_MAXSIZE', 10))
+
+RESULT_TABLE = 'spider_test.extract_results'
+# 转成binary后驱动不再按连接字符集解码，返回列中存储的原始字节
+RAW_FIELDS = ('id', 'cast(result_text as binary) as result_text')
+
+
+async def connect():
+    """单个连接，供一次性脚本使用"""
+    return await aiomysql.connect(cursorclass=aiomysql.DictCursor, **MYSQL_CONFIG)
+
+
+class Database(StorageBackend):
+    """aiomysql连接池的封装"""
+
+    dialect = 'mysql'
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    @classmethod
+    async def create(cls, minsize: int = POOL_MINSIZE, maxsize: int = POOL_MAXSIZE, **config) -> 'Database':
+        # 读写共用连接池：不开autocommit时一次读取会在连接上留下未结束的事务，
+        # 归还后下一个使用者（如读取水位）看到的还是那次事务开始时的快照；写入各自显式commit
+        pool = await aiomysql.create_pool(
+            minsize=minsize, maxsize=maxsize, cursorclass=aiomysql.DictCursor, autocommit=True,
+            **dict(MYSQL_CONFIG, **config)
+        )
+        return cls(pool)
+
+    async def _acquire(self):
+        return await self.pool.acquire()
+
+    async def _release(self, conn):
+        await self.pool.release(conn)
+
+    def build_query(self, column='id', since=None, ids=(), shard=0, shards=1, raw=False):
+        fields = RAW_FIELDS if raw else ('id', 'result_text')
+        return incremental.build_query(column, since, ids, fields=fields, shard=shard, shards=shards)
+
+    async def stream(self, sql: str, params=None, batch_size: int = 100):
+        async with self.acquire() as conn:
+            async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+                await cursor.execute(sql, params)
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield list(rows)
+
+    async def load_watermark(self, job: str, column: str):
+        async with self.acquire() as conn:
+            return await incremental.load_watermark(conn, job, column)
+
+    async def save_watermark(self, job: str, column: str, watermark) -> None:
+        async with self.acquire() as conn:
+            await incremental.save_watermark(conn, job, column, watermark)
+
+    async def load_failures(self, job: str):
+        async with self.acquire() as conn:
+            return await incremental.load_failures(conn, job)
+
+    async def save_failures(self, job: str, attempts, cleared) -> None:
+        async with self.acquire() as conn:
+            await incremental.save_failures(conn, job, attempts, cleared)
+
+    def result_writer(self, batch_size: int = DEFAULT_BATCH_SIZE,
+                      flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> 'ResultWriter':
+        return ResultWriter(self, batch_size=batch_size, flush_interval=flush_interval)
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
+
+
+class ResultWriter(BufferedResultWriter):
+    """用一条多行 insert ... on duplicate key update 把结果写回 extract_results"""
+
+    def __init__(self, db: Database, table: str = RESULT_TABLE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        super().__init__(db, batch_size, flush_interval)
+        self.table = table
+
+    async def _create_table(self):
+        async with self.backend.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f'''
+                    create table if not exists {self.table} (
+                        id bigint not null primary key,
+                        result json not null,
+                        updated_at timestamp not null default current_timestamp on update current_timestamp
+                    )
+                ''')
+            await conn.commit()
+
+    async def _write_rows(self, rows):
+        async with self.backend.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(
+                    f'insert into {self.table} (id, result) values (%s, %s) '
+                    f'on duplicate key update result = values(result)',
+                    rows
+                )
+            await conn.commit()
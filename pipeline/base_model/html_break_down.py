@@ -5,8 +5,8 @@ from collections import defaultdict
 from loguru import logger
 from lxml import etree
 from collections import deque
-
-logger.add("file_{time}.log")
+import pipeline_logging
+from pipeline_logging import page_logger
 
 
 class XPathHTMLAnalyzer:
@@ -485,8 +485,9 @@ class XPathHTMLAnalyzer:
 
 
 
-def print_analysis(html_content: str) -> None:
-    """打印分析结果，包含文本、链接和视频播放器分析"""
+def print_analysis(html_content: str, page_id=None) -> None:
+    """打印分析结果，包含文本、链接和视频播放器分析；只有按 LOG_SAMPLE_RATE 抽中的页面输出报告"""
+    trace = page_logger(page_id)
     analyzer = XPathHTMLAnalyzer()
     results = analyzer.analyze_structure(html_content)
     from lxml import etree
@@ -495,13 +496,15 @@ def print_analysis(html_content: str) -> None:
     # <Element html at 0x29b7fdb6708>
     
     
-    logger.debug("\n=== HTML结构分析报告（带文本、链接和视频播放器分析） ===\n")
-    
-    logger.debug("1. 整体统计:")
-    logger.debug(f"   - 总文本长度: {results['summary']['total_text_length']} 字符")
-    logger.debug(f"   - 总链接数量: {results['summary']['total_links']} 个")
-    logger.debug(f"   - 文本/链接比例: {results['summary']['overall_text_to_link_ratio']:.2f}")
-    logger.debug(f"   - 视频播放器数量: {results['summary']['video_player_count']} 个")
+    if trace and 'error' not in results:
+        summary = results['summary']
+        trace.bind(**{k: v for k, v in summary.items() if k != 'video_players'}).debug(
+            "\n=== HTML结构分析报告（带文本、链接和视频播放器分析） ===\n"
+            "1. 整体统计:\n"
+            "   - 总文本长度: {} 字符\n   - 总链接数量: {} 个\n   - 文本/链接比例: {:.2f}\n   - 视频播放器数量: {} 个",
+            summary['total_text_length'], summary['total_links'],
+            summary['overall_text_to_link_ratio'], summary['video_player_count']
+        )
     
     # if results['summary']['video_players']:
     #     logger.debug("\n   检测到的视频播放器:")
@@ -510,15 +513,10 @@ def print_analysis(html_content: str) -> None:
     #         logger.debug(f"       XPath: {player['xpath']}")
     #         if player['source_type']:
     #             logger.debug(f"       来源类型: {player['source_type']}")
-    if results['video_links']:
-        logger.debug("\n   检测到的视频链接:")
-        for link in results['video_links']:
-            logger.debug(f"     * 链接: {link}")
-            # logger.debug(f"       XPath: {link['xpath']}")
-            # logger.debug(f"       来源类型: {link['source_type']}")
+    if trace and results['video_links']:
+        trace.debug("检测到的视频链接: {}", results['video_links'])
             
     
-    logger.debug("\n2. 第一层元素:=====================================================")
     # ret = selector.xpath('/html/body')     # 返回为一列表
     tag_level1 = {'tags_xpath':deque(), 'contents_xpath':deque()}
     for i, elem in enumerate(results['first_level'], 1):
@@ -533,33 +531,24 @@ def print_analysis(html_content: str) -> None:
                 if len(elem['xpath'])>1:
                     tag_level1['contents_xpath'].append(elem['xpath'])
                 
-        logger.debug(f"\n   元素 {i}:")
-        logger.debug(f"   - XPath: {elem['xpath']}")
-        logger.debug(f"   - 标签: {elem['tag']}")
-        logger.debug(f"   - 角色: {elem['role']}")
-        logger.debug(f"   - 文本: {elem['text_analysis']['text_content']} ")
-        logger.debug(f"   - 纯文本字数: {elem['text_analysis']['word_counts_without_lnks']} ")
-        logger.debug(f"   - 链接数量: {elem['text_analysis']['link_count']} 个")
-        logger.debug(f"   - 文本/链接比例: {elem['text_analysis']['text_to_link_ratio']:.2f}")
-        # element = html.xpath(elem['xpath'])
-
-        
-        # logger.debug(len(element))
-        # logger.debug(ret[0].xpath(elem['xpath'])[0])
-        
+        if not trace:
+            continue
+        # 第一层元素的结构化记录，字段在 extra 中，LOG_JSON=1 时可直接检索
+        text_analysis = elem['text_analysis']
+        trace.bind(depth=1, xpath=elem['xpath'], tag=elem['tag'], role=elem['role'],
+                   words=text_analysis['word_counts_without_lnks'], links=text_analysis['link_count']).debug(
+            "第一层元素 {}: {} {} 文本/链接比例 {:.2f} 文本: {}",
+            i, elem['xpath'], elem['role'], text_analysis['text_to_link_ratio'], text_analysis['text_content']
+        )
         if elem['video_player']['is_player']:
-            logger.debug(f"   - 视频播放器: {elem['video_player']['player_type']}")
-            if elem['video_player']['details']:
-                logger.debug("     详情:")
-                for k, v in elem['video_player']['details'].items():
-                    logger.debug(f"     * {k}: {v}")
+            trace.debug("   - 视频播放器: {} 详情: {}", elem['video_player']['player_type'],
+                        elem['video_player']['details'])
         
         # if elem['text_analysis']['links']:
         #     logger.debug("   - 链接列表:")
         #     for link in elem['text_analysis']['links']:
         #         logger.debug(f"     * {link['text']} ({link['href']})")
     
-    logger.debug("\n3. 第二层元素:#########################################################")
     
     # tag_level1['contents_xpath'].discard('')
     # tag_level1['tags_xpath'].discard()
@@ -591,8 +580,7 @@ def print_analysis(html_content: str) -> None:
         if index is None:
             continue
 
-        if elem['text_analysis']['word_counts_without_lnks'] > 10:
-            logger.debug(f"\n ☆☆ 内容元素 ☆☆")
+        if trace and elem['text_analysis']['word_counts_without_lnks'] > 10:
             
             # 使用XPath提取当前元素的所有文本节点，排除<a>标签内的文本
             try:
@@ -607,8 +595,9 @@ def print_analysis(html_content: str) -> None:
                         texts.append(text)
                 
                 pure_text = ' '.join(texts)
-                logger.debug(f"   - XPath: {elem['xpath']}")
-                logger.debug(f"   - 文本内容: {pure_text}")
+                trace.bind(depth=2, xpath=elem['xpath']).debug(
+                    " ☆☆ 内容元素 ☆☆\n   - XPath: {}\n   - 文本内容: {}", elem['xpath'], pure_text
+                )
                 
                 # 如果需要，也可以单独列出链接
                 # links = element.xpath('.//a')
@@ -618,10 +607,9 @@ def print_analysis(html_content: str) -> None:
                     # logger.debug(f"   - 排除的链接文本: {link_text} (XPath: {link_xpath})")
                     
             except Exception as e:
-                logger.error(f"XPath提取失败: {e}")
+                logger.error("XPath提取失败: {}", e)
                 continue
                 
-    logger.debug("\n=== L结构分析报告 (结论)===\n")
     # for i, elem in enumerate(results['first_level'], 1):
         # if elem['role'] == 'header':
     
@@ -1577,4 +1565,6 @@ html {font-size: calc(100vw / 18.75);}
 
     """
     
+    # 示例脚本输出完整的调试报告
+    pipeline_logging.configure(level='DEBUG', sample_rate=1)
     print_analysis(sample_html)
\ No newline at end of file
@@ -3,11 +3,21 @@ from bs4 import BeautifulSoup, Tag
 from typing import Dict, List, Tuple
 from collections import defaultdict
 from loguru import logger
+import argparse
 import asyncio
-import aiomysql
+import functools
 import json
-
-logger.add("file_{time}.log")
+from block_classifier import get_block_classifier
+from site_template import extract_video_links, get_template_store, site_host
+from near_duplicate import get_dedup_stage
+from result_cache import get_result_cache
+from incremental import WatermarkTracker, add_arguments, prepare_query
+import storage
+import metrics
+import page_decoding
+import profiler
+import pipeline_logging
+from pipeline_logging import page_logger
 
 class XPathHTMLAnalyzer:
     """分析HTML中body下两层深度的元素结构，生成XPath，分析链接和文本比例，以及检测视频播放器"""
@@ -331,17 +341,20 @@ class XPathHTMLAnalyzer:
 
     def analyze_structure(self, html_content: str) -> Dict:
         """分析HTML结构并返回带XPath的结果，包含文本、链接和视频播放器分析"""
-        html_content = self.clean_html(html_content)
-        soup = BeautifulSoup(html_content, 'html.parser')
+        with metrics.timed('clean'):
+            html_content = self.clean_html(html_content)
+        with metrics.timed('parse'):
+            soup = BeautifulSoup(html_content, 'html.parser')
         body = soup.find('body')
         
         if not body:
             return {"error": "No body tag found"}
         
         # video_links = None
-        first_level = self._analyze_first_level(body)
-        second_level = self._analyze_second_level(body)
-        video_links = self.get_video_links(body)
+        with metrics.timed('analyze'):
+            first_level = self._analyze_first_level(body)
+            second_level = self._analyze_second_level(body)
+            video_links = self.get_video_links(body)
 
         return {
             "first_level": first_level,
@@ -464,40 +477,37 @@ class XPathHTMLAnalyzer:
         }
 
 
-async def print_analysis(data: str) :
-    html_content = data['result_text']
-    """打印分析结果，包含文本、链接和视频播放器分析"""
-    analyzer = XPathHTMLAnalyzer()
-    results = analyzer.analyze_structure(html_content)
-    from lxml import etree
-
-    selector=etree.HTML(html_content)   # 将源码转化为能被XPath匹配的格式
-    # <Element html at 0x29b7fdb6708>
-    
-    final_report = {
-        'videos': set(),
-        'links': set(),
-        'contents': set()
-    }
-    
-    logger.debug(f"\n=== {data['id']}     HTML结构分析报告（带文本、链接和视频播放器分析） ===\n")
-    
-    logger.debug("1. 整体统计:")
-    logger.debug(f"   - 总文本长度: {results['summary']['total_text_length']} 字符")
-    logger.debug(f"   - 总链接数量: {results['summary']['total_links']} 个")
-    logger.debug(f"   - 文本/链接比例: {results['summary']['overall_text_to_link_ratio']:.2f}")
-    logger.debug(f"   - 视频播放器数量: {results['summary']['video_player_count']} 个")
-    
-    if results['video_links']:
-        logger.debug("\n   检测到的视频链接:")
-        # final_report['videos'] = results['video_links']
-        for link in results['video_links']:
-            final_report['videos'].add(link)
-            logger.debug(f"     * 链接: {link}")
-
-    
-    logger.debug("\n2. 第一层元素:")
-    ret = selector.xpath('/html/body')     # 返回为一列表
+def extract_pure_text(selector, xpath: str, trace=None) -> str:
+    """使用XPath提取元素的所有文本节点，排除<a>标签内的文本；trace 为抽中页面的logger"""
+    try:
+        # 获取当前元素
+        element = selector.xpath(xpath)[0]
+        
+        # 获取所有直接文本节点和非链接元素的文本
+        texts = []
+        for text in element.xpath('.//text()[not(parent::a)]'):
+            text = text.strip()
+            if text:  # 只保留非空文本
+                texts.append(text)
+        
+        pure_text = ' '.join(texts)
+        if trace:
+            trace.debug("   - XPath: {}\n   - 文本内容: {}", xpath, pure_text)
+        return pure_text
+    except Exception as e:
+        # 模板/分析得到的XPath在lxml树中找不到时每个元素都会失败，只计数，抽中的页面才记日志
+        metrics.STAGE_ERRORS.inc('xpath_extract')
+        if trace:
+            trace.warning("XPath提取失败: {} {}", xpath, e)
+        return f"XPath提取失败: {e}"
+
+
+def classify_by_rules(results):
+    """
+    原有的if规则：第一层按链接文字数区分列表块和正文块，再在其下的第二层元素中挑出链接列表和正文
+    返回 (链接列表元素的 [(序号, 元素)], 按出现顺序去重的正文块xpath)；
+    block_classifier 训练时用同一套规则做对照
+    """
     tag_level1 = {'tags_xpath':set(), 'contents_xpath':set()}
     for i, elem in enumerate(results['first_level'], 1):
         if elem['role'] in ['主要内容', '文章', '区块', '普通元素'] and elem['text_analysis']['text_length'] > 0:
@@ -507,47 +517,106 @@ async def print_analysis(data: str) :
             else: 
                 # 可能是正文元素
                 tag_level1['contents_xpath'].add(elem['xpath'])
-                
 
-    logger.debug("\n3. 第二层元素:")
+    link_elements, content_xpaths = [], {}
     for i, elem in enumerate(results['second_level'], 1):
-        # if i == 26:
-        #     logger.debug('i am here')
         for l1_path in tag_level1['tags_xpath']:
             if l1_path in elem['xpath']:
                 if len(elem['text_analysis']['links']) > 0:
-                    logger.debug(f"\n  列表 元素 {i}:")
-                    logger.debug(f"   - XPath: {elem['xpath']}")
-                    final_report['links'].add(elem['xpath'])
-                    for link in elem['text_analysis']['links']:
-                        logger.debug(f"     * {link['text']} ({link['href']})")
+                    link_elements.append((i, elem))
                     
         for l1_path in tag_level1['contents_xpath']:
             if l1_path in elem['xpath']:
                 if elem['text_analysis']['word_counts_without_lnks'] > 10:
-                    logger.debug(f"\n ☆☆ 内容元素 ☆☆")
-                    
-                    # 使用XPath提取当前元素的所有文本节点，排除<a>标签内的文本
-                    try:
-                        # 获取当前元素
-                        element = selector.xpath(elem['xpath'])[0]
-                        
-                        # 获取所有直接文本节点和非链接元素的文本
-                        texts = []
-                        for text in element.xpath('.//text()[not(parent::a)]'):
-                            text = text.strip()
-                            if text:  # 只保留非空文本
-                                texts.append(text)
-                        
-                        pure_text = ' '.join(texts)
-                        logger.debug(f"   - XPath: {elem['xpath']}")
-                        logger.debug(f"   - 文本内容: {pure_text}")
-                        final_report['contents'].add(pure_text)
-                    except Exception as e:
-                        logger.error(f"XPath提取失败: {e}")
-                        final_report['contents'].add(f"XPath提取失败: {e}")
-                        continue
-    logger.debug("\n=== L结构分析报告 (结论)===\n")
+                    content_xpaths[elem['xpath']] = None
+    return link_elements, list(content_xpaths)
+
+
+async def print_analysis(data: str, selector=None) :
+    html_content = data['result_text']
+    """打印分析结果，包含文本、链接和视频播放器分析；selector 为已经解析好的lxml树时不再解析"""
+    if selector is None:
+        with metrics.timed('parse'):
+            # 将源码转化为能被XPath匹配的格式；有原始字节时按判断出的编码直接解析字节
+            selector = page_decoding.parse_html(data)
+    # <Element html at 0x29b7fdb6708>
+
+    # 只有抽中的页面输出逐元素调试报告，其余页面不构造任何日志字符串
+    trace = page_logger(data['id'])
+
+    store = get_template_store()
+    host = site_host(html_content, data.get('url')) if store is not None else None
+    if host:
+        # 已学到模板的站点直接按模板XPath取正文，跳过完整分析
+        template_xpaths = store.apply(host, selector)
+        if template_xpaths is not None:
+            if trace:
+                trace.debug("{} 命中站点模板 {}", data['id'], host)
+            return {
+                'id': data['id'],
+                'videos': list(set(extract_video_links(selector))),
+                'contents': list({extract_pure_text(selector, xpath, trace) for xpath in template_xpaths})
+            }
+
+    analyzer = XPathHTMLAnalyzer()
+    results = analyzer.analyze_structure(html_content)
+    content_xpaths = set()
+
+    final_report = {
+        'videos': set(),
+        'links': set(),
+        'contents': set()
+    }
+    
+    if trace and 'error' not in results:
+        summary = results['summary']
+        trace.bind(**{k: v for k, v in summary.items() if k != 'video_players'}).debug(
+            "\n=== {}     HTML结构分析报告（带文本、链接和视频播放器分析） ===\n"
+            "1. 整体统计:\n"
+            "   - 总文本长度: {} 字符\n   - 总链接数量: {} 个\n   - 文本/链接比例: {:.2f}\n   - 视频播放器数量: {} 个",
+            data['id'], summary['total_text_length'], summary['total_links'],
+            summary['overall_text_to_link_ratio'], summary['video_player_count']
+        )
+    
+    if results['video_links']:
+        # final_report['videos'] = results['video_links']
+        for link in results['video_links']:
+            final_report['videos'].add(link)
+        if trace:
+            trace.debug("检测到的视频链接: {}", results['video_links'])
+
+    
+    classifier = get_block_classifier()
+    if classifier is not None and 'error' not in results:
+        # 配置了模型时，一次向量化推理判断所有块，代替下面的 if 规则
+        elements, is_content = classifier.classify_analysis(results)
+        for elem, flag in zip(elements, is_content):
+            if flag:
+                content_xpaths.add(elem['xpath'])
+                final_report['contents'].add(extract_pure_text(selector, elem['xpath'], trace))
+        if host:
+            store.observe(host, results, content_xpaths)
+        return {
+            'id': data['id'],
+            'videos': list(final_report['videos']),
+            'contents': list(final_report['contents'])
+        }
+
+    link_elements, rule_xpaths = classify_by_rules(results)
+    for i, elem in link_elements:
+        final_report['links'].add(elem['xpath'])
+        if trace:
+            # 链接列表只在日志真正输出时才拼接
+            trace.opt(lazy=True).debug(
+                "列表 元素 {}:\n   - XPath: {}\n{}", lambda: i, lambda: elem['xpath'],
+                lambda: '\n'.join(f"     * {link['text']} ({link['href']})"
+                                   for link in elem['text_analysis']['links'])
+            )
+    for xpath in rule_xpaths:
+        content_xpaths.add(xpath)
+        final_report['contents'].add(extract_pure_text(selector, xpath, trace))
+    if host and 'error' not in results:
+        store.observe(host, results, content_xpaths)
     return {
         'id': data['id'],
         'videos': list(final_report['videos']),
@@ -556,70 +625,146 @@ async def print_analysis(data: str) :
                       
     }
     
-async def process_batch(batch):
-    return await asyncio.gather(*[print_analysis(data) for data in batch])
+async def process_one(data, sinks=()):
+    # 先查完全相同页面的结果缓存，再做近重复检测，最后才真正提取
+    process = print_analysis
+    dedup = get_dedup_stage()
+    if dedup is not None:
+        process = functools.partial(dedup.run, process=print_analysis)
+    cache = get_result_cache()
+    with metrics.tracking_page('html_break_down_from_DB') as outcome, profiler.profile_page(data['id']):
+        # 读出的是字节（--raw-pages 或归档）时在这里解码一次，字节和str都留在行里
+        page_decoding.decode_row(data)
+        if cache is not None:
+            result = await cache.run(data, process, namespace='html_break_down_from_DB')
+        else:
+            result = await process(data)
+        outcome.append(result)
+    # 结果依次交给各输出（数据库写回、Parquet）
+    for sink in sinks:
+        await sink.add(result)
+    return result
+
+async def process_batch(batch, sinks=()):
+    return await asyncio.gather(*[process_one(data, sinks) for data in batch])
 async def get_mysql_connection():
-    return await aiomysql.connect(
-        host='60.205.251.23',  # Replace with your MySQL host
-        port=3306,             # Default MySQL port
-        user='pom',  # Replace with your MySQL username
-        password='Bohui#123', # Replace with your MySQL password
-        db='spider_test',
-        charset='utf8mb4',
-        cursorclass=aiomysql.DictCursor
-    )
-
-async def main(concurrency):
+    import db
+    return await db.connect()
+
+async def main(concurrency, args):
     
+    # METRICS_PORT / METRICS_FILE 配置时导出各阶段耗时
+    exporter = metrics.start_exporter()
+    if exporter:
+        logger.info(f"指标导出到 {exporter}")
+    # --profile 时按 --profile-rate 抽样剖析页面
+    page_profiler = profiler.PipelineProfiler.from_args(args)
+    if page_profiler is not None:
+        page_profiler.start()
+
+    database = writer = parquet = archive = None
     try:
-        # Connect to MySQL
-        conn = await get_mysql_connection()
-        async with conn.cursor() as cursor:
-            # Fetch data from MySQL - adjust table name as needed
-            await cursor.execute('select id, result_text from spider_test.details_test_table dtt')
-            mysql_data = await cursor.fetchall()
-    except Exception as e:
-        logger.error(f"Failed to connect to MySQL: {e}")
-        return
+        if not args.archive or args.write_results:
+            try:
+                # 读取和写回共用一个连接池，--backend 选择 MySQL 或 PostgreSQL
+                database = await storage.open_backend(args.backend)
+            except Exception as e:
+                logger.error(f"Failed to connect to {args.backend}: {e}")
+                return
+
+        try:
+            if args.write_results:
+                writer = await database.result_writer(args.batch_size, args.flush_interval).start()
+            if args.parquet:
+                # pyarrow和页面归档（numpy、zstandard）只在用到时导入，worker冷启动不必加载
+                from parquet_results import ParquetResultWriter
+                parquet = ParquetResultWriter(args.parquet)
+            sinks = [sink for sink in (writer, parquet) if sink is not None]
+
+            if args.archive:
+                # 从本地归档读取页面，同一批语料反复实验时不走网络；归档没有水位
+                from page_archive import PageArchive, stream_archive
+                archive = PageArchive(args.archive)
+                batches = metrics.timed_batches(stream_archive(archive, args, concurrency), 'archive_read')
+                job = None
+            else:
+                # 增量模式只查询水位之后的行，--ids/--since 可手动指定范围
+                sql, params, job = await prepare_query(database, args, 'html_break_down_from_DB')
+                batches = metrics.timed_batches(database.stream(sql, params, batch_size=concurrency), 'db_read')
+
+            finally_rs = []
+            # 之前运行中失败过的行带着累计失败次数，达到 --max-attempts 次的记为死信
+            attempts = await database.load_failures(job) if job else {}
+            watermarks = WatermarkTracker(args.watermark_column, attempts, args.max_attempts)
+            rows = 0
+
+            # 服务端游标边读边分批提交处理；同时处理的批数有上限，处理跟不上时暂停读取
+            process = functools.partial(process_batch, sinks=sinks)
+            async for batch, batch_result in storage.process_batches(batches, process, args.max_in_flight,
+                                                                     on_read=watermarks.read):
+                rows += len(batch)
+                # 整批抛出的异常和 print_analysis 内部捕获后返回None的页面都算失败
+                watermarks.record(batch, batch_result)
+                if isinstance(batch_result, Exception):
+                    logger.debug(f"Batch processing error: {batch_result}")
+                elif parquet is None:
+                    # 只有输出JSON时才需要在内存中保留全部结果
+                    finally_rs.extend(batch_result)
+            logger.info(f"处理了 {rows} 行")
+        finally:
+            # 处理中途出错时也要写完缓冲中的结果、写完Parquet文件并关闭归档
+            await storage.close_all(writer, parquet, archive)
+
+        if writer is not None:
+            logger.info(f"写回 {writer.written} 条结果, 共 {writer.flushes} 次批量写入")
+        if parquet is not None:
+            logger.info(f"{parquet.written} 条结果写入 {parquet.path}")
+
+        cache = get_result_cache()
+        if cache is not None:
+            logger.info(f"结果缓存命中 {cache.hits} 次, 未命中 {cache.misses} 次, 命中率 {cache.hit_ratio():.2%}")
+        dedup = get_dedup_stage()
+        if dedup is not None:
+            logger.info(f"近重复页面 {dedup.duplicates} 个, 占比 {dedup.duplicate_ratio():.2%}")
+            dedup.save()
+
+            # 将列表保存为 JSON 文件；写Parquet时不再输出JSON
+        if parquet is None:
+            with open(args.output, 'w', encoding='utf8') as f:
+                json.dump(finally_rs, f, ensure_ascii=False)
+
+        # 水位只推进到第一个失败行之前，失败的行及其之后的行下次运行会重新处理
+        watermark = watermarks.watermark
+        if job and watermarks.failed:
+            logger.warning(f"有页面处理失败，水位停在第一个失败行之前: {args.watermark_column}={watermark}")
+        if job and watermark is not None:
+            await database.save_watermark(job, args.watermark_column, watermark)
+            logger.info(f"水位推进到 {args.watermark_column}={watermark}")
+        if job and (watermarks.updated or watermarks.cleared):
+            await database.save_failures(job, watermarks.updated, watermarks.cleared)
+        if job and watermarks.dead_letters:
+            logger.warning(f"{len(watermarks.dead_letters)} 行累计失败 {args.max_attempts} 次，记为死信不再重试: "
+                           f"{watermarks.dead_letters[:20]}")
+
+        if page_profiler is not None:
+            page_profiler.stop()
+            summary = page_profiler.write()
+            logger.info(f"剖析了 {summary['pages']} 个页面, 结果写入 {args.profile}")
+
+        if database is not None:
+            logger.info(f"连接池等待: {database.metrics.report()}")
     finally:
-        conn.close()
-
-    queue = asyncio.Queue()
-
-    # Put data into queue
-    for data in mysql_data:
-        await queue.put(data)
-
-    finally_rs = []
-    tasks = []
-
-    while not queue.empty():
-        batch = []
-        for _ in range(concurrency):
-            if queue.empty():
-                break
-            batch.append(await queue.get())
-        
-        if batch:
-            task = asyncio.create_task(process_batch(batch))
-            tasks.append(task)
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    for batch_result in results:
-        if isinstance(batch_result, Exception):
-            logger.debug(f"Batch processing error: {batch_result}")
-        else:
-            finally_rs.extend(batch_result)
-
-
-        # 将列表保存为 JSON 文件
-    with open('data.json', 'w', encoding='utf8') as f:
-        json.dump(finally_rs, f, ensure_ascii=False)
-
+        if database is not None:
+            await database.close()
 
 if __name__ == '__main__':
-    concurrency = 4  # 调整此值以更改并发级别
-    asyncio.run(main(concurrency))
+    # LOG_LEVEL / LOG_FILE / LOG_JSON / LOG_SAMPLE_RATE 控制日志，默认只输出INFO到stderr
+    pipeline_logging.configure()
+    parser = profiler.add_arguments(storage.add_arguments(add_arguments(argparse.ArgumentParser())))
+    parser.add_argument('--concurrency', type=int, default=4, help='并发数')
+    parser.add_argument('--output', default='data.json', help='结果JSON文件')
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args))
 
                 
 # 使用示例
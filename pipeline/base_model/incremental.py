@@ -0,0 +1,308 @@
+"""
+details_test_table 的增量处理
+
+在 extract_watermarks 表中按任务名记录已处理到的水位（最大id或更新时间），
+增量模式下只查询水位之后的新行/变更行；也可以用 --since / --ids 手动指定范围。
+水位列不是id时按 (水位列, id) 组成的游标推进，水位列取值相同的行不会被跳过。
+失败的行在 extract_failures 表中记录失败次数，达到 --max-attempts 次后作为死信记录保留，
+水位不再停在它前面。
+"""
+import argparse
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+SOURCE_TABLE = 'spider_test.details_test_table'
+STATE_TABLE = 'spider_test.extract_watermarks'
+FAILURE_TABLE = 'spider_test.extract_failures'
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# 水位列作为额外的字段一起查出来，不会与表中已有字段重名
+WATERMARK_FIELD = '_watermark'
+# 水位列不是id时，保存的游标为 "水位值#id"
+CURSOR_SEPARATOR = '#'
+# 同一行累计失败这么多次后记为死信，水位可以越过它
+MAX_ATTEMPTS = 3
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """给driver的命令行加上增量处理相关参数"""
+    parser.add_argument('--incremental', action='store_true',
+                        help='只处理水位之后的新行，成功后推进水位')
+    parser.add_argument('--job', default=None, help='水位记录的任务名，默认为脚本名')
+    parser.add_argument('--watermark-column', default='id',
+                        help='水位列，如 id 或 update_time（需有索引）')
+    parser.add_argument('--since', default=None,
+                        help='只处理水位列大于该值的行；也可以是保存的 "水位值#id" 游标')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help='同一行累计失败这么多次后记为死信、水位越过它，0表示一直重试')
+    parser.add_argument('--ids', default=None, help='只处理这些id，逗号分隔')
+    parser.add_argument('--shards', type=int, default=1, help='分片总数，按 id %% shards 切分')
+    parser.add_argument('--shard', type=int, default=0, help='本进程处理的分片号')
+    return parser
+
+
+def parse_ids(ids: Optional[str]) -> List[int]:
+    if not ids:
+        return []
+    return [int(part) for part in ids.split(',') if part.strip()]
+
+
+def _check_column(column: str) -> str:
+    if not _IDENTIFIER.match(column):
+        raise ValueError(f"非法的水位列名: {column}")
+    return column
+
+
+def format_cursor(value, row_id) -> str:
+    """(水位值, id) 游标保存成的字符串"""
+    return f"{value}{CURSOR_SEPARATOR}{row_id}"
+
+
+def parse_cursor(since) -> Tuple[object, Optional[int]]:
+    """
+    拆出 (水位值, id)；since 为元组时原样返回，
+    没有id部分（手动指定的 --since 或只按水位列保存的旧水位）时id为None，只按水位列过滤
+    """
+    if isinstance(since, tuple):
+        return since
+    if isinstance(since, str):
+        value, separator, row_id = since.rpartition(CURSOR_SEPARATOR)
+        if separator and row_id.isdigit():
+            return value, int(row_id)
+    return since, None
+
+
+def build_query(column: str = 'id', since=None, ids: Sequence[int] = (),
+                fields: Iterable[str] = ('id', 'result_text'), shard: int = 0,
+                shards: int = 1, table: str = SOURCE_TABLE, dialect: str = 'mysql') -> Tuple[str, list]:
+    """
+    生成查询语句和参数；ids 优先于 since，分片条件与二者叠加
+    水位列不是id时按 (水位列, id) 排序，since 带id部分时从该游标之后开始
+    dialect 为 mysql 时用 %s 占位符，postgres 时用 $1, $2 ...
+    """
+    column = _check_column(column)
+    sql = f"select {', '.join(fields)}, {column} as {WATERMARK_FIELD} from {table} dtt"
+    conditions = []
+    params = []
+
+    def placeholder(value):
+        params.append(value)
+        return f"${len(params)}" if dialect == 'postgres' else '%s'
+
+    if ids:
+        conditions.append(f"id in ({', '.join(placeholder(i) for i in ids)})")
+    elif since is not None:
+        value, after_id = parse_cursor(since)
+        if column == 'id' or after_id is None:
+            conditions.append(f"{column} > {placeholder(value)}")
+        else:
+            # 展开写，MySQL对行构造器比较不一定能用上索引
+            conditions.append(f"({column} > {placeholder(value)} or "
+                              f"({column} = {placeholder(value)} and id > {placeholder(after_id)}))")
+    if shards > 1:
+        if not 0 <= shard < shards:
+            raise ValueError(f"分片号超出范围: {shard}/{shards}")
+        # pymysql 用 % 格式化参数，取模运算符要写成 %%
+        modulo = '%' if dialect == 'postgres' else '%%'
+        conditions.append(f"id {modulo} {placeholder(shards)} = {placeholder(shard)}")
+    if conditions:
+        sql += " where " + " and ".join(conditions)
+    sql += " order by id" if column == 'id' else f" order by {column}, id"
+    return sql, params
+
+
+async def ensure_state_table(conn):
+    async with conn.cursor() as cursor:
+        await cursor.execute(f'''
+            create table if not exists {STATE_TABLE} (
+                job varchar(128) not null primary key,
+                watermark_column varchar(64) not null,
+                watermark varchar(64) not null,
+                updated_at timestamp not null default current_timestamp on update current_timestamp
+            )
+        ''')
+    await conn.commit()
+
+
+async def load_watermark(conn, job: str, column: str) -> Optional[str]:
+    """读取任务的水位；水位列变了的话旧水位不可用，返回None"""
+    await ensure_state_table(conn)
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            f'select watermark_column, watermark from {STATE_TABLE} where job = %s', (job,)
+        )
+        row = await cursor.fetchone()
+    if not row:
+        return None
+    if isinstance(row, dict):
+        row = (row['watermark_column'], row['watermark'])
+    return row[1] if row[0] == column else None
+
+
+async def save_watermark(conn, job: str, column: str, watermark) -> None:
+    await ensure_state_table(conn)
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            f'insert into {STATE_TABLE} (job, watermark_column, watermark) values (%s, %s, %s) '
+            f'on duplicate key update watermark_column = values(watermark_column), watermark = values(watermark)',
+            (job, column, str(watermark))
+        )
+    await conn.commit()
+
+
+async def ensure_failure_table(conn):
+    async with conn.cursor() as cursor:
+        await cursor.execute(f'''
+            create table if not exists {FAILURE_TABLE} (
+                job varchar(128) not null,
+                id bigint not null,
+                attempts int not null,
+                updated_at timestamp not null default current_timestamp on update current_timestamp,
+                primary key (job, id)
+            )
+        ''')
+    await conn.commit()
+
+
+async def load_failures(conn, job: str) -> Dict[int, int]:
+    """读取任务中各行累计的失败次数"""
+    await ensure_failure_table(conn)
+    async with conn.cursor() as cursor:
+        await cursor.execute(f'select id, attempts from {FAILURE_TABLE} where job = %s', (job,))
+        rows = await cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return {row['id']: row['attempts'] for row in rows}
+    return {row[0]: row[1] for row in rows}
+
+
+async def save_failures(conn, job: str, attempts: Dict[int, int], cleared: Iterable[int]) -> None:
+    """写入本次运行后的失败次数，删除重试成功的行"""
+    await ensure_failure_table(conn)
+    async with conn.cursor() as cursor:
+        if attempts:
+            await cursor.executemany(
+                f'insert into {FAILURE_TABLE} (job, id, attempts) values (%s, %s, %s) '
+                f'on duplicate key update attempts = values(attempts)',
+                [(job, row_id, count) for row_id, count in attempts.items()]
+            )
+        cleared = list(cleared)
+        if cleared:
+            await cursor.executemany(f'delete from {FAILURE_TABLE} where job = %s and id = %s',
+                                     [(job, row_id) for row_id in cleared])
+    await conn.commit()
+
+
+def page_succeeded(row: Dict, result) -> bool:
+    """一行是否处理完成：有结果，或在近重复检测的 skip 模式下作为重复页面被跳过"""
+    return result is not None or row.get('duplicate_of') is not None
+
+
+class WatermarkTracker:
+    """
+    记录本次运行读出的行和处理失败的行，水位只推进到第一个失败行之前
+    查询按水位列（不是id时为 (水位列, id)）排序，读出的水位值是递增的；失败行（包括 process_data
+    内部捕获异常后返回None的行）及其之后的行下次运行会重新处理。
+    attempts 为之前运行累计的失败次数，同一行累计失败 max_attempts 次后记为死信，不再挡住水位
+    """
+
+    def __init__(self, column: str = 'id', attempts: Optional[Dict[int, int]] = None,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.column = column
+        self.max_attempts = max_attempts
+        self._attempts = dict(attempts or {})
+        self._values = []          # 读出的水位值，递增、相邻不重复
+        self._first_failed = None  # 失败行中最小的水位值
+        self.updated = {}          # id -> 本次运行后的累计失败次数，需要写回
+        self.cleared = set()       # 之前失败过、本次成功的id
+        self.dead_letters = []     # 本次达到失败次数上限的id
+
+    def _key(self, row: Dict):
+        value = row.get(WATERMARK_FIELD)
+        if value is None or self.column == 'id':
+            return value
+        return value, row.get('id')
+
+    def read(self, batch: Iterable[Dict]) -> None:
+        for row in batch:
+            key = self._key(row)
+            if key is not None and (not self._values or key != self._values[-1]):
+                self._values.append(key)
+
+    def fail(self, row: Dict) -> None:
+        row_id = row.get('id')
+        if row_id is not None:
+            attempts = self._attempts.get(row_id, 0) + 1
+            self._attempts[row_id] = self.updated[row_id] = attempts
+            self.cleared.discard(row_id)
+            if self.max_attempts and attempts >= self.max_attempts:
+                # 死信：失败记录留在表中，水位可以越过它
+                self.dead_letters.append(row_id)
+                return
+        key = self._key(row)
+        if key is not None and (self._first_failed is None or key < self._first_failed):
+            self._first_failed = key
+
+    def succeed(self, row: Dict) -> None:
+        row_id = row.get('id')
+        if self._attempts.pop(row_id, None) is not None:
+            self.updated.pop(row_id, None)
+            self.cleared.add(row_id)
+
+    def record(self, batch: Sequence[Dict], results) -> None:
+        """一批的处理结果；results 为异常时整批都算失败"""
+        if isinstance(results, BaseException):
+            for row in batch:
+                self.fail(row)
+            return
+        for row, result in zip(batch, results):
+            if page_succeeded(row, result):
+                self.succeed(row)
+            else:
+                self.fail(row)
+
+    @property
+    def failed(self) -> bool:
+        return self._first_failed is not None
+
+    @property
+    def watermark(self):
+        """可以保存的水位：第一个失败行之前的最大水位值，没有可推进的范围时为None"""
+        if self._first_failed is None:
+            key = self._values[-1] if self._values else None
+        else:
+            # 水位列为id以外的列时 (水位列, id) 唯一；只按水位列手动过滤时与失败行水位相同的行也不能跳过
+            i = bisect_left(self._values, self._first_failed)
+            key = self._values[i - 1] if i else None
+        return format_cursor(*key) if isinstance(key, tuple) else key
+
+
+async def prepare_query(backend, args, default_job: str) -> Tuple[str, list, Optional[str]]:
+    """
+    按命令行参数生成查询，backend 为 storage.StorageBackend，返回 (sql, 参数, 任务名)
+    任务名为None表示本次运行不需要推进水位（非增量模式或按 --ids 补跑）
+    """
+    column = args.watermark_column
+    ids = parse_ids(args.ids)
+    since = args.since
+    job = None
+    if args.incremental and not ids:
+        job = args.job or default_job
+        if args.shards > 1:
+            # 各分片的进度互相独立，分别记录水位
+            job = f"{job}-shard{args.shard}of{args.shards}"
+        if since is None:
+            since = await backend.load_watermark(job, column)
+    sql, params = backend.build_query(column, since, ids, shard=args.shard, shards=args.shards,
+                                      raw=getattr(args, 'raw_pages', False))
+    return sql, params, job
+
+
+async def select_rows(backend, args, default_job: str) -> Tuple[list, Optional[str]]:
+    """按命令行参数一次查出待处理的行，返回 (行列表, 任务名)"""
+    sql, params, job = await prepare_query(backend, args, default_job)
+    rows = []
+    async for batch in backend.stream(sql, params):
+        rows.extend(batch)
+    return rows, job
@@ -0,0 +1,324 @@
+"""
+流水线指标：各阶段的计数和耗时直方图、队列深度和处理中页面数，按Prometheus文本格式导出
+
+指标总是在进程内记录（一次计时只是 perf_counter 加一次二分查找），是否导出由环境变量决定：
+- METRICS_PORT：在该端口启动HTTP服务，GET /metrics 返回文本格式，可直接被Prometheus抓取
+- METRICS_FILE：定期（METRICS_DUMP_INTERVAL 秒）和进程结束时把同样的内容写到文件，
+  供node_exporter的textfile收集器读取；路径中可以用 {pid}，多进程/分片运行时各写各的
+"""
+import atexit
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_PORT_ENV = 'METRICS_PORT'
+METRICS_FILE_ENV = 'METRICS_FILE'
+METRICS_DUMP_INTERVAL_ENV = 'METRICS_DUMP_INTERVAL'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 从解析一个页面的毫秒级到一次LLM调用的数十秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，得到 {labels}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(Counter):
+    type_name = 'gauge'
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """累计分桶直方图，输出 _bucket/_sum/_count，分位数在Prometheus端用 histogram_quantile 计算"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各桶（非累计）计数，最后一个为 +Inf，以及总和
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, *labels, value: float):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, *labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def total(self, *labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# 阶段：parse / clean / extract / analyze / trafilatura / llm，
+# 以及 db_acquire / db_read / db_write / archive_read / parquet_write，thrift服务的 init_pipeline / process_url
+STAGE_SECONDS = REGISTRY.register(Histogram('extract_stage_seconds', '各处理阶段的耗时（秒）', ['stage']))
+STAGE_ERRORS = REGISTRY.register(Counter('extract_stage_errors_total', '各处理阶段抛出异常的次数', ['stage']))
+PAGES = REGISTRY.register(Counter('extract_pages_total', '处理完的页面数，status 为 ok 或 failed',
+                                  ['driver', 'status']))
+ROWS = REGISTRY.register(Counter('extract_rows_total', '读出或写入的行数', ['stage']))
+QUEUE_DEPTH = REGISTRY.register(Gauge('extract_queue_depth', '已读出、尚未开始处理的页面数'))
+IN_FLIGHT = REGISTRY.register(Gauge('extract_in_flight', '正在处理的页面数'))
+
+
+# 当前任务（或线程）所在的阶段栈（可嵌套）；asyncio的每个任务有自己的上下文，交错执行的页面互不干扰
+_stage_stack: contextvars.ContextVar = contextvars.ContextVar('stage_stack', default=())
+# 每个线程上最近一次进入/退出阶段的任务当时所在的阶段，供采样剖析（profiler.py）把调用栈归到阶段；
+# 采样线程拿不到其他线程正在运行的任务的上下文，只能用这个近似
+_thread_stages: Dict[int, Optional[str]] = {}
+# 阶段进入/退出的监听者，需实现 stage_enter(stage) / stage_exit(stage)
+_stage_listeners: List = []
+
+
+def add_stage_listener(listener) -> None:
+    _stage_listeners.append(listener)
+
+
+def remove_stage_listener(listener) -> None:
+    if listener in _stage_listeners:
+        _stage_listeners.remove(listener)
+
+
+def current_stage(thread_id: Optional[int] = None) -> Optional[str]:
+    """不传 thread_id 时为当前任务所在的阶段，否则为该线程上最近一次进入/退出阶段时的阶段"""
+    if thread_id is None:
+        stages = _stage_stack.get()
+        return stages[-1] if stages else None
+    return _thread_stages.get(thread_id)
+
+
+def _set_stages(stages: Tuple[str, ...]) -> None:
+    _stage_stack.set(stages)
+    _thread_stages[threading.get_ident()] = stages[-1] if stages else None
+
+
+@contextmanager
+def timed(stage: str):
+    """记录一个阶段的耗时；异常照常抛出，同时计入该阶段的错误数"""
+    # 监听者（如内存快照）的开销不计入阶段耗时，也不归到该阶段的调用栈样本
+    for listener in _stage_listeners:
+        listener.stage_enter(stage)
+    _set_stages(_stage_stack.get() + (stage,))
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(stage, value=time.perf_counter() - start)
+        # 异步生成器等情况下退出时的上下文可能不是进入时的，删除最近一次进入的同名阶段而不是按token还原
+        stages = _stage_stack.get()
+        for i in range(len(stages) - 1, -1, -1):
+            if stages[i] == stage:
+                stages = stages[:i] + stages[i + 1:]
+                break
+        _set_stages(stages)
+        for listener in _stage_listeners:
+            listener.stage_exit(stage)
+
+
+async def timed_batches(batches, stage: str):
+    """包装 StorageBackend.stream / stream_archive：每取一批计一次耗时，并把读出的页面计入队列深度"""
+    iterator = batches.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            batch = await iterator.__anext__()
+        except StopAsyncIteration:
+            STAGE_SECONDS.observe(stage, value=time.perf_counter() - start)
+            return
+        STAGE_SECONDS.observe(stage, value=time.perf_counter() - start)
+        ROWS.inc(stage, amount=len(batch))
+        QUEUE_DEPTH.inc(amount=len(batch))
+        yield batch
+
+
+@contextmanager
+def tracking_page(driver: str):
+    """一个页面从队列进入处理；调用方在退出前把结果放进 yield 出的列表判断成功与否"""
+    QUEUE_DEPTH.dec()
+    IN_FLIGHT.inc()
+    outcome = []
+    try:
+        yield outcome
+    finally:
+        IN_FLIGHT.dec()
+        PAGES.inc(driver, 'ok' if outcome and outcome[0] else 'failed')
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def dump(path: str) -> None:
+    """原子地写出指标文件，textfile收集器不会读到写了一半的文件"""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf8') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 每次抓取都打印访问日志太吵
+        pass
+
+
+def serve(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """在后台线程中提供 /metrics"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+_exporter_started = False
+
+
+def start_exporter() -> Optional[str]:
+    """按环境变量启动导出，重复调用无效；返回导出位置的说明，未配置时返回None"""
+    global _exporter_started
+    if _exporter_started:
+        return None
+    _exporter_started = True
+    targets = []
+    port = os.environ.get(METRICS_PORT_ENV)
+    if port:
+        try:
+            serve(int(port))
+            targets.append(f'http://0.0.0.0:{port}/metrics')
+        except OSError as e:
+            # 同一台机器上多个分片进程时端口可能已被占用，不影响处理
+            logging.warning(f"指标端口 {port} 启动失败: {e}")
+    path = os.environ.get(METRICS_FILE_ENV)
+    if path:
+        path = path.format(pid=os.getpid())
+        interval = float(os.environ.get(METRICS_DUMP_INTERVAL_ENV, 15))
+
+        def dump_periodically():
+            while True:
+                time.sleep(interval)
+                dump(path)
+
+        threading.Thread(target=dump_periodically, name='metrics-dump', daemon=True).start()
+        atexit.register(dump, path)
+        targets.append(path)
+    return ', '.join(targets) or None
@@ -0,0 +1,229 @@
+"""
+近重复页面检测：MinHash签名 + LSH分桶
+
+在解析和调用LLM之前，用正则粗略去掉标签得到页面文本，按字符n-gram计算MinHash签名，
+在LSH索引中查找相似页面；命中时跳过该页面或直接复用已有结果。
+索引可以保存到磁盘，下次运行继续使用。
+"""
+import asyncio
+import hashlib
+import html as html_lib
+import json
+import os
+import re
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+# 索引文件路径，设置后各driver在 process_data/print_analysis 之前做近重复检测
+INDEX_PATH_ENV = 'NEAR_DUP_INDEX'
+# reuse: 复用相似页面的结果；skip: 直接跳过相似页面
+MODE_ENV = 'NEAR_DUP_MODE'
+
+NUM_PERM = 128
+BANDS = 16            # 16个band、每个8行，相似度0.7以上的页面大概率落入同一个桶
+THRESHOLD = 0.8       # 估计的Jaccard相似度达到这个值才算近重复
+SHINGLE_SIZE = 5      # 中文按字符切分，5个字一个片段
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_INVISIBLE = re.compile(r'<(script|style|noscript)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r'<[^>]+>')
+_SPACE = re.compile(r'\s+')
+
+
+def page_text(html_content: str) -> str:
+    """不构建DOM，用正则去掉脚本、注释和标签，得到用于计算签名的文本"""
+    text = _INVISIBLE.sub(' ', html_content or '')
+    text = html_lib.unescape(_TAG.sub(' ', text))
+    return _SPACE.sub(' ', text).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """文本的字符n-gram，每个片段哈希成32位整数"""
+    text = _SPACE.sub('', text)
+    if len(text) <= size:
+        pieces = {text} if text else set()
+    else:
+        pieces = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(piece.encode('utf8'), digest_size=4).digest(), 'little')
+         for piece in pieces),
+        dtype=np.uint64, count=len(pieces)
+    )
+
+
+class NearDuplicateIndex:
+    """MinHash签名的LSH索引，key 通常是记录id"""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, threshold: float = THRESHOLD,
+                 shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        # 哈希值和系数都小于2^32，a*x 不会溢出uint64
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.signatures = {}             # key -> 签名
+        self.results = {}                # key -> 处理结果
+        self._buckets = defaultdict(list)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text, self.shingle_size)
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # 分段计算，大页面上中间矩阵不会过大
+        for start in range(0, len(hashes), 4096):
+            permuted = (np.outer(hashes[start:start + 4096], self._a) % _MERSENNE_PRIME + self._b) % _MERSENNE_PRIME
+            np.minimum(signature, (permuted & _MAX_HASH).min(axis=0), out=signature)
+        return signature
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """签名中相同位置相等的比例，是Jaccard相似度的估计"""
+        return float(np.mean(sig_a == sig_b))
+
+    def query(self, signature: np.ndarray) -> Optional[str]:
+        """返回最相似且达到阈值的已索引key，没有时返回None"""
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        best, best_score = None, self.threshold
+        for key in candidates:
+            score = self.similarity(signature, self.signatures[key])
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def add(self, key, signature: np.ndarray, result=None):
+        self.signatures[key] = signature
+        if result is not None:
+            self.results[key] = result
+        for band_key in self._band_keys(signature):
+            self._buckets[band_key].append(key)
+
+    def remove(self, key):
+        """删除一个key，用于处理失败、没有结果的页面"""
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        self.results.pop(key, None)
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def save(self, path: str):
+        """签名和参数存为npz，结果以JSON字符串存在同一个文件里"""
+        keys = list(self.signatures)
+        # 传文件对象，避免numpy给路径自动加上.npz后缀
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                keys=np.array(json.dumps(keys, ensure_ascii=False)),
+                signatures=np.array([self.signatures[k] for k in keys], dtype=np.uint64).reshape(-1, self.num_perm),
+                results=np.array(json.dumps([[k, v] for k, v in self.results.items()], ensure_ascii=False)),
+                params=np.array([self.num_perm, self.bands, self.shingle_size, self.seed]),
+                threshold=self.threshold,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> 'NearDuplicateIndex':
+        data = np.load(path)
+        num_perm, bands, shingle_size, seed = (int(v) for v in data['params'])
+        index = cls(num_perm, bands, float(data['threshold']), shingle_size, seed)
+        for key, signature in zip(json.loads(str(data['keys'])), data['signatures']):
+            index.add(key, signature)
+        index.results = {key: value for key, value in json.loads(str(data['results']))}
+        return index
+
+
+class DedupStage:
+    """
+    放在 process_data/print_analysis 前面的去重阶段
+    同一批并发处理的页面中，后到的近重复页面会等待先到页面的结果
+    """
+
+    def __init__(self, index: NearDuplicateIndex, mode: str = 'reuse', path: str = None):
+        if mode not in ('reuse', 'skip'):
+            raise ValueError(f"未知的去重模式: {mode}")
+        self.index = index
+        self.mode = mode
+        self.path = path
+        self.duplicates = 0
+        self.processed = 0
+        self._pending = {}   # key -> 正在处理的页面的Future
+
+    async def run(self, data: Dict, process: Callable[[Dict], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        signature = self.index.signature(page_text(data['result_text']))
+        match = self.index.query(signature)
+        if match is not None:
+            # 相似页面还在处理时等它的结果；只有它确实得到了结果才跳过或复用
+            pending = self._pending.get(match)
+            source = await pending if pending is not None else self.index.results.get(match)
+            if source is not None:
+                self.duplicates += 1
+                if self.mode == 'skip':
+                    # 跳过的页面没有结果，但已经处理完，增量模式的水位可以越过它
+                    data['duplicate_of'] = match
+                    return None
+                return dict(source, id=data['id'], duplicate_of=match)
+
+        # 先登记签名，同一批中后到的近重复页面才能找到并等待本页面；失败或没有结果时再撤销
+        key = data['id']
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        self.index.add(key, signature)
+        result = None
+        try:
+            result = await process(data)
+        finally:
+            self._pending.pop(key, None)
+            if result is None:
+                self.index.remove(key)
+            future.set_result(result)
+        self.processed += 1
+        if result is not None:
+            self.index.results[key] = result
+        return result
+
+    def duplicate_ratio(self) -> float:
+        total = self.duplicates + self.processed
+        return self.duplicates / total if total else 0.0
+
+    def save(self):
+        if self.path:
+            self.index.save(self.path)
+
+
+_default_stage = None
+
+
+def get_dedup_stage():
+    """按环境变量 NEAR_DUP_INDEX 加载索引（只加载一次），未配置时返回None"""
+    global _default_stage
+    path = os.environ.get(INDEX_PATH_ENV)
+    if not path:
+        return None
+    if _default_stage is None:
+        index = NearDuplicateIndex.load(path) if os.path.exists(path) else NearDuplicateIndex()
+        _default_stage = DedupStage(index, os.environ.get(MODE_ENV, 'reuse'), path)
+    return _default_stage
@@ -1,6 +1,3 @@
-from newspaper import Article
-
-
 html_content = """
 <html xmlns="//www.w3.org/1999/xhtml"><head>
 
@@ -2374,32 +2371,35 @@ document.write(unescape("%3Cscript src='" + _bdhmProtocol + "hm.baidu.com/h.js%3
 </body></html>
 """
 
-url = 'http://fox13now.com/2013/12/30/new-year-new-laws-obamacare-pot-guns-and-drones/'
-article = Article(url)
-article.download(html_content)
+if __name__ == '__main__':
+    from newspaper import Article
+
+    url = 'http://fox13now.com/2013/12/30/new-year-new-laws-obamacare-pot-guns-and-drones/'
+    article = Article(url)
+    article.download(html_content)
 
-article.parse()
+    article.parse()
 
-article.html
-## --> '<!DOCTYPE HTML><html itemscope itemtype="http://...'
+    article.html
+    ## --> '<!DOCTYPE HTML><html itemscope itemtype="http://...'
 
-print(article.title)
-## --> 'New Year, new laws: Obamacare, pot, guns and drones'
+    print(article.title)
+    ## --> 'New Year, new laws: Obamacare, pot, guns and drones'
 
-print(article.authors)
-# article.authors
-# ## --> ['Leigh Ann Caldwell', 'John Honway']
+    print(article.authors)
+    # article.authors
+    # ## --> ['Leigh Ann Caldwell', 'John Honway']
 
-# print(article.publish_date)
-# ## --> datetime.datetime(2013, 12, 30, 0, 0)
+    # print(article.publish_date)
+    # ## --> datetime.datetime(2013, 12, 30, 0, 0)
 
-print(article.text)
-# ## --> 'Washington (CNN) -- Not everyone subscribes to a New Year's resolution...'
+    print(article.text)
+    # ## --> 'Washington (CNN) -- Not everyone subscribes to a New Year's resolution...'
 
-# article.top_image
-# ## --> 'http://someCDN.com/blah/blah/blah/file.png'
+    # article.top_image
+    # ## --> 'http://someCDN.com/blah/blah/blah/file.png'
 
-# article.images
-# ## --> ['url_to_img_1', 'url_to_img_2', 'url_to_img_3', ...]
-# print(article.images)
-# article.movies
\ No newline at end of file
+    # article.images
+    # ## --> ['url_to_img_1', 'url_to_img_2', 'url_to_img_3', ...]
+    # print(article.images)
+    # article.movies
@@ -0,0 +1,271 @@
+"""
+本地原始页面归档：按id随机读取的zstd压缩页面库
+
+一个归档由三个文件组成：
+- <name>.zdict  用前 train_samples 个页面训练的zstd字典，同站点的HTML共享大量模板，用字典压缩率高得多
+- <name>.pages  每个页面单独压缩成一个zstd帧，依次拼接
+- <name>.idx    文件头 + 按写入顺序排列的 (id, 偏移, 长度) 定长记录
+读取时 .pages 用mmap映射，按索引切出一帧解压，不需要扫描也不需要连数据库。
+
+    python page_archive.py build --archive corpus/dbw --backend mysql --since 100000
+    python page_archive.py build --archive corpus/raw --raw-pages      # 保存列中的原始字节
+    python page_archive.py get --archive corpus/dbw 123456
+    python plan_b_fromdb.py --archive corpus/dbw
+"""
+import argparse
+import asyncio
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import zstandard
+
+from page_decoding import decode_html
+
+MAGIC = b'PGARCH01'
+_HEADER = struct.Struct('<8sQ')          # 魔数, 页面数
+INDEX_DTYPE = np.dtype([('id', '<i8'), ('offset', '<u8'), ('length', '<u4')])
+
+DICT_SIZE = 112 * 1024
+TRAIN_SAMPLES = 2000
+# 少于这么多页面时不训练字典，直接压缩
+MIN_TRAIN_SAMPLES = 8
+COMPRESSION_LEVEL = 10
+# 归档只保存页面id，只能按id做水位过滤
+WATERMARK_COLUMN = 'id'
+
+
+def _paths(archive: str):
+    return archive + '.zdict', archive + '.pages', archive + '.idx'
+
+
+class PageArchiveWriter:
+    """
+    顺序写入页面；先缓存前 train_samples 个页面训练字典，之后边压缩边写
+    必须调用 close（或用 with）才会写出索引
+    """
+
+    def __init__(self, archive: str, dict_size: int = DICT_SIZE, train_samples: int = TRAIN_SAMPLES,
+                 level: int = COMPRESSION_LEVEL):
+        self.archive = archive
+        self.dict_size = dict_size
+        self.train_samples = train_samples
+        self.level = level
+        self.count = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        directory = os.path.dirname(archive)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._dict_path, pages_path, self._index_path = _paths(archive)
+        self._pages = open(pages_path, 'wb')
+        self._pending: List[tuple] = []
+        self._index: List[tuple] = []
+        self._ids = set()
+        self._compressor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, page_id: int, html_content):
+        if page_id in self._ids:
+            raise ValueError(f"页面id重复: {page_id}")
+        self._ids.add(page_id)
+        data = html_content.encode('utf8', 'surrogatepass') if isinstance(html_content, str) else html_content
+        self.raw_bytes += len(data)
+        if self._compressor is None:
+            self._pending.append((page_id, data))
+            if len(self._pending) >= self.train_samples:
+                self._start_compressing()
+            return
+        self._write(page_id, data)
+
+    def _start_compressing(self):
+        """用缓存的页面训练字典，然后写出缓存的页面"""
+        dict_data = None
+        samples = [data for _, data in self._pending if data]
+        if len(samples) >= MIN_TRAIN_SAMPLES:
+            try:
+                dict_data = zstandard.train_dictionary(self.dict_size, samples)
+            except zstandard.ZstdError:
+                # 样本太少或太相似时训练可能失败，退回到无字典压缩
+                dict_data = None
+        with open(self._dict_path, 'wb') as f:
+            f.write(dict_data.as_bytes() if dict_data is not None else b'')
+        self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+        pending, self._pending = self._pending, []
+        for page_id, data in pending:
+            self._write(page_id, data)
+
+    def _write(self, page_id: int, data: bytes):
+        frame = self._compressor.compress(data)
+        self._index.append((page_id, self._pages.tell(), len(frame)))
+        self._pages.write(frame)
+        self.count += 1
+        self.compressed_bytes += len(frame)
+
+    def close(self):
+        if self._pages.closed:
+            return
+        if self._compressor is None:
+            self._start_compressing()
+        self._pages.close()
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        with open(self._index_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(index)))
+            f.write(index.tobytes())
+
+    def ratio(self) -> float:
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+
+def check_watermark(column: str, since=None) -> Optional[int]:
+    """检查水位列和 --since 能否用于归档，返回整数形式的 since；不能时抛出说明原因的 ValueError"""
+    if column != WATERMARK_COLUMN:
+        raise ValueError(f"页面归档只保存id，不能按水位列 {column} 过滤，请使用 --watermark-column id 或从数据库读取")
+    if since is None:
+        return None
+    try:
+        return int(since)
+    except (TypeError, ValueError):
+        raise ValueError(f"页面归档按id过滤，--since 必须是整数: {since!r}") from None
+
+
+class PageArchive:
+    """只读打开归档，get(id) 为O(1)：查字典得到偏移，从mmap中切出一帧解压"""
+
+    def __init__(self, archive: str):
+        self.archive = archive
+        dict_path, pages_path, index_path = _paths(archive)
+        with open(index_path, 'rb') as f:
+            magic, count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"不是页面归档索引: {index_path}")
+            self.index = np.frombuffer(f.read(count * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        self._positions = {int(page_id): i for i, page_id in enumerate(self.index['id'])}
+        with open(dict_path, 'rb') as f:
+            dict_bytes = f.read()
+        dict_data = zstandard.ZstdCompressionDict(dict_bytes) if dict_bytes else None
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        self._file = open(pages_path, 'rb')
+        # 空文件不能mmap
+        self._pages = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(pages_path) else b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, page_id):
+        return page_id in self._positions
+
+    def ids(self) -> np.ndarray:
+        return self.index['id']
+
+    def get_bytes(self, page_id: int) -> bytes:
+        entry = self.index[self._positions[page_id]]
+        offset = int(entry['offset'])
+        return self._decompressor.decompress(self._pages[offset:offset + int(entry['length'])])
+
+    def get(self, page_id: int) -> str:
+        # 用 --raw-pages 导出的归档中可能是gb18030等编码的原始字节
+        return decode_html(self.get_bytes(page_id)).text
+
+    def iter_rows(self, ids: Sequence[int] = (), since=None, shard: int = 0, shards: int = 1,
+                  batch_size: int = 100, raw: bool = False, column: str = WATERMARK_COLUMN) -> Iterator[List[Dict]]:
+        """
+        与数据库读取相同格式的批次 {'id', 'result_text', '_watermark'}，按id排序
+        过滤条件与 incremental.build_query 一致；归档没有其他列，水位列只能是id
+        raw 为True时 result_text 为归档中的原始字节，由 page_decoding.decode_row 解码
+        """
+        since = check_watermark(column, since)
+        get = self.get_bytes if raw else self.get
+        selected = np.sort(self.index['id'])
+        if ids:
+            selected = selected[np.isin(selected, np.asarray(list(ids), dtype=np.int64))]
+        elif since is not None:
+            selected = selected[selected > since]
+        if shards > 1:
+            selected = selected[selected % shards == shard]
+        for start in range(0, len(selected), batch_size):
+            yield [
+                {'id': int(page_id), 'result_text': get(int(page_id)), '_watermark': int(page_id)}
+                for page_id in selected[start:start + batch_size]
+            ]
+
+    def close(self):
+        if isinstance(self._pages, mmap.mmap):
+            self._pages.close()
+        self._file.close()
+
+
+def stream_archive(archive: PageArchive, args, batch_size: int):
+    """
+    按driver的命令行参数从归档中分批读取，接口与 StorageBackend.stream 相同
+    水位列和 --since 在调用时就检查，不合法时driver开始读取之前就报错
+    """
+    from incremental import parse_ids
+
+    column = getattr(args, 'watermark_column', WATERMARK_COLUMN)
+    since = check_watermark(column, args.since)
+    return _stream_rows(archive, parse_ids(args.ids), since, args.shard, args.shards, batch_size, column)
+
+
+async def _stream_rows(archive: PageArchive, ids, since, shard, shards, batch_size, column):
+    # 归档中本来就是字节，直接交给driver解码，不先按UTF-8转成str
+    for batch in archive.iter_rows(ids, since, shard, shards, batch_size, raw=True, column=column):
+        yield batch
+        # 让出事件循环，已提交的批次可以开始处理
+        await asyncio.sleep(0)
+
+
+async def build_from_backend(archive_path: str, args) -> PageArchiveWriter:
+    """把数据库中符合条件的页面导出成归档"""
+    import storage
+    from incremental import prepare_query
+
+    backend = await storage.open_backend(args.backend)
+    try:
+        sql, params, _ = await prepare_query(backend, args, 'page_archive')
+        with PageArchiveWriter(archive_path) as writer:
+            async for batch in backend.stream(sql, params, batch_size=500):
+                for row in batch:
+                    writer.add(row['id'], row['result_text'] or '')
+    finally:
+        await backend.close()
+    return writer
+
+
+if __name__ == '__main__':
+    import storage
+    from incremental import add_arguments
+
+    parser = argparse.ArgumentParser(description='本地原始页面归档')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='从数据库导出归档')
+    # 归档路径沿用 storage 参数中的 --archive
+    storage.add_arguments(add_arguments(build_parser))
+    get_parser = subparsers.add_parser('get', help='按id输出页面')
+    get_parser.add_argument('--archive', required=True)
+    get_parser.add_argument('id', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not args.archive:
+            parser.error('build 需要 --archive 指定归档路径前缀')
+        writer = asyncio.run(build_from_backend(args.archive, args))
+        print(f"写入 {writer.count} 个页面, {writer.raw_bytes} -> {writer.compressed_bytes} 字节, "
+              f"压缩比 {writer.ratio():.1f}x")
+    else:
+        with PageArchive(args.archive) as archive:
+            print(archive.get(args.id))
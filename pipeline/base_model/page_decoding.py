@@ -0,0 +1,316 @@
+"""
+页面字节解码：从原始字节判断编码，解码一次，把字节和str一起交给下游
+
+判断顺序：
+1. BOM
+2. 含非ASCII字符的合法UTF-8：入库时已经转成UTF-8、却仍保留 charset=gb2312 声明的页面很常见，
+   而UTF-8字节按gb18030严格解码也往往能成功（得到乱码），所以先于声明判断
+3. 开头 SNIFF_BYTES 字节内的 <meta charset> / http-equiv，按WHATWG的别名归并（gb2312/gbk -> gb18030 等）
+4. 同一站点上次解码成功的编码
+5. 有meta声明或站点缓存、但按它严格解码失败时（页面中混有少量坏字节），仍按它解码，非法字节替换为U+FFFD；
+   对这样的页面检测器往往猜出完全不相干的单字节编码，整页都成乱码
+6. 没有任何声明时才用编码检测器（cchardet，没有安装时用 charset_normalizer），只看开头 DETECT_BYTES 字节
+7. 都不成功时按UTF-8解码，非法字节替换为U+FFFD
+
+lxml可以直接解析字节：parse_html(row) 用判断出的编码创建解析器，不再经过str，
+也不会被与实际编码不符的meta声明误导。替换过非法字节的页面（5、7）不保留原始字节给下游解析，
+libxml2遇到非法字节会丢掉后面的内容，下游改为解析替换后的文本。
+"""
+import codecs
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from lxml import etree, html
+
+import metrics
+from site_template import site_host
+
+# 在开头这么多字节内查找BOM之外的编码声明
+SNIFF_BYTES = 4096
+# 交给编码检测器的字节数，检测耗时与输入长度成正比
+DETECT_BYTES = 65536
+# 按站点缓存编码的站点数
+SITE_CACHE_SIZE = 10000
+# 这些来源的解码替换过非法字节，文本与原始字节不再一一对应
+LOSSY_SOURCES = frozenset({'meta-replace', 'site-replace', 'fallback'})
+
+ENCODINGS = metrics.REGISTRY.register(metrics.Counter(
+    'extract_page_encodings_total',
+    '解码的页面数，按编码和编码来源（bom/meta/site/utf-8/meta-replace/site-replace/detector/fallback）',
+    ['encoding', 'source']
+))
+
+_BOMS = (
+    # UTF-32的BOM以UTF-16 LE的BOM开头，要先判断
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# 同时匹配 <meta charset="gbk"> 和 <meta http-equiv="Content-Type" content="text/html; charset=gbk">
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+
+# 浏览器实际按超集解码这些声明
+_CHARSET_ALIASES = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'x-gbk': 'gb18030',
+    'big5': 'big5hkscs',
+    'iso-8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'latin-1': 'cp1252',
+    'ascii': 'cp1252',
+    'us-ascii': 'cp1252',
+    # 能被当作ASCII读出的meta声明不可能是UTF-16
+    'utf-16': 'utf-8',
+    'utf-16le': 'utf-8',
+    'utf-16be': 'utf-8',
+}
+
+
+def normalize_encoding(name) -> Optional[str]:
+    """把声明或检测出的编码名归并成Python codec名，无法识别时返回None"""
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode('ascii', 'ignore')
+    name = name.strip().lower()
+    name = _CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def sniff_bom(raw: bytes) -> Optional[str]:
+    for bom, encoding in _BOMS:
+        if raw.startswith(bom):
+            return encoding
+    return None
+
+
+def sniff_meta(raw: bytes) -> Optional[str]:
+    """开头 SNIFF_BYTES 字节内meta声明的编码"""
+    match = _META_CHARSET.search(raw, 0, SNIFF_BYTES)
+    return normalize_encoding(match.group(1)) if match else None
+
+
+_detector = None
+
+
+def _load_detector():
+    """可选依赖：优先用C实现的cchardet，其次charset_normalizer，都没有时不做检测"""
+    try:
+        import cchardet
+
+        return lambda sample: cchardet.detect(sample).get('encoding')
+    except ImportError:
+        pass
+    try:
+        import charset_normalizer
+
+        def detect(sample):
+            best = charset_normalizer.from_bytes(sample).best()
+            return best.encoding if best is not None else None
+
+        return detect
+    except ImportError:
+        return lambda sample: None
+
+
+def detect_encoding(raw: bytes) -> Optional[str]:
+    global _detector
+    if _detector is None:
+        _detector = _load_detector()
+    return normalize_encoding(_detector(raw[:DETECT_BYTES]))
+
+
+def _try_decode(raw: bytes, encoding: str) -> Optional[str]:
+    try:
+        return raw.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+class SiteEncodingCache:
+    """站点 -> 最近一次解码成功的编码，按LRU淘汰；同一站点的页面编码基本一致，命中时不必再跑检测器"""
+
+    def __init__(self, maxsize: int = SITE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._encodings: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, host: Optional[str]) -> Optional[str]:
+        if not host:
+            return None
+        with self._lock:
+            encoding = self._encodings.get(host)
+            if encoding is None:
+                self.misses += 1
+                return None
+            self._encodings.move_to_end(host)
+            self.hits += 1
+            return encoding
+
+    def put(self, host: Optional[str], encoding: str) -> None:
+        if not host:
+            return
+        with self._lock:
+            self._encodings[host] = encoding
+            self._encodings.move_to_end(host)
+            if len(self._encodings) > self.maxsize:
+                self._encodings.popitem(last=False)
+
+
+class DecodedPage:
+    """一个页面的原始字节、解码后的文本、编码和编码的来源（见 ENCODINGS 的说明）"""
+
+    __slots__ = ('raw', 'text', 'encoding', 'source')
+
+    def __init__(self, raw: bytes, text: str, encoding: str, source: str):
+        self.raw = raw
+        self.text = text
+        self.encoding = encoding
+        self.source = source
+
+    @property
+    def lossy(self) -> bool:
+        """解码时是否替换过非法字节"""
+        return self.source in LOSSY_SOURCES
+
+    def __repr__(self):
+        return f'DecodedPage(encoding={self.encoding!r}, source={self.source!r}, bytes={len(self.raw)})'
+
+
+def _is_utf8(raw: bytes) -> Optional[str]:
+    """含非ASCII字符的合法UTF-8返回解码结果；纯ASCII或非法UTF-8返回None"""
+    if raw.isascii():
+        return None
+    return _try_decode(raw, 'utf-8')
+
+
+def decode_html(raw: bytes, host: str = None, site_cache: SiteEncodingCache = None) -> DecodedPage:
+    """按模块说明的顺序判断编码并解码；host 给出时用 site_cache 缓存该站点的编码"""
+    bom = sniff_bom(raw)
+    if bom:
+        # BOM解码成U+FEFF，不进入文本
+        return DecodedPage(raw, raw.decode(bom, 'replace').lstrip('\ufeff'), bom, 'bom')
+
+    declared = sniff_meta(raw)
+    if declared != 'utf-8':
+        # 已经转码成UTF-8的页面，meta声明或站点缓存的旧编码是过时的
+        text = _is_utf8(raw)
+        if text is not None:
+            if site_cache is not None:
+                site_cache.put(host, 'utf-8')
+            return DecodedPage(raw, text, 'utf-8', 'utf-8')
+    cached = site_cache.get(host) if site_cache is not None else None
+    for encoding, source in ((declared, 'meta'), (cached, 'site'), ('utf-8', 'utf-8')):
+        if not encoding:
+            continue
+        text = _try_decode(raw, encoding)
+        if text is not None:
+            if site_cache is not None:
+                site_cache.put(host, encoding)
+            return DecodedPage(raw, text, encoding, source)
+
+    # 有声明的页面相信声明，只替换坏字节，不交给检测器
+    for encoding, source in ((declared, 'meta-replace'), (cached, 'site-replace')):
+        if encoding:
+            return DecodedPage(raw, raw.decode(encoding, 'replace'), encoding, source)
+
+    detected = detect_encoding(raw)
+    if detected:
+        text = _try_decode(raw, detected)
+        if text is not None:
+            if site_cache is not None:
+                site_cache.put(host, detected)
+            return DecodedPage(raw, text, detected, 'detector')
+    # 最后按UTF-8替换非法字节，和浏览器一样总能得到文本
+    return DecodedPage(raw, raw.decode('utf-8', 'replace'), 'utf-8', 'fallback')
+
+
+_site_cache: Optional[SiteEncodingCache] = None
+
+
+def get_site_cache() -> SiteEncodingCache:
+    global _site_cache
+    if _site_cache is None:
+        _site_cache = SiteEncodingCache()
+    return _site_cache
+
+
+def decode_row(row: Dict, field: str = 'result_text') -> Optional[DecodedPage]:
+    """
+    driver读出的一行：field 为字节时就地解码，field 换成str，原始字节放在 result_bytes，编码放在 encoding；
+    替换过非法字节的页面 result_bytes 为None，下游解析替换后的文本；
+    数据库驱动已经解码成str的行保持不变，返回None
+    """
+    raw = row.get(field)
+    if not isinstance(raw, (bytes, bytearray, memoryview)):
+        return None
+    raw = bytes(raw)
+    with metrics.timed('decode'):
+        # canonical/og:url 都是ASCII，按latin-1取开头一段即可找到站点，不必先解码整页
+        host = site_host(raw[:SNIFF_BYTES * 5].decode('latin-1'), row.get('url'))
+        page = decode_html(raw, host, get_site_cache())
+    ENCODINGS.inc(page.encoding, page.source)
+    row[field] = page.text
+    row['result_bytes'] = None if page.lossy else page.raw
+    row['encoding'] = page.encoding
+    return page
+
+
+# lxml解析器不能跨线程共用，每个线程按编码缓存一个
+_parsers = threading.local()
+
+# libxml2/iconv 与Python codec名写法不同的编码
+_LXML_ENCODINGS = {
+    'utf-16-le': 'UTF-16LE',
+    'utf-16-be': 'UTF-16BE',
+    'utf-32-le': 'UTF-32LE',
+    'utf-32-be': 'UTF-32BE',
+    'big5hkscs': 'BIG5-HKSCS',
+    'euc_kr': 'EUC-KR',
+    'euc_jp': 'EUC-JP',
+}
+
+
+def html_parser(encoding: str, html_elements: bool = False):
+    """
+    指定编码的lxml HTML解析器；html_elements=True 时为 lxml.html 的解析器（元素带 text_content 等方法）
+    libxml2不支持该编码时返回None
+    """
+    cache = getattr(_parsers, 'cache', None)
+    if cache is None:
+        cache = _parsers.cache = {}
+    key = (encoding, html_elements)
+    if key not in cache:
+        parser_class = html.HTMLParser if html_elements else etree.HTMLParser
+        try:
+            cache[key] = parser_class(encoding=_LXML_ENCODINGS.get(encoding, encoding))
+        except LookupError:
+            cache[key] = None
+    return cache[key]
+
+
+def parse_html(row: Dict, html_elements: bool = False):
+    """
+    解析一行页面：有 decode_row 留下的原始字节时直接从字节解析，否则解析 result_text
+    返回值与 etree.HTML / lxml.html.fromstring 相同
+    """
+    raw = row.get('result_bytes')
+    parser = html_parser(row['encoding'], html_elements) if raw is not None else None
+    if html_elements:
+        if parser is not None:
+            return html.fromstring(raw, parser=parser)
+        return html.fromstring(row['result_text'])
+    if parser is not None:
+        return etree.HTML(raw, parser=parser)
+    return etree.HTML(row['result_text'])
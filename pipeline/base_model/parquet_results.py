@@ -0,0 +1,137 @@
+"""
+提取结果的列式存储（Arrow/Parquet）
+
+ParquetResultWriter 把结果攒成Arrow record batch，追加写到按运行日期分区的Parquet文件：
+    <root>/run_date=2024-10-25/part-<时间戳>-<pid>.parquet
+下游用 read_results / iter_results 只读取需要的列，不必解析整个JSON数组。
+"""
+import datetime
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from metrics import ROWS, timed
+
+RESULT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('title', pa.string()),
+    ('content', pa.string()),
+    ('date', pa.string()),
+    ('author', pa.string()),
+    ('videos', pa.list_(pa.string())),
+    ('contents', pa.list_(pa.string())),
+    ('duplicate_of', pa.int64()),       # 近重复/缓存复用时指向原页面
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('run_date', pa.string())]), flavor='hive')
+DEFAULT_BATCH_ROWS = 1000
+COMPRESSION = 'zstd'
+
+
+def _as_string(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def _as_list(value) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return [_as_string(value)]
+    return [_as_string(v) for v in value]
+
+
+def results_to_batch(results: List[Dict]) -> pa.RecordBatch:
+    """结果dict列表转成一个record batch，缺少的字段为null"""
+    columns = {
+        'id': [r.get('id') for r in results],
+        'title': [_as_string(r.get('title')) for r in results],
+        'content': [_as_string(r.get('content')) for r in results],
+        'date': [_as_string(r.get('date')) for r in results],
+        'author': [_as_string(r.get('author')) for r in results],
+        'videos': [_as_list(r.get('videos')) for r in results],
+        'contents': [_as_list(r.get('contents')) for r in results],
+        'duplicate_of': [r.get('duplicate_of') for r in results],
+    }
+    return pa.RecordBatch.from_pydict(columns, schema=RESULT_SCHEMA)
+
+
+class ParquetResultWriter:
+    """
+    追加写Parquet，每 batch_rows 条结果写一个row group
+    add 与 db.ResultWriter 接口相同，可以和数据库写回一起挂在driver上
+    """
+
+    def __init__(self, root: str, batch_rows: int = DEFAULT_BATCH_ROWS, compression: str = COMPRESSION,
+                 run_date: str = None):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.run_date = run_date or datetime.date.today().isoformat()
+        partition = os.path.join(root, f'run_date={self.run_date}')
+        os.makedirs(partition, exist_ok=True)
+        self.path = os.path.join(partition, f'part-{time.strftime("%H%M%S")}-{os.getpid()}.parquet')
+        self.written = 0
+        self._buffer: List[Dict] = []
+        self._writer = pq.ParquetWriter(self.path, RESULT_SCHEMA, compression=compression)
+
+    def write(self, result: Optional[Dict]):
+        if not result:
+            return
+        self._buffer.append(result)
+        if len(self._buffer) >= self.batch_rows:
+            self.flush()
+
+    async def add(self, result: Optional[Dict]):
+        self.write(result)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with timed('parquet_write'):
+            batch = results_to_batch(self._buffer)
+            self._writer.write_batch(batch)
+        ROWS.inc('parquet_write', amount=batch.num_rows)
+        self.written += batch.num_rows
+        self._buffer = []
+
+    def close(self):
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _dataset(root: str) -> ds.Dataset:
+    return ds.dataset(root, format='parquet', schema=RESULT_SCHEMA.append(pa.field('run_date', pa.string())),
+                      partitioning=PARTITIONING)
+
+
+def read_results(root: str, columns: Iterable[str] = None, run_dates: Iterable[str] = None) -> pa.Table:
+    """
+    读取结果表，只扫描 columns 指定的列；run_dates 指定时只读这些分区
+    例：read_results('results', ['id', 'title']).to_pandas()
+    """
+    dataset = _dataset(root)
+    filter_expr = ds.field('run_date').isin(list(run_dates)) if run_dates else None
+    return dataset.to_table(columns=list(columns) if columns else None, filter=filter_expr)
+
+
+def iter_results(root: str, columns: Iterable[str] = None, run_dates: Iterable[str] = None,
+                 batch_size: int = 10000) -> Iterator[pa.RecordBatch]:
+    """逐批读取，内存中只保留一个batch"""
+    dataset = _dataset(root)
+    filter_expr = ds.field('run_date').isin(list(run_dates)) if run_dates else None
+    yield from dataset.to_batches(columns=list(columns) if columns else None, filter=filter_expr,
+                                  batch_size=batch_size)
@@ -0,0 +1,52 @@
+"""
+loguru日志配置与按页面抽样的调试日志
+
+导入本模块和使用 logger 的分析模块都不会添加任何sink、不会创建日志文件；
+只有入口脚本调用 configure() 时才按环境变量设置输出：
+- LOG_LEVEL：输出级别，默认 INFO，调试报告不会被格式化
+- LOG_FILE：另外写到这个文件（可用loguru的 {time}），默认不写文件
+- LOG_JSON=1：每条日志输出为一行JSON，绑定的 page_id 等字段在 extra 中
+- LOG_SAMPLE_RATE：输出逐元素调试报告的页面比例，默认 0；调试单个页面时设为 1
+
+逐元素的调试报告只对抽中的页面生成：page_logger() 对未抽中的页面返回None，
+调用方用 `if trace:` 跳过整段日志，参数和格式化都不会发生。
+"""
+import os
+import random
+import sys
+
+from loguru import logger
+
+LOG_LEVEL_ENV = 'LOG_LEVEL'
+LOG_FILE_ENV = 'LOG_FILE'
+LOG_JSON_ENV = 'LOG_JSON'
+LOG_SAMPLE_RATE_ENV = 'LOG_SAMPLE_RATE'
+
+_sample_rate = float(os.environ.get(LOG_SAMPLE_RATE_ENV, 0))
+
+
+def configure(level: str = None, log_file: str = None, serialize: bool = None, sample_rate: float = None):
+    """替换loguru默认的DEBUG级stderr输出；参数为None时读取对应的环境变量"""
+    global _sample_rate
+    level = level or os.environ.get(LOG_LEVEL_ENV, 'INFO')
+    log_file = log_file if log_file is not None else os.environ.get(LOG_FILE_ENV)
+    serialize = serialize if serialize is not None else os.environ.get(LOG_JSON_ENV) == '1'
+    if sample_rate is not None:
+        _sample_rate = sample_rate
+
+    logger.remove()
+    logger.add(sys.stderr, level=level, serialize=serialize)
+    if log_file:
+        logger.add(log_file, level=level, serialize=serialize)
+
+
+def page_logger(page_id=None, rate: float = None):
+    """按抽样率决定是否为这个页面输出调试报告，抽中时返回绑定了 page_id 的logger"""
+    rate = _sample_rate if rate is None else rate
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+    return logger.bind(page_id=page_id)
+
+
+def sample_rate() -> float:
+    return _sample_rate
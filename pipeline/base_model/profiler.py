@@ -0,0 +1,261 @@
+"""
+流水线剖析：--profile 目录 打开后，对抽样的一部分页面记录调用栈和内存分配
+
+- 调用栈：后台线程每隔 --profile-interval 秒取一次正在处理被抽中页面的线程的栈（sys._current_frames），
+  根帧为当前阶段（metrics.timed 的 stage，如 parse / clean / analyze / trafilatura），
+  输出折叠格式 stacks-<pid>.folded，可直接交给 flamegraph.pl 或 speedscope
+- 内存：被抽中的页面处理期间开启 tracemalloc，每个阶段退出时与进入时的快照比较，
+  累计各阶段新增且仍存活的分配位置，和各阶段的内存峰值，输出 allocations-<pid>.txt
+- summary-<pid>.json：剖析的页面数，各阶段的样本数、峰值，以及峰值最高的页面
+
+只有被抽中的页面会开启tracemalloc，其余页面没有额外开销。被抽中的页面按 contextvars 记录，
+同一事件循环线程上交错执行的多个页面各自维护阶段快照和峰值，一个页面结束或进入新阶段不会影响其他页面；
+但内存统计是整个进程的，页面处理中间有await时，同一线程上交错执行的其他页面的分配也会被计入。
+"""
+import argparse
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+import metrics
+
+DEFAULT_RATE = 0.1
+DEFAULT_MAX_PAGES = 200
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 25
+# summary 中列出峰值最高的页面数
+TOP_PAGES = 20
+TRACEMALLOC_FRAMES = 1
+# 不属于任何阶段的样本（框架代码、结果处理等）
+OTHER_STAGE = 'other'
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """给driver的命令行加上剖析相关参数"""
+    parser.add_argument('--profile', default=None, metavar='DIR',
+                        help='剖析一部分页面，把调用栈和内存分配写到这个目录')
+    parser.add_argument('--profile-rate', type=float, default=DEFAULT_RATE, help='剖析的页面比例')
+    parser.add_argument('--profile-max-pages', type=int, default=DEFAULT_MAX_PAGES, help='最多剖析多少个页面')
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL, help='调用栈采样间隔（秒）')
+    parser.add_argument('--profile-top', type=int, default=DEFAULT_TOP, help='每个阶段输出多少个分配位置')
+    return parser
+
+
+class _SampledPage:
+    """
+    一个被抽中的页面：所在线程，进入各阶段时的 [快照, 当时已用内存, 之前各次重置前看到的峰值]，
+    以及整个页面处理期间的内存峰值
+    """
+
+    __slots__ = ('page_id', 'thread_id', 'entered', 'peak')
+
+    def __init__(self, page_id, thread_id: int):
+        self.page_id = page_id
+        self.thread_id = thread_id
+        self.entered = []
+        self.peak = 0
+
+
+# 当前任务（或线程）正在处理的被抽中页面；asyncio的每个任务有自己的上下文，交错执行的页面互不覆盖
+_current_page: contextvars.ContextVar = contextvars.ContextVar('profiled_page', default=None)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def fold_stack(frame, root: str) -> Optional[str]:
+    """从根到叶用分号连接的一行，帧名中不含分号；正在执行剖析器自身（取内存快照）时返回None"""
+    names = []
+    while frame is not None:
+        if frame.f_code.co_filename == __file__:
+            return None
+        names.append(_frame_name(frame).replace(';', ':'))
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+
+class PipelineProfiler:
+    def __init__(self, directory: str, rate: float = DEFAULT_RATE, max_pages: int = DEFAULT_MAX_PAGES,
+                 interval: float = DEFAULT_INTERVAL, top: int = DEFAULT_TOP):
+        self.directory = directory
+        self.rate = rate
+        self.max_pages = max_pages
+        self.interval = interval
+        self.top = top
+        self.pages = 0
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)
+        self.allocations: Dict[str, Counter] = defaultdict(Counter)
+        self.allocation_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.peaks: Dict[str, int] = defaultdict(int)
+        self.page_peaks: Dict = {}
+        # 正在处理的被抽中页面，以及每个线程上有几个（采样只看这些线程）
+        self._pages = set()
+        self._threads: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_args(cls, args) -> Optional['PipelineProfiler']:
+        if not getattr(args, 'profile', None):
+            return None
+        return cls(args.profile, args.profile_rate, args.profile_max_pages, args.profile_interval, args.profile_top)
+
+    def start(self) -> 'PipelineProfiler':
+        global _active
+        os.makedirs(self.directory, exist_ok=True)
+        metrics.add_stage_listener(self)
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        metrics.remove_stage_listener(self)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if _active is self:
+            _active = None
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self.pages >= self.max_pages or random.random() >= self.rate:
+                return False
+            self.pages += 1
+            return True
+
+    @contextmanager
+    def page(self, page_id):
+        """包住一个页面的处理；未被抽中时什么都不做"""
+        if not self._take():
+            yield False
+            return
+        page = _SampledPage(page_id, threading.get_ident())
+        with self._lock:
+            if not self._pages:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._pages.add(page)
+            self._threads[page.thread_id] += 1
+        token = _current_page.set(page)
+        try:
+            yield True
+        finally:
+            _current_page.reset(token)
+            with self._lock:
+                self.page_peaks[page.page_id] = page.peak
+                self._pages.discard(page)
+                self._threads[page.thread_id] -= 1
+                if self._threads[page.thread_id] <= 0:
+                    del self._threads[page.thread_id]
+                # 最后一个被抽中的页面结束时才停止tracemalloc
+                if not self._pages and tracemalloc.is_tracing():
+                    tracemalloc.stop()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stage = metrics.current_stage(thread_id) or OTHER_STAGE
+                stack = fold_stack(frame, stage)
+                if stack is not None:
+                    self.stacks[stage][stack] += 1
+
+    def _page(self) -> Optional[_SampledPage]:
+        """当前上下文中本剖析器抽中的页面"""
+        page = _current_page.get()
+        return page if page is not None and page in self._pages else None
+
+    # metrics.timed 的监听接口，在页面自己的任务中调用
+    def stage_enter(self, stage: str):
+        page = self._page()
+        if page is None or not tracemalloc.is_tracing():
+            return
+        with self._lock:
+            # tracemalloc的峰值是全进程共用的；重置前先把当前峰值记到所有正在进行的阶段上，
+            # 这样一个页面进入新阶段时不会抹掉其他页面（或外层阶段）还没结束的峰值
+            peak = tracemalloc.get_traced_memory()[1]
+            for other in self._pages:
+                for entry in other.entered:
+                    entry[2] = max(entry[2], peak)
+            tracemalloc.reset_peak()
+        page.entered.append([tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[0], 0])
+
+    def stage_exit(self, stage: str):
+        page = self._page()
+        if page is None or not page.entered or not tracemalloc.is_tracing():
+            return
+        before, used_before, peak_before_reset = page.entered.pop()
+        peak = max(peak_before_reset, tracemalloc.get_traced_memory()[1]) - used_before
+        self.peaks[stage] = max(self.peaks[stage], peak)
+        page.peak = max(page.peak, peak)
+        after = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        for stat in after.compare_to(before, 'lineno'):
+            if stat.size_diff > 0:
+                site = str(stat.traceback[0])
+                self.allocations[stage][site] += stat.size_diff
+                self.allocation_counts[stage][site] += max(stat.count_diff, 0)
+
+    def write(self) -> Dict:
+        pid = os.getpid()
+        with open(os.path.join(self.directory, f'stacks-{pid}.folded'), 'w', encoding='utf8') as f:
+            for stage_stacks in self.stacks.values():
+                for stack, count in stage_stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        with open(os.path.join(self.directory, f'allocations-{pid}.txt'), 'w', encoding='utf8') as f:
+            for stage, sites in sorted(self.allocations.items(), key=lambda item: -sum(item[1].values())):
+                f.write(f'== {stage}: 峰值 {self.peaks[stage] / 1024:.1f} KiB, '
+                        f'存活新增 {sum(sites.values()) / 1024:.1f} KiB\n')
+                for site, size in sites.most_common(self.top):
+                    f.write(f'{size / 1024:12.1f} KiB {self.allocation_counts[stage][site]:8d} 块  {site}\n')
+                f.write('\n')
+        summary = {
+            'pages': self.pages,
+            'interval': self.interval,
+            'samples': {stage: sum(stacks.values()) for stage, stacks in self.stacks.items()},
+            'peak_kib': {stage: peak / 1024 for stage, peak in self.peaks.items()},
+            'top_page_peak_kib': {str(page_id): peak / 1024 for page_id, peak in
+                                  sorted(self.page_peaks.items(), key=lambda item: -item[1])[:TOP_PAGES]},
+        }
+        with open(os.path.join(self.directory, f'summary-{pid}.json'), 'w', encoding='utf8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+_active: Optional[PipelineProfiler] = None
+
+
+def get_profiler() -> Optional[PipelineProfiler]:
+    return _active
+
+
+def profile_page(page_id):
+    """driver中包住一个页面的处理；没有启动剖析时返回空上下文"""
+    if _active is None:
+        return nullcontext(False)
+    return _active.page(page_id)
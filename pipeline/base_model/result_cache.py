@@ -0,0 +1,205 @@
+"""
+按原始HTML摘要缓存提取结果
+
+result_text 完全相同的记录直接返回之前的提取结果，不再解析。
+键为 blake2b(命名空间 + HTML)，不同的提取流程使用不同的命名空间；命名空间还带上
+EXTRACTOR_VERSION 和影响结果的配置（块分类模型、站点模板库、近重复检测）的指纹，
+代码、模型或配置变化后旧结果不再命中。
+结果以JSON存在本地SQLite中，总大小超过上限时按最近使用时间淘汰。
+新结果和命中时间先记在内存里，攒够一批或隔一段时间才在一个事务中写库。
+"""
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# 缓存文件路径，设置后各driver在整个提取流程之前查缓存
+CACHE_PATH_ENV = 'RESULT_CACHE_PATH'
+# 缓存大小上限（MB）
+CACHE_MAX_MB_ENV = 'RESULT_CACHE_MAX_MB'
+DEFAULT_MAX_MB = 512
+# 淘汰时降到上限的这个比例以下，避免每次写入都触发淘汰
+EVICT_TO = 0.9
+# 提取逻辑（规则、阈值、输出字段）有改动时加一，之前缓存的结果全部失效
+EXTRACTOR_VERSION = 1
+# 内存中攒够这么多条新结果/命中，或距上次写库超过这么多秒时写库
+FLUSH_ROWS = 1000
+FLUSH_INTERVAL = 30.0
+
+
+def html_digest(html_content, namespace: str = '') -> str:
+    data = html_content.encode('utf8', 'surrogatepass') if isinstance(html_content, str) else html_content
+    digest = hashlib.blake2b(namespace.encode('utf8'), digest_size=16)
+    digest.update(b'\0')
+    digest.update(data or b'')
+    return digest.hexdigest()
+
+
+def config_fingerprint() -> str:
+    """
+    影响提取结果的配置的摘要：块分类模型按文件内容，站点模板库和近重复索引按路径和模式
+    （后两者在运行中不断积累，按内容计算会让每次运行的缓存都失效）
+    """
+    # 只取环境变量名；打开缓存时才导入，不开缓存的运行不付出导入时间
+    from block_classifier import MODEL_PATH_ENV
+    from near_duplicate import INDEX_PATH_ENV, MODE_ENV
+    from site_template import TEMPLATE_DB_ENV
+
+    digest = hashlib.blake2b(digest_size=8)
+    for name in (MODEL_PATH_ENV, TEMPLATE_DB_ENV, INDEX_PATH_ENV, MODE_ENV):
+        digest.update(f'{name}={os.environ.get(name, "")}\0'.encode('utf8'))
+    model_path = os.environ.get(MODEL_PATH_ENV)
+    if model_path and os.path.exists(model_path):
+        with open(model_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """以HTML摘要为键的磁盘结果缓存，统计本次运行的命中率"""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}   # 摘要 -> 正在处理的页面的Future
+        self._staged = {}    # 摘要 -> (JSON, 大小, 时间)，还没写库的新结果
+        self._touched = {}   # 摘要 -> 最近命中时间，还没写库的 last_used
+        self._last_flush = time.monotonic()
+        # 配置在进程启动时确定，只计算一次
+        self.fingerprint = f'v{EXTRACTOR_VERSION}:{config_fingerprint()}'
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                digest TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def flush(self):
+        """在一个事务中写入内存中的新结果和命中时间"""
+        self._last_flush = time.monotonic()
+        if not self._staged and not self._touched:
+            return
+        staged, self._staged = self._staged, {}
+        touched, self._touched = self._touched, {}
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO results (digest, result, size, last_used) VALUES (?, ?, ?, ?)',
+                ((digest, payload, size, used) for digest, (payload, size, used) in staged.items())
+            )
+            self.conn.executemany('UPDATE results SET last_used = ? WHERE digest = ?',
+                                  ((used, digest) for digest, used in touched.items()))
+
+    def _maybe_flush(self):
+        if (len(self._staged) + len(self._touched) >= FLUSH_ROWS
+                or time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+            self.flush()
+
+    def key(self, html_content, namespace: str = '') -> str:
+        """缓存键：命名空间带上提取器版本和配置指纹"""
+        return html_digest(html_content, f'{namespace}:{self.fingerprint}')
+
+    def get(self, digest: str) -> Optional[Dict]:
+        staged = self._staged.get(digest)
+        if staged is not None:
+            payload = staged[0]
+        else:
+            row = self.conn.execute('SELECT result FROM results WHERE digest = ?', (digest,)).fetchone()
+            if row is None:
+                return None
+            payload = row[0]
+            self._touched[digest] = time.time()
+            self._maybe_flush()
+        return json.loads(payload)
+
+    def put(self, digest: str, result: Dict):
+        payload = json.dumps(result, ensure_ascii=False, default=list)
+        size = len(payload.encode('utf8'))
+        if digest in self._staged:
+            old_size = self._staged[digest][1]
+        else:
+            old = self.conn.execute('SELECT size FROM results WHERE digest = ?', (digest,)).fetchone()
+            old_size = old[0] if old else 0
+        self._staged[digest] = (payload, size, time.time())
+        self.total_bytes += size - old_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        else:
+            self._maybe_flush()
+
+    def _evict(self):
+        """按最近使用时间从旧到新删除，直到总大小低于上限的 EVICT_TO"""
+        # 先写库，按库中完整的 last_used 排序
+        self.flush()
+        target = self.max_bytes * EVICT_TO
+        freed = 0
+        doomed = []
+        for digest, size in self.conn.execute('SELECT digest, size FROM results ORDER BY last_used'):
+            if self.total_bytes - freed <= target:
+                break
+            doomed.append((digest,))
+            freed += size
+        with self.conn:
+            self.conn.executemany('DELETE FROM results WHERE digest = ?', doomed)
+        self.total_bytes -= freed
+
+    async def run(self, data: Dict, process: Callable[[Dict], Awaitable[Optional[Dict]]],
+                  namespace: str = '') -> Optional[Dict]:
+        """命中时返回缓存的结果（id换成当前记录），否则调用 process 并写入缓存"""
+        digest = self.key(data['result_text'], namespace)
+        pending = self._pending.get(digest)
+        cached = await pending if pending is not None else self.get(digest)
+        if cached is not None:
+            self.hits += 1
+            return dict(cached, id=data['id'])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[digest] = future
+        try:
+            result = await process(data)
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            self._pending.pop(digest, None)
+        future.set_result(result)
+        if result is not None:
+            self.put(digest, result)
+        return result
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+_default_cache = None
+
+
+def get_result_cache():
+    """按环境变量 RESULT_CACHE_PATH 打开缓存（只打开一次），未配置时返回None"""
+    global _default_cache
+    path = os.environ.get(CACHE_PATH_ENV)
+    if not path:
+        return None
+    if _default_cache is None:
+        max_mb = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_MAX_MB))
+        _default_cache = ResultCache(path, int(max_mb * 1024 * 1024))
+        # 进程结束时写完内存中的新结果和命中时间
+        atexit.register(_default_cache.flush)
+    return _default_cache
@@ -0,0 +1,229 @@
+"""
+分片并行处理 details_test_table
+
+把表按 id % N 切成N个分片，每个分片起一个driver子进程（各自的数据库连接和输出文件），
+全部完成后合并成一个结果文件。分片状态记录在本地目录的 shards.json 中，
+失败的分片可以单独重试；多台机器可以用 --only 各跑一部分分片，再把分片输出拷到一起 merge。
+driver参数带 --parquet 时各分片直接追加写到同一个Parquet数据集，不输出分片JSON，
+分片是否成功只看子进程的返回码，merge 时跳过这些分片。
+
+用法：
+    python pipeline/base_model/sharded_runner.py run --driver plan_b_fromdb.py --shards 16 --workers 4
+    python pipeline/base_model/sharded_runner.py run --driver plan_b_fromdb.py --shards 16 --only 0-7
+    python pipeline/base_model/sharded_runner.py status
+    python pipeline/base_model/sharded_runner.py merge --output data.json
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+DEFAULT_STATE_DIR = 'shards'
+STATE_FILE = 'shards.json'
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+class ShardCoordinator:
+    """在本地目录中记录每个分片的状态、重试次数和输出文件"""
+
+    def __init__(self, state_dir: str = DEFAULT_STATE_DIR):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, STATE_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        self.state = self._read()
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {'shards': 0, 'driver': None, 'items': {}}
+        with open(self.path, encoding='utf8') as f:
+            return json.load(f)
+
+    def _write(self):
+        # 先写临时文件再替换，进程中途被杀也不会留下半个状态文件
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def init(self, shards: int, driver: str):
+        """第一次运行时登记分片；分片数或driver变了需要换一个状态目录"""
+        with self._lock:
+            if self.state['items']:
+                if self.state['shards'] != shards or self.state['driver'] != driver:
+                    raise ValueError(
+                        f"{self.path} 记录的是 {self.state['driver']} 的 {self.state['shards']} 个分片，"
+                        f"与本次参数不一致，请使用新的 --state-dir"
+                    )
+                return
+            self.state = {
+                'shards': shards,
+                'driver': driver,
+                'items': {str(i): {'status': PENDING, 'attempts': 0} for i in range(shards)},
+            }
+            self._write()
+
+    def output_path(self, shard: int) -> str:
+        return os.path.join(self.state_dir, f'part-{shard:05d}.json')
+
+    def log_path(self, shard: int) -> str:
+        return os.path.join(self.state_dir, f'part-{shard:05d}.log')
+
+    def update(self, shard: int, **fields):
+        with self._lock:
+            self.state['items'][str(shard)].update(fields)
+            self._write()
+
+    def todo(self, only: Optional[List[int]] = None) -> List[int]:
+        """未完成的分片；上次运行中断时处于running的分片也要重跑"""
+        shards = [int(k) for k, v in self.state['items'].items() if v['status'] != DONE]
+        if only is not None:
+            shards = [s for s in shards if s in only]
+        return sorted(shards)
+
+    def summary(self) -> Dict[str, int]:
+        counts = {}
+        for item in self.state['items'].values():
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return counts
+
+
+def parse_shard_list(spec: Optional[str]) -> Optional[List[int]]:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    if not spec:
+        return None
+    shards = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shards.extend(range(int(start), int(end) + 1))
+        elif part:
+            shards.append(int(part))
+    return shards
+
+
+def parquet_root(driver_args: List[str]) -> Optional[str]:
+    """driver参数中的 --parquet 路径，没有时返回None"""
+    for i, arg in enumerate(driver_args):
+        if arg == '--parquet' and i + 1 < len(driver_args):
+            return driver_args[i + 1]
+        if arg.startswith('--parquet='):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def _remove_parquet_parts(root: str, pid: int):
+    """删除失败的子进程写了一半的Parquet文件（文件名以写入进程的pid结尾），重试时不会重复写入"""
+    for path in glob.glob(os.path.join(root, '*', f'part-*-{pid}.parquet')):
+        os.remove(path)
+
+
+def run_shard(coordinator: ShardCoordinator, shard: int, driver_args: List[str], retries: int) -> bool:
+    """起driver子进程处理一个分片，失败时重试，返回是否成功"""
+    state = coordinator.state
+    command = [
+        sys.executable, state['driver'],
+        '--shards', str(state['shards']), '--shard', str(shard),
+        '--output', coordinator.output_path(shard),
+    ] + driver_args
+    parquet = parquet_root(driver_args)
+    for _ in range(retries + 1):
+        attempts = state['items'][str(shard)]['attempts'] + 1
+        coordinator.update(shard, status=RUNNING, attempts=attempts, started_at=time.time(), parquet=parquet)
+        if os.path.exists(coordinator.output_path(shard)):
+            # 上次失败的尝试可能留下了不完整的输出
+            os.remove(coordinator.output_path(shard))
+        with open(coordinator.log_path(shard), 'a', encoding='utf8') as log:
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+            returncode = process.wait()
+        # 写Parquet时driver不输出JSON，只按返回码判断
+        if returncode == 0 and (parquet or os.path.exists(coordinator.output_path(shard))):
+            coordinator.update(shard, status=DONE, finished_at=time.time(), returncode=0)
+            return True
+        if parquet:
+            _remove_parquet_parts(parquet, process.pid)
+        coordinator.update(shard, status=FAILED, finished_at=time.time(), returncode=returncode)
+    return False
+
+
+def run(coordinator: ShardCoordinator, workers: int, driver_args: List[str], retries: int = 1,
+        only: Optional[List[int]] = None) -> bool:
+    shards = coordinator.todo(only)
+    print(f"待处理分片 {len(shards)} 个，并行 {workers} 个进程")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda shard: run_shard(coordinator, shard, driver_args, retries), shards))
+    print(f"分片状态: {coordinator.summary()}")
+    return all(results)
+
+
+def merge(state_dirs: List[str], output: str) -> int:
+    """
+    把一个或多个状态目录中已完成分片的输出按分片号合并成一个JSON列表
+    结果写到Parquet数据集的分片没有JSON输出，直接跳过
+    """
+    merged = []
+    for state_dir in state_dirs:
+        coordinator = ShardCoordinator(state_dir)
+        missing = coordinator.todo()
+        if missing:
+            print(f"{state_dir} 中还有未完成的分片: {missing}")
+        for key, item in sorted(coordinator.state['items'].items(), key=lambda kv: int(kv[0])):
+            if item['status'] != DONE:
+                continue
+            if item.get('parquet'):
+                print(f"分片 {key} 的结果在Parquet数据集 {item['parquet']} 中，不合并")
+                continue
+            with open(coordinator.output_path(int(key)), encoding='utf8') as f:
+                merged.extend(json.load(f))
+    with open(output, 'w', encoding='utf8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+    return len(merged)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='分片并行处理 details_test_table')
+    parser.add_argument('--state-dir', default=DEFAULT_STATE_DIR, help='分片状态和输出目录')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='处理未完成的分片')
+    run_parser.add_argument('--driver', required=True, help='plan_b_fromdb.py 或 html_break_down_from_DB.py')
+    run_parser.add_argument('--shards', type=int, required=True, help='分片总数')
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数')
+    run_parser.add_argument('--retries', type=int, default=1, help='每个分片失败后的重试次数')
+    run_parser.add_argument('--only', default=None, help='只处理这些分片，如 0-7,12')
+    run_parser.add_argument('--output', default=None, help='全部完成后合并到这个文件')
+
+    subparsers.add_parser('status', help='查看分片状态')
+
+    merge_parser = subparsers.add_parser('merge', help='合并分片输出')
+    merge_parser.add_argument('--output', default='data.json')
+    merge_parser.add_argument('--from', dest='sources', nargs='*', default=None,
+                              help='要合并的状态目录，默认为 --state-dir')
+
+    # run 之后未识别的参数原样传给driver，如 --concurrency 8 --incremental
+    args, driver_args = parser.parse_known_args()
+    if args.command != 'run' and driver_args:
+        parser.error(f"未识别的参数: {' '.join(driver_args)}")
+
+    if args.command == 'run':
+        coordinator = ShardCoordinator(args.state_dir)
+        coordinator.init(args.shards, args.driver)
+        ok = run(coordinator, args.workers, driver_args, args.retries, parse_shard_list(args.only))
+        if ok and args.output and not coordinator.todo():
+            print(f"合并 {merge([args.state_dir], args.output)} 条结果到 {args.output}")
+        sys.exit(0 if ok else 1)
+    elif args.command == 'status':
+        coordinator = ShardCoordinator(args.state_dir)
+        print(json.dumps(coordinator.state, ensure_ascii=False, indent=2))
+        print(coordinator.summary())
+    else:
+        count = merge(args.sources or [args.state_dir], args.output)
+        print(f"合并 {count} 条结果到 {args.output}")
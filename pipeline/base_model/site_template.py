@@ -0,0 +1,240 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+# 规则库路径，设置后 print_analysis 对学到模板的站点直接按XPath取正文
+TEMPLATE_DB_ENV = 'SITE_TEMPLATE_DB'
+
+# 同一站点分析满这么多页面后开始学习模板
+MIN_PAGES = 5
+# XPath在至少这个比例的页面中出现才算稳定
+STABILITY = 0.8
+# 连续这么多页面不匹配模板时丢弃模板，重新学习
+MAX_MISSES = 3
+
+# 模板命中只在内存中记录，攒够这么多站点或距上次写入超过这么多秒时再写库
+HIT_FLUSH_HOSTS = 1000
+HIT_FLUSH_INTERVAL = 30.0
+
+# 这些角色的元素记为页头/导航/页脚等模板部分
+BOILERPLATE_ROLES = frozenset({'页头', '导航', '页脚', '侧边栏', '头部'})
+
+_CANONICAL = re.compile(
+    r'<link[^>]+rel\s*=\s*["\']?canonical["\']?[^>]*href\s*=\s*["\']([^"\']+)'
+    r'|<link[^>]+href\s*=\s*["\']([^"\']+)["\'][^>]*rel\s*=\s*["\']?canonical'
+    r'|<meta[^>]+property\s*=\s*["\']og:url["\'][^>]*content\s*=\s*["\']([^"\']+)'
+    r'|<meta[^>]+content\s*=\s*["\']([^"\']+)["\'][^>]*property\s*=\s*["\']og:url',
+    re.IGNORECASE
+)
+
+
+def site_host(html_content: str, url: str = None) -> Optional[str]:
+    """站点标识：优先使用记录里的url，否则取页面的canonical链接或og:url"""
+    if not url and html_content:
+        match = _CANONICAL.search(html_content[:20000])
+        if match:
+            url = next(group for group in match.groups() if group)
+    if not url:
+        return None
+    host = urlparse(url if '//' in url else '//' + url).hostname
+    if not host:
+        return None
+    return host[4:] if host.startswith('www.') else host
+
+
+def element_signature(tag: str, element_id: str, classes: Iterable[str]) -> str:
+    """用标签、id和class标识一个容器，XPath相同但签名变了说明页面结构已经改版"""
+    return f"{tag}#{element_id or ''}.{'.'.join(classes or [])}"
+
+
+def _lxml_signature(element) -> str:
+    return element_signature(element.tag, element.get('id', ''), (element.get('class') or '').split())
+
+
+class SiteTemplateStore:
+    """
+    按站点学习页面模板并保存在本地SQLite中
+    每分析完一个页面调用 observe 记录正文块和页头/导航/页脚块的XPath，
+    同一站点满 min_pages 页后，出现比例达到 stability 的XPath组成模板；
+    之后的页面用 apply 直接按模板XPath取正文，不匹配时返回None由调用方做完整分析
+    """
+
+    def __init__(self, path: str, min_pages: int = MIN_PAGES, stability: float = STABILITY,
+                 max_misses: int = MAX_MISSES):
+        self.path = path
+        self.min_pages = min_pages
+        self.stability = stability
+        self.max_misses = max_misses
+        self.hits = 0
+        self.misses = 0
+        self._templates = {}
+        # 上次写库后命中过模板的站点，写库时把它们的连续不匹配次数清零
+        self._hit_hosts = set()
+        self._last_hit_flush = time.monotonic()
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS site_pages (
+                host TEXT PRIMARY KEY,
+                pages INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS site_xpaths (
+                host TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                xpath TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (host, kind, xpath, signature)
+            );
+            CREATE TABLE IF NOT EXISTS site_templates (
+                host TEXT PRIMARY KEY,
+                template TEXT NOT NULL,
+                learned_at REAL NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.flush_hits()
+        self.conn.close()
+
+    def flush_hits(self):
+        """把内存中记录的命中写库：命中过的站点连续不匹配次数清零"""
+        self._last_hit_flush = time.monotonic()
+        if not self._hit_hosts:
+            return
+        hosts, self._hit_hosts = self._hit_hosts, set()
+        with self.conn:
+            self.conn.executemany('UPDATE site_pages SET misses = 0 WHERE host = ?', ((host,) for host in hosts))
+
+    def template(self, host: str) -> Optional[Dict]:
+        """读取站点模板，没有时返回None"""
+        if host not in self._templates:
+            row = self.conn.execute('SELECT template FROM site_templates WHERE host = ?', (host,)).fetchone()
+            self._templates[host] = json.loads(row[0]) if row else None
+        return self._templates[host]
+
+    def observe(self, host: str, results: Dict, content_xpaths: Iterable[str]) -> Optional[Dict]:
+        """记录一次完整分析的结果，满足条件时学习模板并返回"""
+        content_xpaths = set(content_xpaths)
+        rows = []
+        for elem in list(results.get('first_level', [])) + list(results.get('second_level', [])):
+            if elem['xpath'] in content_xpaths:
+                kind = 'content'
+            elif elem.get('role') in BOILERPLATE_ROLES:
+                kind = 'boilerplate'
+            else:
+                continue
+            signature = element_signature(elem['tag'], elem.get('id', ''), elem.get('classes', []))
+            rows.append((host, kind, elem['xpath'], signature))
+
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO site_pages (host, pages) VALUES (?, 1) '
+                'ON CONFLICT(host) DO UPDATE SET pages = pages + 1', (host,)
+            )
+            self.conn.executemany(
+                'INSERT INTO site_xpaths (host, kind, xpath, signature, hits) VALUES (?, ?, ?, ?, 1) '
+                'ON CONFLICT(host, kind, xpath, signature) DO UPDATE SET hits = hits + 1', set(rows)
+            )
+        if self.template(host) is None:
+            return self._learn(host)
+        return None
+
+    def _learn(self, host: str) -> Optional[Dict]:
+        pages = self.conn.execute('SELECT pages FROM site_pages WHERE host = ?', (host,)).fetchone()[0]
+        if pages < self.min_pages:
+            return None
+        stable = self.conn.execute(
+            'SELECT kind, xpath, signature FROM site_xpaths WHERE host = ? AND hits >= ? ORDER BY xpath',
+            (host, pages * self.stability)
+        ).fetchall()
+        template = {'content': [], 'boilerplate': []}
+        for kind, xpath, signature in stable:
+            template[kind].append({'xpath': xpath, 'signature': signature})
+        if not template['content']:
+            return None
+        template['pages'] = pages
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO site_templates (host, template, learned_at) VALUES (?, ?, ?)',
+                (host, json.dumps(template, ensure_ascii=False), time.time())
+            )
+            self.conn.execute('UPDATE site_pages SET misses = 0 WHERE host = ?', (host,))
+        self._templates[host] = template
+        return template
+
+    def apply(self, host: str, selector) -> Optional[List[str]]:
+        """
+        按模板XPath定位正文容器，返回容器的XPath列表
+        任一正文容器不存在或签名变化时视为模板失效，返回None
+        """
+        template = self.template(host)
+        if template is None:
+            return None
+        xpaths = []
+        for block in template['content']:
+            found = selector.xpath(block['xpath'])
+            if not found or _lxml_signature(found[0]) != block['signature']:
+                self._record_miss(host)
+                return None
+            xpaths.append(block['xpath'])
+        self.hits += 1
+        # 热路径上不写库，命中攒起来批量写
+        self._hit_hosts.add(host)
+        if (len(self._hit_hosts) >= HIT_FLUSH_HOSTS
+                or time.monotonic() - self._last_hit_flush >= HIT_FLUSH_INTERVAL):
+            self.flush_hits()
+        return xpaths
+
+    def _record_miss(self, host: str):
+        """连续不匹配超过 max_misses 次后丢弃模板和统计，从头学习改版后的页面"""
+        self.misses += 1
+        with self.conn:
+            if host in self._hit_hosts:
+                # 上次命中还没写库：不匹配次数从命中之后重新计
+                self._hit_hosts.discard(host)
+                self.conn.execute('UPDATE site_pages SET misses = 0 WHERE host = ?', (host,))
+            self.conn.execute('UPDATE site_pages SET misses = misses + 1 WHERE host = ?', (host,))
+            misses = self.conn.execute('SELECT misses FROM site_pages WHERE host = ?', (host,)).fetchone()[0]
+            if misses >= self.max_misses:
+                self.conn.execute('DELETE FROM site_templates WHERE host = ?', (host,))
+                self.conn.execute('DELETE FROM site_xpaths WHERE host = ?', (host,))
+                self.conn.execute('DELETE FROM site_pages WHERE host = ?', (host,))
+                self._templates[host] = None
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+_default_store = None
+
+
+def get_template_store():
+    """按环境变量 SITE_TEMPLATE_DB 打开规则库（只打开一次），未配置时返回None"""
+    global _default_store
+    path = os.environ.get(TEMPLATE_DB_ENV)
+    if not path:
+        return None
+    if _default_store is None:
+        _default_store = SiteTemplateStore(path)
+        # 进程结束时写完内存中的命中
+        atexit.register(_default_store.flush_hits)
+    return _default_store
+
+
+def extract_video_links(selector) -> List[str]:
+    """与 XPathHTMLAnalyzer.get_video_links 相同的视频链接提取，直接在lxml树上完成"""
+    video_links = []
+    for tag in selector.xpath('//body//*[self::video or self::iframe or self::embed]'):
+        for attr in ('src', 'srcdoc', 'data-src'):
+            if attr in tag.attrib:
+                video_links.append(tag.get(attr))
+                break
+    return video_links
@@ -0,0 +1,272 @@
+"""
+可切换的存储后端
+
+driver只通过 StorageBackend 的接口读取 details_test_table、写回结果和记录水位，
+具体用MySQL（db.Database）还是PostgreSQL（pg_storage.PostgresBackend）
+由 --backend 参数或 STORAGE_BACKEND 环境变量决定。
+"""
+import abc
+import asyncio
+import inspect
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional
+
+from metrics import ROWS, STAGE_SECONDS, timed
+
+BACKEND_ENV = 'STORAGE_BACKEND'
+BACKENDS = ('mysql', 'postgres')
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 1.0
+# 同时在处理的批数上限，达到上限时暂停从游标读取
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+def add_arguments(parser):
+    """给driver的命令行加上存储后端和结果写回相关参数"""
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get(BACKEND_ENV, 'mysql'),
+                        help=f'存储后端，默认读取环境变量 {BACKEND_ENV}')
+    parser.add_argument('--archive', default=None,
+                        help='从本地页面归档（page_archive.py）读取页面，不连数据库读')
+    parser.add_argument('--raw-pages', action='store_true',
+                        help='按字节读取页面，由 page_decoding.py 判断编码解码，不用数据库驱动解码')
+    parser.add_argument('--write-results', action='store_true', help='把结果批量写回结果表')
+    parser.add_argument('--parquet', default=None,
+                        help='把结果追加写到这个目录下按日期分区的Parquet文件（parquet_results.py），代替JSON输出')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每次批量写入的行数')
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help='缓冲区不满时最长多少秒写一次')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help='同时在处理的批数上限，处理跟不上时暂停读取，内存不随表的大小增长')
+    return parser
+
+
+async def process_batches(batches, process, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, on_read=None):
+    """
+    边读边处理 stream/stream_archive 产出的批：最多 max_in_flight 批同时在处理，满了就等其中一批完成再读下一批；
+    按完成顺序产出 (批, 结果)，处理抛出的异常作为结果产出。on_read 在每批读出时按读取顺序调用
+    """
+    pending = {}
+
+    async def finished():
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            batch = pending.pop(task)
+            try:
+                yield batch, task.result()
+            except Exception as e:
+                yield batch, e
+
+    async for batch in batches:
+        while len(pending) >= max_in_flight:
+            async for item in finished():
+                yield item
+        if on_read is not None:
+            on_read(batch)
+        pending[asyncio.create_task(process(batch))] = batch
+    while pending:
+        async for item in finished():
+            yield item
+
+
+async def open_backend(name: str = None, **options) -> 'StorageBackend':
+    """按名字创建后端；只导入用到的驱动"""
+    name = name or os.environ.get(BACKEND_ENV, 'mysql')
+    if name == 'mysql':
+        from db import Database
+        return await Database.create(**options)
+    if name == 'postgres':
+        from pg_storage import PostgresBackend
+        return await PostgresBackend.create(**options)
+    raise ValueError(f"未知的存储后端: {name}")
+
+
+class PoolMetrics:
+    """连接池的等待时间统计"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._waits = []
+
+    def record(self, wait: float):
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._waits.append(wait)
+
+    def percentile(self, q: float) -> float:
+        if not self._waits:
+            return 0.0
+        waits = sorted(self._waits)
+        return waits[min(len(waits) - 1, int(q * len(waits)))]
+
+    def report(self) -> Dict:
+        return {
+            'acquired': self.acquired,
+            'avg_wait_ms': self.total_wait / self.acquired * 1e3 if self.acquired else 0.0,
+            'p95_wait_ms': self.percentile(0.95) * 1e3,
+            'max_wait_ms': self.max_wait * 1e3,
+        }
+
+
+async def close_all(*resources):
+    """
+    依次关闭输出、归档等资源（close 可以是普通方法或协程），跳过None
+    某个关闭失败时其余的仍然关闭，最后抛出第一个异常
+    """
+    error = None
+    for resource in resources:
+        if resource is None:
+            continue
+        try:
+            closing = resource.close()
+            if inspect.isawaitable(closing):
+                await closing
+        except Exception as e:
+            if error is None:
+                error = e
+            else:
+                logging.exception(f"关闭 {type(resource).__name__} 失败")
+    if error is not None:
+        raise error
+
+
+class StorageBackend(abc.ABC):
+    """存储后端的公共部分：带等待时间统计的连接获取；子类实现具体的读写"""
+
+    dialect = None
+
+    def __init__(self):
+        self.metrics = PoolMetrics()
+
+    @abc.abstractmethod
+    async def _acquire(self):
+        """从连接池取一个连接"""
+
+    @abc.abstractmethod
+    async def _release(self, conn):
+        """把连接还给连接池"""
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        conn = await self._acquire()
+        wait = time.perf_counter() - start
+        self.metrics.record(wait)
+        STAGE_SECONDS.observe('db_acquire', value=wait)
+        try:
+            yield conn
+        finally:
+            await self._release(conn)
+
+    @abc.abstractmethod
+    def build_query(self, column='id', since=None, ids=(), shard=0, shards=1, raw=False):
+        """生成读取 details_test_table 的查询，返回 (sql, 参数)；raw 为True时 result_text 读成字节"""
+
+    @abc.abstractmethod
+    def stream(self, sql: str, params=None, batch_size: int = 100):
+        """用服务端游标逐批读取，每次产出一个dict列表；子类实现为异步生成器"""
+
+    @abc.abstractmethod
+    async def load_watermark(self, job: str, column: str) -> Optional[str]:
+        """读取任务的水位，没有时返回None"""
+
+    @abc.abstractmethod
+    async def save_watermark(self, job: str, column: str, watermark) -> None:
+        """保存任务的水位"""
+
+    @abc.abstractmethod
+    async def load_failures(self, job: str) -> Dict[int, int]:
+        """读取任务中各行累计的失败次数"""
+
+    @abc.abstractmethod
+    async def save_failures(self, job: str, attempts: Dict[int, int], cleared: Iterable[int]) -> None:
+        """写入各行的失败次数，删除 cleared 中重试成功的行"""
+
+    @abc.abstractmethod
+    def result_writer(self, batch_size: int = DEFAULT_BATCH_SIZE,
+                      flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> 'BufferedResultWriter':
+        """创建写回结果表的 BufferedResultWriter，调用方负责 start/close"""
+
+    @abc.abstractmethod
+    async def close(self):
+        """关闭连接池"""
+
+
+class BufferedResultWriter(abc.ABC):
+    """
+    缓冲提取结果批量写回
+    add 只把结果放进缓冲区；缓冲区满 batch_size 条或距离上次写入超过 flush_interval 秒时，
+    调用子类的 _write_rows 一次写入，写入时才占用连接
+    """
+
+    def __init__(self, backend: StorageBackend, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.flushes = 0
+        self._buffer: List[tuple] = []
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopped = asyncio.Event()
+
+    @abc.abstractmethod
+    async def _create_table(self):
+        """结果表不存在时创建"""
+
+    @abc.abstractmethod
+    async def _write_rows(self, rows: List[tuple]):
+        """写入 (id, 结果JSON字符串) 列表，同一id以后出现的为准"""
+
+    async def start(self) -> 'BufferedResultWriter':
+        await self._create_table()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def add(self, result: Optional[Dict]):
+        if not result:
+            return
+        self._buffer.append((result['id'], json.dumps(result, ensure_ascii=False, default=list)))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def _flush_periodically(self):
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                # 数据库暂时不可用时行还在缓冲区，下一轮重试，定时写入不能因此停止
+                logging.warning(f"结果写回失败，{len(self._buffer)} 行留在缓冲区稍后重试: {e}")
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows = self._buffer[:]
+            with timed('db_write'):
+                await self._write_rows(rows)
+            # 写入成功后才从缓冲区删除；写入失败时行留在缓冲区，下次flush重试
+            del self._buffer[:len(rows)]
+            ROWS.inc('db_write', amount=len(rows))
+            self.written += len(rows)
+            self.flushes += 1
+
+    async def close(self):
+        """停止定时写入并写完剩余结果；不取消正在进行的写入"""
+        self._stopped.set()
+        if self._flusher is not None:
+            await self._flusher
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,106 @@
+"""
+结果写入速度对比：各存储后端的批量写入 vs 逐行insert
+
+    python storage_benchmark.py --backends mysql postgres --rows 20000 --batch-size 500
+
+写入 <结果表>_bench 表，结束后删除。每种方式输出 行/秒。
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import storage
+
+
+def make_results(rows: int, content_size: int):
+    body = '黑龙江日报讯 高温、高压、高转速下可靠、持久的运转。' * (content_size // 26 + 1)
+    return [
+        {
+            'id': i,
+            'title': f'测试标题 {i}',
+            'content': body[:content_size],
+            'date': '2024-10-25 08:00:00',
+            'author': '记者 张三',
+            'videos': [],
+        }
+        for i in range(rows)
+    ]
+
+
+async def _bulk(backend, results, batch_size):
+    writer = backend.result_writer(batch_size=batch_size, flush_interval=3600)
+    writer.table += '_bench'
+    await writer.start()
+    start = time.perf_counter()
+    for result in results:
+        await writer.add(result)
+    await writer.close()
+    return time.perf_counter() - start, writer.table
+
+
+async def _row_by_row(backend, results, table):
+    """对照组：每条结果一条insert语句，全部在一个事务中，只比较语句条数的差别"""
+    start = time.perf_counter()
+    async with backend.acquire() as conn:
+        if backend.dialect == 'postgres':
+            async with conn.transaction():
+                for result in results:
+                    await conn.execute(
+                        f'insert into {table} (id, result) values ($1, $2) '
+                        f'on conflict (id) do update set result = excluded.result',
+                        result['id'], json.dumps(result, ensure_ascii=False)
+                    )
+        else:
+            await conn.begin()
+            async with conn.cursor() as cursor:
+                for result in results:
+                    await cursor.execute(
+                        f'insert into {table} (id, result) values (%s, %s) '
+                        f'on duplicate key update result = values(result)',
+                        (result['id'], json.dumps(result, ensure_ascii=False))
+                    )
+            await conn.commit()
+    return time.perf_counter() - start
+
+
+async def _drop(backend, table):
+    async with backend.acquire() as conn:
+        if backend.dialect == 'postgres':
+            await conn.execute(f'drop table if exists {table}')
+        else:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f'drop table if exists {table}')
+            await conn.commit()
+
+
+async def run(backends, rows, batch_size, content_size):
+    results = make_results(rows, content_size)
+    report = {}
+    for name in backends:
+        backend = await storage.open_backend(name)
+        try:
+            bulk_seconds, table = await _bulk(backend, results, batch_size)
+            # 逐行写入较慢，只取十分之一的行；id接在批量写入的行之后，两边都是插入新行而不是更新
+            sample = [dict(result, id=result['id'] + rows) for result in results[:max(1, rows // 10)]]
+            row_seconds = await _row_by_row(backend, sample, table)
+            await _drop(backend, table)
+        finally:
+            await backend.close()
+        report[name] = {
+            'bulk_rows_per_sec': rows / bulk_seconds,
+            'row_by_row_rows_per_sec': len(sample) / row_seconds,
+        }
+        report[name]['speedup'] = report[name]['bulk_rows_per_sec'] / report[name]['row_by_row_rows_per_sec']
+        print(name, json.dumps(report[name], ensure_ascii=False))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='存储后端写入速度对比')
+    parser.add_argument('--backends', nargs='+', choices=storage.BACKENDS, default=list(storage.BACKENDS))
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--content-size', type=int, default=2000, help='每条结果正文的字符数')
+    args = parser.parse_args()
+    asyncio.run(run(args.backends, args.rows, args.batch_size, args.content_size))
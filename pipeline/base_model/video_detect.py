@@ -3,6 +3,12 @@ from bs4 import BeautifulSoup, Tag
 from typing import Dict, List, Tuple
 from collections import defaultdict
 
+# contains_video_player 预筛使用的标记（全部小写，按字节匹配）
+VIDEO_TAG_MARKERS = (b'<iframe', b'<embed')
+VIDEO_HOSTS = (b'youtube', b'youku', b'bilibili', b'vimeo', b'iqiyi')
+VIDEO_TAG_MARKERS_STR = tuple(m.decode('ascii') for m in VIDEO_TAG_MARKERS)
+VIDEO_HOSTS_STR = tuple(h.decode('ascii') for h in VIDEO_HOSTS)
+
 class XPathHTMLAnalyzer:
     """分析HTML中body下两层深度的元素结构，生成XPath，分析链接和文本比例，以及检测视频播放器"""
     
@@ -307,25 +313,51 @@ class XPathHTMLAnalyzer:
             "video_player_count": len(video_players)
         }
 
+    def may_contain_video_player(self, html_content) -> bool:
+        """字节级预筛：不解析DOM，只在原始HTML中查找播放器标签和已知视频站点"""
+        if not html_content:
+            return False
+        if isinstance(html_content, str):
+            raw = html_content.lower()
+            tag_markers, video_marker, hosts = VIDEO_TAG_MARKERS_STR, '<video', VIDEO_HOSTS_STR
+        else:
+            raw = bytes(html_content).lower()
+            tag_markers, video_marker, hosts = VIDEO_TAG_MARKERS, b'<video', VIDEO_HOSTS
+
+        # 原生<video>一定需要完整解析
+        if video_marker in raw:
+            return True
+        # iframe/embed 只有指向已知视频站点时才可能是播放器
+        if not any(marker in raw for marker in tag_markers):
+            return False
+        return any(host in raw for host in hosts)
+
     def contains_video_player(self, html_content):
-        """分析HTML结构并返回带XPath的结果，包含文本、链接和视频播放器分析"""
+        """判断页面是否包含视频播放器，返回 (是否包含, 播放器XPath)"""
+        # 绝大多数页面没有播放器，预筛不通过时直接返回，省去BeautifulSoup建树
+        if not self.may_contain_video_player(html_content):
+            return False, None
+
+        if isinstance(html_content, (bytes, bytearray, memoryview)):
+            html_content = bytes(html_content).decode('utf-8', errors='replace')
         soup = BeautifulSoup(html_content, 'html.parser')
-        body = soup.find('body')
 
-        # 查找所有video和iframe标签
-        video_elements = soup.find_all(['video', 'iframe'])
+        # 查找所有video、iframe和embed标签
+        video_elements = soup.find_all(['video', 'iframe', 'embed'])
 
         for element in video_elements:
             if element.name == 'video':
                 xpath = self.get_xpath(element)
                 return True, xpath
-            elif element.name == 'iframe':
-                src = element.get('src', '')
-                # 判断是否为视频播放器的iframe
-                if 'youtube.com' in src or 'vimeo.com' in src:  # 可添加其他视频平台
+            else:
+                src = (element.get('src', '') or '').lower()
+                # 判断是否为视频播放器的iframe/embed
+                if any(host in src for host in VIDEO_HOSTS_STR):
                     xpath = self.get_xpath(element)
                     return True, xpath
 
+        return False, None
+
 def print_analysis(html_content: str) -> None:
     """打印分析结果，包含文本、链接和视频播放器分析"""
     analyzer = XPathHTMLAnalyzer()
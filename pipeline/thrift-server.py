@@ -1,5 +1,8 @@
 # server.py
+import argparse
 import asyncio
+import os
+import sys
 import uuid
 from datetime import datetime
 from thrift.transport import TSocket
@@ -14,6 +17,14 @@ from data_processing.ttypes import ProcessResult, ProcessStatus, ProcessRequest
 # 复用之前的异步处理管道
 from async_pipeline import AsyncDataPipeline
 
+# 剖析工具和阶段计时在 base_model 下，按文件名导入；插在搜索路径最前面，
+# metrics、profiler 不会被已安装的同名包抢先
+_BASE_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'base_model')
+if _BASE_MODEL not in sys.path:
+    sys.path.insert(0, _BASE_MODEL)
+import metrics
+import profiler
+
 class DataProcessingHandler:
     def __init__(self):
         self.pipeline = None
@@ -38,9 +49,12 @@ class DataProcessingHandler:
 
     async def process_single_url(self, request):
         """处理单个URL的异步方法"""
-        await self.init_pipeline()
+        with metrics.timed('init_pipeline'):
+            await self.init_pipeline()
         try:
-            result = await self.pipeline.process_url(request.url)
+            # --profile 时按比例抽样剖析请求；阶段计时让调用栈和内存分配归到 process_url 而不是 other
+            with profiler.profile_page(request.url), metrics.timed('process_url'):
+                result = await self.pipeline.process_url(request.url)
             return self.create_process_result(
                 id=str(uuid.uuid4()),
                 status=ProcessStatus.SUCCESS,
@@ -114,7 +128,11 @@ class DataProcessingHandler:
             return True
         return False
 
-def run_server():
+def run_server(args=None):
+    page_profiler = profiler.PipelineProfiler.from_args(args) if args is not None else None
+    if page_profiler is not None:
+        page_profiler.start()
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
@@ -135,6 +153,12 @@ def run_server():
         print('Stopping the server...')
         loop.run_until_complete(handler.pipeline.__aexit__(None, None, None))
         loop.close()
+    finally:
+        if page_profiler is not None:
+            page_profiler.stop()
+            summary = page_profiler.write()
+            print(f"剖析了 {summary['pages']} 个请求, 结果写入 {args.profile}")
 
 if __name__ == '__main__':
-    run_server()
+    parser = profiler.add_arguments(argparse.ArgumentParser(description='数据处理Thrift服务'))
+    run_server(parser.parse_args())
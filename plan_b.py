@@ -1,7 +1,5 @@
-from htmldate import find_date
-from trafilatura.settings import Extractor
-import mysql.connector
 from bs4 import BeautifulSoup, Comment
+from content_rules import is_meaningful_text
 html_content = """
 <!DOCTYPE html>
 <html>
@@ -1069,57 +1067,47 @@ def is_content_tag(tag):
     }
     return tag.name in content_tags
 
-def has_meaningful_text(element, min_length=10):
+def has_meaningful_text(element, min_length=10, text=None):
     """
     检查元素是否包含有意义的文本
     排除纯空格、纯符号等无意义内容
+    已经提取过文本时通过 text 传入，避免再次遍历子树
     """
-    text = element.get_text(strip=True)
-    if not text or len(text) < min_length:
-        return False
-        
-    # 检查是否全是特殊字符
-    special_chars = set(',.!?;:()[]{}|/\\<>+=_-*&^%$#@~`"\'')
-    text_chars = set(text)
-    if all(char in special_chars for char in text_chars):
-        return False
-        
-    # 检查是否是常见的噪音文本
-    noise_patterns = [
-        r'^[0-9\W]+$',  # 纯数字或特殊字符
-        r'^(powered by|copyright|\(c\)|©|all rights reserved)',  # 版权信息
-        r'^(share|like|follow|subscribe|sign up|login|register)',  # 行动号召
-        r'^(previous|next|page|[0-9]+ of [0-9]+)',  # 导航元素
-    ]
-    
-    return not any(re.match(pattern, text.lower()) for pattern in noise_patterns)
-
-
-soup = BeautifulSoup(html_content, 'html.parser')
-
-# 移除注释和无用标签
-for element in soup.find_all(string=lambda text: isinstance(text, Comment)):
-    element.extract()
-
-for element in soup.find_all(is_likely_noise):
-    element.decompose()
-
-# 移除header和footer
-for element in soup.find_all(is_likely_header_or_footer):
-      element.decompose()
-
-page_date = find_date(html_content, outputformat='%Y-%m-%d %H:%M:%S')
-print(page_date)
-import json
-from trafilatura import extract
-options = Extractor(output_format="json", with_metadata=True)
-options.formatting = True
-
-page_text = extract(html_content, options=options)
-json_data = json.loads(page_text)
-print(json_data)
-# print(page_text.raw_text)
-# print(json_data['title'])
-# print(json_data['raw_text'])
+    if text is None:
+        text = element.get_text(strip=True)
+    return is_meaningful_text(text, min_length)
+
+
+if __name__ == '__main__':
+    # 演示：导入本模块时不解析样例、不加载htmldate/trafilatura
+    import json
+    from htmldate import find_date
+    from trafilatura import extract
+    from trafilatura.settings import Extractor
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # 移除注释和无用标签
+    for element in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        element.extract()
+
+    for element in soup.find_all(is_likely_noise):
+        element.decompose()
+
+    # 移除header和footer
+    for element in soup.find_all(is_likely_header_or_footer):
+        element.decompose()
+
+    page_date = find_date(html_content, outputformat='%Y-%m-%d %H:%M:%S')
+    print(page_date)
+    options = Extractor(output_format="json", with_metadata=True)
+    options.formatting = True
+
+    page_text = extract(html_content, options=options)
+    json_data = json.loads(page_text)
+    print(json_data)
+    # print(page_text.raw_text)
+    # print(json_data['title'])
+    # print(json_data['raw_text'])
 
 
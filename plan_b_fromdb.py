@@ -1,19 +1,29 @@
+import argparse
 import asyncio
+import functools
 import csv
+import os
+import sys
 import logging
 import json
-import aiomysql
-from openai import AsyncOpenAI
-import trafilatura
-from lxml import html
 
 openai_api_key = "EMPTY"
 openai_api_base = "http://localhost:11434/v1"
 
-client = AsyncOpenAI(
-    api_key=openai_api_key,
-    base_url=openai_api_base,
-)
+# openai、trafilatura、数据库驱动、pyarrow 等导入较慢，都在用到时才导入：
+# 导入本模块（进程池worker、benchmark）不做任何连接和I/O
+_client = None
+
+
+def get_llm_client():
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(
+            api_key=openai_api_key,
+            base_url=openai_api_base,
+        )
+    return _client
 
 system_prompt = """
 你现在是一位专业的新闻文本分析专家。请分析以下新闻文本，找出该新闻的作者/记者。
@@ -45,6 +55,24 @@ system_prompt = """
 
 from bs4 import BeautifulSoup, Comment
 import re
+from content_rules import is_meaningful_text, prune_noise_and_boilerplate
+from text_cache import NodeTextCache
+from streaming_extractor import extract_main_content as extract_main_content_streaming
+# 读写数据库、缓存、去重等流水线模块放在 pipeline/base_model 下，模块之间直接按文件名导入；
+# 插在搜索路径最前面，metrics、storage 这类模块名不会被已安装的同名包抢先
+_BASE_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline', 'base_model')
+if _BASE_MODEL not in sys.path:
+    sys.path.insert(0, _BASE_MODEL)
+from near_duplicate import get_dedup_stage
+from result_cache import get_result_cache
+from incremental import WatermarkTracker, add_arguments, prepare_query
+import storage
+import metrics
+import page_decoding
+import profiler
+
+# 超过这个长度（字符数）的页面使用流式提取
+STREAMING_THRESHOLD = 2 * 1024 * 1024
 
 def is_likely_header_or_footer(element):
     """
@@ -99,61 +127,52 @@ def is_content_tag(tag):
     }
     return tag.name in content_tags
 
-def has_meaningful_text(element, min_length=10):
+def has_meaningful_text(element, min_length=10, text=None, text_cache=None):
     """
     检查元素是否包含有意义的文本
     排除纯空格、纯符号等无意义内容
+    已经提取过文本时通过 text 传入，或传入页面共用的 text_cache（判断结果也按节点缓存在其中），避免再次遍历子树
     """
-    text = element.get_text(strip=True)
-    if not text or len(text) < min_length:
-        return False
-        
-    # 检查是否全是特殊字符
-    special_chars = set(',.!?;:()[]{}|/\\<>+=_-*&^%$#@~`"\'')
-    text_chars = set(text)
-    if all(char in special_chars for char in text_chars):
-        return False
-        
-    # 检查是否是常见的噪音文本
-    noise_patterns = [
-        r'^[0-9\W]+$',  # 纯数字或特殊字符
-        r'^(powered by|copyright|\(c\)|©|all rights reserved)',  # 版权信息
-        r'^(share|like|follow|subscribe|sign up|login|register)',  # 行动号召
-        r'^(previous|next|page|[0-9]+ of [0-9]+)',  # 导航元素
-    ]
-    
-    return not any(re.match(pattern, text.lower()) for pattern in noise_patterns)
+    if text is None and text_cache is not None:
+        return text_cache.is_meaningful(element, min_length)
+    if text is None:
+        text = element.get_text(strip=True)
+    return is_meaningful_text(text, min_length)
 
-def get_text_density(element):
+def get_text_density(element, text_cache=None):
     """
     计算元素的文本密度
     文本密度 = 文本长度 / 标签数量
     """
-    text_length = len(element.get_text(strip=True))
+    text_length = text_cache.text_length(element) if text_cache else len(element.get_text(strip=True))
     tags_count = len(element.find_all())
     if tags_count == 0:
         return text_length
     return text_length / (tags_count + 1)
 
-def extract_main_content(html):
+def extract_main_content(html, raw=None, encoding=None):
     """
     提取HTML中的主要文本内容
+    raw/encoding 为 page_decoding 留下的原始字节和编码，流式解析时直接喂字节
     """
     if not html:
         return ""
+
+    # 超大页面走流式解析，不构建完整的DOM树
+    if len(html) >= STREAMING_THRESHOLD:
+        with metrics.timed('extract'):
+            if raw is not None:
+                return extract_main_content_streaming(raw, strip=False, encoding=encoding)
+            return extract_main_content_streaming(html, strip=False)
         
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # 移除注释和无用标签
-    for element in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        element.extract()
-    
-    for element in soup.find_all(is_likely_noise):
-        element.decompose()
+    with metrics.timed('parse'):
+        soup = BeautifulSoup(html, 'html.parser')
     
-    # 移除header和footer
-    for element in soup.find_all(is_likely_header_or_footer):
-        element.decompose()
+    # 一次遍历移除注释、无用标签以及header和footer
+    with metrics.timed('clean'):
+        prune_noise_and_boilerplate(soup)
+    # 本页面所有启发式规则共用的文本缓存，节点的判断结果也缓存在其中
+    text_cache = NodeTextCache(soup)
     
     def extract_text_from_element(element, depth=0, max_depth=10):
         """
@@ -165,7 +184,7 @@ def extract_main_content(html):
         texts = []
         
         # 如果元素本身包含有意义的文本，直接添加
-        if has_meaningful_text(element):
+        if has_meaningful_text(element, text_cache=text_cache):
             text = element.get_text(strip=False)
                 # 删除重复的换行
             text = re.sub(r'\n{3,}', '\n\n', text)
@@ -178,7 +197,8 @@ def extract_main_content(html):
 
     body = soup.find('body')
     if body:
-        texts = extract_text_from_element(body)
+        with metrics.timed('extract'):
+            texts = extract_text_from_element(body)
     # 后处理
     processed_texts = []
     seen_texts = set()
@@ -213,30 +233,31 @@ def clean_extracted_text(text):
     
     return text
 
-def extract_text_from_html(html):
+def extract_text_from_html(html, raw=None, encoding=None):
     """
     主函数：从HTML中提取清理后的主要文本内容
     """
-    main_content = extract_main_content(html)
+    main_content = extract_main_content(html, raw, encoding)
     cleaned_text = clean_extracted_text(main_content)
     return cleaned_text
 
 
 async def call_llm(input_msg):
     try:
-        chat_response = await client.chat.completions.create(
-            model="Qwen2-1B",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": input_msg},
-            ],
-            temperature=0.7,
-            top_p=0.8,
-            # max_tokens=512,
-            extra_body={
-                "repetition_penalty": 1.05,
-            },
-        )
+        with metrics.timed('llm'):
+            chat_response = await get_llm_client().chat.completions.create(
+                model="Qwen2-1B",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": input_msg},
+                ],
+                temperature=0.7,
+                top_p=0.8,
+                # max_tokens=512,
+                extra_body={
+                    "repetition_penalty": 1.05,
+                },
+            )
         content = chat_response.choices[0].message.content
         print("Chat response:", content)
         # return content
@@ -244,11 +265,11 @@ async def call_llm(input_msg):
     except json.JSONDecodeError:
         raise ValueError(f"Invalid JSON response: {content}")
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 async def process_data(data):
+    import trafilatura
+
     try:
-        input_msg = extract_text_from_html(data['result_text'])
+        input_msg = extract_text_from_html(data['result_text'], data.get('result_bytes'), data.get('encoding'))
         result = ""
         # result = await call_llm(input_msg)
         
@@ -256,14 +277,17 @@ async def process_data(data):
         # author_data = json.loads(result.replace('```json', '').replace('```', ''))
 
         
-        page_text = trafilatura.extract(data['result_text'], output_format="json", with_metadata=True)
+        with metrics.timed('trafilatura'):
+            page_text = trafilatura.extract(data['result_text'], output_format="json", with_metadata=True)
         if page_text is not None:
             page_data = json.loads(page_text)
         else:
             page_data = {'raw_text': '', 'date': '', 'title': ''}
         
         # 解析 HTML 内容
-        tree = html.fromstring(data['result_text'])
+        with metrics.timed('parse'):
+            # 有原始字节时按判断出的编码直接解析字节
+            tree = page_decoding.parse_html(data, html_elements=True)
         # 提取标题
         title = tree.find('.//title').text
         
@@ -284,67 +308,138 @@ async def process_data(data):
         
 
 
-async def process_batch(batch):
-    return await asyncio.gather(*[process_data(data) for data in batch])
+async def process_one(data, sinks=()):
+    # 先查完全相同页面的结果缓存，再做近重复检测，最后才真正提取
+    process = process_data
+    dedup = get_dedup_stage()
+    if dedup is not None:
+        process = functools.partial(dedup.run, process=process_data)
+    cache = get_result_cache()
+    with metrics.tracking_page('plan_b_fromdb') as outcome, profiler.profile_page(data['id']):
+        # 读出的是字节（--raw-pages 或归档）时在这里解码一次，字节和str都留在行里
+        page_decoding.decode_row(data)
+        if cache is not None:
+            result = await cache.run(data, process, namespace='plan_b_fromdb')
+        else:
+            result = await process(data)
+        outcome.append(result)
+    # 结果依次交给各输出（数据库写回、Parquet）
+    for sink in sinks:
+        await sink.add(result)
+    return result
+
+async def process_batch(batch, sinks=()):
+    return await asyncio.gather(*[process_one(data, sinks) for data in batch])
 
 async def get_mysql_connection():
-    return await aiomysql.connect(
-        host='60.205.251.23',  # Replace with your MySQL host
-        port=3306,             # Default MySQL port
-        user='pom',  # Replace with your MySQL username
-        password='Bohui#123', # Replace with your MySQL password
-        db='spider_test',
-        charset='utf8mb4',
-        cursorclass=aiomysql.DictCursor
-    )
-
-async def main(concurrency):
+    import db
+    return await db.connect()
+
+async def main(concurrency, args):
     
+    # METRICS_PORT / METRICS_FILE 配置时导出各阶段耗时
+    exporter = metrics.start_exporter()
+    if exporter:
+        logging.info(f"指标导出到 {exporter}")
+    # --profile 时按 --profile-rate 抽样剖析页面
+    page_profiler = profiler.PipelineProfiler.from_args(args)
+    if page_profiler is not None:
+        page_profiler.start()
+
+    database = writer = parquet = archive = None
     try:
-        # Connect to MySQL
-        conn = await get_mysql_connection()
-        async with conn.cursor() as cursor:
-            # Fetch data from MySQL - adjust table name as needed
-            await cursor.execute('select id, result_text from spider_test.details_test_table dtt')
-            mysql_data = await cursor.fetchall()
-    except Exception as e:
-        logging.error(f"Failed to connect to MySQL: {e}")
-        return
+        if not args.archive or args.write_results:
+            try:
+                # 读取和写回共用一个连接池，--backend 选择 MySQL 或 PostgreSQL
+                database = await storage.open_backend(args.backend)
+            except Exception as e:
+                logging.error(f"Failed to connect to {args.backend}: {e}")
+                return
+
+        try:
+            if args.write_results:
+                writer = await database.result_writer(args.batch_size, args.flush_interval).start()
+            if args.parquet:
+                from parquet_results import ParquetResultWriter
+                parquet = ParquetResultWriter(args.parquet)
+            sinks = [sink for sink in (writer, parquet) if sink is not None]
+
+            if args.archive:
+                # 从本地归档读取页面，同一批语料反复实验时不走网络；归档没有水位
+                # pyarrow和页面归档（numpy、zstandard）只在用到时导入，worker冷启动不必加载
+                from page_archive import PageArchive, stream_archive
+                archive = PageArchive(args.archive)
+                batches = metrics.timed_batches(stream_archive(archive, args, concurrency), 'archive_read')
+                job = None
+            else:
+                # 增量模式只查询水位之后的行，--ids/--since 可手动指定范围
+                sql, params, job = await prepare_query(database, args, 'plan_b_fromdb')
+                batches = metrics.timed_batches(database.stream(sql, params, batch_size=concurrency), 'db_read')
+
+            finally_rs = []
+            # 之前运行中失败过的行带着累计失败次数，达到 --max-attempts 次的记为死信
+            attempts = await database.load_failures(job) if job else {}
+            watermarks = WatermarkTracker(args.watermark_column, attempts, args.max_attempts)
+            rows = 0
+
+            # 服务端游标边读边分批提交处理；同时处理的批数有上限，处理跟不上时暂停读取
+            process = functools.partial(process_batch, sinks=sinks)
+            async for batch, batch_result in storage.process_batches(batches, process, args.max_in_flight,
+                                                                     on_read=watermarks.read):
+                rows += len(batch)
+                # 整批抛出的异常和 process_data 内部捕获后返回None的页面都算失败
+                watermarks.record(batch, batch_result)
+                if isinstance(batch_result, Exception):
+                    logging.error(f"Batch processing error: {batch_result}")
+                elif parquet is None:
+                    # 只有输出JSON时才需要在内存中保留全部结果
+                    finally_rs.extend(batch_result)
+            logging.info(f"处理了 {rows} 行")
+        finally:
+            # 处理中途出错时也要写完缓冲中的结果、写完Parquet文件并关闭归档
+            await storage.close_all(writer, parquet, archive)
+
+        if writer is not None:
+            logging.info(f"写回 {writer.written} 条结果, 共 {writer.flushes} 次批量写入")
+        if parquet is not None:
+            logging.info(f"{parquet.written} 条结果写入 {parquet.path}")
+
+        cache = get_result_cache()
+        if cache is not None:
+            logging.info(f"结果缓存命中 {cache.hits} 次, 未命中 {cache.misses} 次, 命中率 {cache.hit_ratio():.2%}")
+        dedup = get_dedup_stage()
+        if dedup is not None:
+            logging.info(f"近重复页面 {dedup.duplicates} 个, 占比 {dedup.duplicate_ratio():.2%}")
+            dedup.save()
+
+            # 将列表保存为 JSON 文件；写Parquet时不再输出JSON
+        if parquet is None:
+            with open(args.output, 'w', encoding='utf8') as f:
+                json.dump(finally_rs, f, ensure_ascii=False)
+
+        # 水位只推进到第一个失败行之前，失败的行及其之后的行下次运行会重新处理
+        watermark = watermarks.watermark
+        if job and watermarks.failed:
+            logging.warning(f"有页面处理失败，水位停在第一个失败行之前: {args.watermark_column}={watermark}")
+        if job and watermark is not None:
+            await database.save_watermark(job, args.watermark_column, watermark)
+            logging.info(f"水位推进到 {args.watermark_column}={watermark}")
+        if job and (watermarks.updated or watermarks.cleared):
+            await database.save_failures(job, watermarks.updated, watermarks.cleared)
+        if job and watermarks.dead_letters:
+            logging.warning(f"{len(watermarks.dead_letters)} 行累计失败 {args.max_attempts} 次，记为死信不再重试: "
+                            f"{watermarks.dead_letters[:20]}")
+
+        if page_profiler is not None:
+            page_profiler.stop()
+            summary = page_profiler.write()
+            logging.info(f"剖析了 {summary['pages']} 个页面, 结果写入 {args.profile}")
+
+        if database is not None:
+            logging.info(f"连接池等待: {database.metrics.report()}")
     finally:
-        conn.close()
-
-    queue = asyncio.Queue()
-
-    # Put data into queue
-    for data in mysql_data:
-        await queue.put(data)
-
-    finally_rs = []
-    tasks = []
-
-    while not queue.empty():
-        batch = []
-        for _ in range(concurrency):
-            if queue.empty():
-                break
-            batch.append(await queue.get())
-        
-        if batch:
-            task = asyncio.create_task(process_batch(batch))
-            tasks.append(task)
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    for batch_result in results:
-        if isinstance(batch_result, Exception):
-            logging.error(f"Batch processing error: {batch_result}")
-        else:
-            finally_rs.extend(batch_result)
-
-
-        # 将列表保存为 JSON 文件
-    with open('data.json', 'w', encoding='utf8') as f:
-        json.dump(finally_rs, f, ensure_ascii=False)
-
+        if database is not None:
+            await database.close()
 
     # csv_file_path = './data.csv'
     # try:
@@ -368,5 +463,9 @@ async def main(concurrency):
     #     logging.error(f"Error saving results to CSV: {e}")
 
 if __name__ == '__main__':
-    concurrency = 4  # 调整此值以更改并发级别
-    asyncio.run(main(concurrency))
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = profiler.add_arguments(storage.add_arguments(add_arguments(argparse.ArgumentParser())))
+    parser.add_argument('--concurrency', type=int, default=4, help='并发数')
+    parser.add_argument('--output', default='data.json', help='结果JSON文件')
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args))
\ No newline at end of file
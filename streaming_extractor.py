@@ -0,0 +1,188 @@
+"""
+基于lxml增量解析（SAX风格事件）的正文提取
+
+与 extractor2.extract_main_content 使用相同的噪音/header/footer规则，
+但不构建DOM树：解析器每读到一个标签或一段文本就回调一次，被判定为噪音的
+子树在回调中直接跳过，内存中只保留正文文本块，适合10MB以上的大页面。
+"""
+import re
+
+from lxml import etree
+
+from content_rules import NOISE_TAGS, HEADER_FOOTER_TAGS, is_meaningful_text, is_suspicious_attrs
+
+# 每次喂给解析器的字符数/字节数
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# 字节输入时在开头这么多字节内查找 meta charset
+CHARSET_SNIFF_BYTES = 4096
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([a-zA-Z0-9_-]+)', re.IGNORECASE)
+# gb2312/gbk 页面经常混入超出声明字符集的字符，统一按超集解码
+_CHARSET_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030'}
+
+# 结束时产出一个文本块的块级标签
+BLOCK_TAGS = frozenset({
+    'p', 'div', 'article', 'section', 'main', 'blockquote', 'pre',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'tr', 'td', 'th', 'figure', 'figcaption', 'caption', 'body'
+})
+
+class ContentBlockTarget:
+    """lxml解析器的target：在解析事件中过滤噪音，按块收集正文文本"""
+
+    def __init__(self):
+        self.blocks = []        # 已完成、等待调用方取走的文本块 (tag, raw_text, stripped_text)
+        self._stack = []        # 打开的标签栈，元素为 (tag, 是否被剪枝)
+        self._pruned_depth = 0  # 当前所在的被剪枝子树层数
+        self._body_depth = 0    # 当前所在的body层数
+        self._pending = []      # 同一个文本节点可能被拆成多次data回调
+        self._raw = []          # 当前块的原始文本片段
+        self._stripped = []     # 当前块的strip后文本片段
+
+    def _flush_text(self):
+        """结束一个文本节点：与get_text一样，每个文本节点单独strip"""
+        if not self._pending:
+            return
+        text = ''.join(self._pending)
+        self._pending = []
+        self._raw.append(text)
+        stripped = text.strip()
+        if stripped:
+            self._stripped.append(stripped)
+
+    def _emit_block(self, tag):
+        if self._stripped:
+            self.blocks.append((tag, ''.join(self._raw), ''.join(self._stripped)))
+        self._raw = []
+        self._stripped = []
+
+    def start(self, tag, attrib):
+        self._flush_text()
+        pruned = bool(self._pruned_depth)
+        if not pruned and self._body_depth:
+            if tag in NOISE_TAGS or tag in HEADER_FOOTER_TAGS or \
+                    is_suspicious_attrs(attrib.get('class', ''), attrib.get('id', '')):
+                pruned = True
+                self._pruned_depth += 1
+        elif self._pruned_depth:
+            self._pruned_depth += 1
+        if tag == 'body':
+            self._body_depth += 1
+        self._stack.append((tag, pruned))
+
+    def end(self, tag):
+        self._flush_text()
+        if not self._stack:
+            return
+        tag, pruned = self._stack.pop()
+        if pruned:
+            self._pruned_depth -= 1
+        if tag == 'body':
+            self._body_depth -= 1
+        if not pruned and tag in BLOCK_TAGS:
+            self._emit_block(tag)
+
+    def data(self, data):
+        if self._pruned_depth or not self._body_depth:
+            return
+        self._pending.append(data)
+
+    def comment(self, text):
+        # 注释不参与正文，但会切断前后两个文本节点
+        self._flush_text()
+
+    def close(self):
+        self._flush_text()
+        self._emit_block('body')
+        return None
+
+
+def _iter_chunks(source, chunk_size):
+    """把str/bytes/文件对象切成定长片段"""
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+
+
+def _sniff_encoding(head):
+    """从字节流开头的meta标签中读取charset，找不到返回None"""
+    match = _META_CHARSET.search(head)
+    if not match:
+        return None
+    charset = match.group(1).decode('ascii').lower()
+    return _CHARSET_ALIASES.get(charset, charset)
+
+
+def iter_content_blocks(source, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    增量解析HTML，按文档顺序逐个产出正文块 (tag, raw_text, stripped_text)
+    source 可以是 str、bytes 或以二进制/文本模式打开的文件对象
+    encoding 为字节输入的编码（如 page_decoding 判断出的编码），不给时按meta charset
+    """
+    target = ContentBlockTarget()
+    parser = None
+    head = []
+    head_size = 0
+    for chunk in _iter_chunks(source, chunk_size):
+        if parser is None:
+            # libxml2 只根据第一次feed的内容判断编码，所以先攒够开头一段再创建解析器
+            head.append(chunk)
+            head_size += len(chunk)
+            if head_size < CHARSET_SNIFF_BYTES:
+                continue
+            chunk = head[0][:0].join(head)
+            parser = _create_parser(target, chunk, encoding)
+        parser.feed(chunk)
+        if target.blocks:
+            yield from target.blocks
+            target.blocks = []
+    if parser is None:
+        # 整个页面都不足 CHARSET_SNIFF_BYTES
+        if not head_size:
+            return
+        chunk = head[0][:0].join(head)
+        parser = _create_parser(target, chunk, encoding)
+        parser.feed(chunk)
+    parser.close()
+    yield from target.blocks
+    target.blocks = []
+
+
+def _create_parser(target, head, encoding=None):
+    """创建带target的解析器，字节输入时按给定的编码或meta charset指定编码"""
+    if not isinstance(head, bytes):
+        encoding = None
+    elif encoding is None:
+        encoding = _sniff_encoding(head[:CHARSET_SNIFF_BYTES])
+    return etree.HTMLParser(target=target, remove_comments=False, encoding=encoding)
+
+
+def extract_main_content(source, strip=True, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    流式提取HTML中的主要文本内容，输出格式与 extractor2.extract_main_content 相同
+    strip=False 时与 plan_b_fromdb.extract_main_content 一致（保留文本节点间的空白）
+    """
+    if not source:
+        return ""
+
+    # strip=True 时只需保留strip后的文本，避免大页面上同时持有两份正文
+    raw_parts = []
+    stripped_parts = []
+    for _, raw_text, stripped_text in iter_content_blocks(source, chunk_size, encoding):
+        if not strip:
+            raw_parts.append(raw_text)
+        stripped_parts.append(stripped_text)
+
+    if not is_meaningful_text(''.join(stripped_parts)):
+        return ""
+
+    text = ''.join(raw_parts) if not strip else ''.join(stripped_parts)
+    # 规范化空白字符
+    return ' '.join(text.split())
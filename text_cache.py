@@ -0,0 +1,115 @@
+from bs4 import CData, NavigableString, Tag
+
+from content_rules import is_meaningful_text
+
+# get_text 默认只拼接这两种字符串，注释、script/style内容等不计入
+TEXT_STRING_TYPES = (NavigableString, CData)
+DEFAULT_STRING_TYPES = frozenset(TEXT_STRING_TYPES)
+
+
+class NodeTextCache:
+    """
+    按节点缓存 get_text(strip=True) 的结果
+    一次遍历把整页的文本节点各strip一次、拼成一个字符串，每个标签只记录自己
+    在其中的起止位置，因此任意节点的文本和长度都不需要重新遍历子树。
+    通过 decompose/extract 删除节点时缓存失效，下次访问时重新建立。
+    has_meaningful_text 的判断结果也缓存在这里：缓存与页面同生命周期，
+    节点都被 root 引用着，id不会被其他页面的节点复用。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.page_text = ''
+        self._entries = None   # id(tag) -> [start, end, ...子类附加的统计]
+        self._verdicts = {}    # (id(tag), min_length) -> 是否有意义
+
+    def _ensure(self):
+        if self._entries is None:
+            self._build()
+        return self._entries
+
+    def _build(self):
+        """先序记录起点，后序记录终点并交给 _leave 汇总子节点的统计"""
+        entries = {}
+        pieces = []
+        pos = 0
+        self._entries = entries
+        self._on_build_start()
+        stack = [(self.root, False)]
+        while stack:
+            node, leaving = stack.pop()
+            if not isinstance(node, Tag):
+                if type(node) in TEXT_STRING_TYPES:
+                    text = node.strip()
+                    if text:
+                        pieces.append(text)
+                        pos += len(text)
+                continue
+            if not leaving:
+                entries[id(node)] = self._new_entry(node, pos)
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.contents))
+                continue
+            entry = entries[id(node)]
+            entry[1] = pos
+            self._leave(node, entry)
+        self.page_text = ''.join(pieces)
+        self._on_build_end()
+
+    # 子类可以在遍历中顺带计算其它统计
+    def _on_build_start(self):
+        pass
+
+    def _new_entry(self, node, pos):
+        return [pos, pos]
+
+    def _leave(self, node, entry):
+        pass
+
+    def _on_build_end(self):
+        pass
+
+    def entry(self, node):
+        """返回节点的统计，节点不在缓存范围内时返回None"""
+        if getattr(node, 'interesting_string_types', DEFAULT_STRING_TYPES) != DEFAULT_STRING_TYPES:
+            # script/style/template 自身的 get_text 只取各自特殊类型的字符串
+            return None
+        return self._ensure().get(id(node))
+
+    def text(self, node):
+        """等价于 node.get_text(strip=True)"""
+        entry = self.entry(node)
+        if entry is None:
+            return node.get_text(strip=True)
+        return self.page_text[entry[0]:entry[1]]
+
+    def text_length(self, node):
+        """等价于 len(node.get_text(strip=True))，不拷贝字符串"""
+        entry = self.entry(node)
+        if entry is None:
+            return len(node.get_text(strip=True))
+        return entry[1] - entry[0]
+
+    def is_meaningful(self, node, min_length=None):
+        """等价于 content_rules.is_meaningful_text(node.get_text(strip=True), min_length)，按节点缓存"""
+        key = (id(node), min_length)
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            verdict = self._verdicts[key] = is_meaningful_text(self.text(node), min_length)
+        return verdict
+
+    def invalidate(self):
+        self._entries = None
+        self.page_text = ''
+        # 被删除的节点可能已经释放，它的id会被新节点复用
+        self._verdicts.clear()
+
+    def decompose(self, node):
+        """删除节点并让缓存失效"""
+        node.decompose()
+        self.invalidate()
+
+    def extract(self, node):
+        """摘除节点并让缓存失效"""
+        self.invalidate()
+        return node.extract()
@@ -0,0 +1,69 @@
+"""
+网页正文提取的库入口
+
+    from web_content_extractor import decode_html, extract_text_from_html, XPathHTMLAnalyzer
+    from web_content_extractor import Document, extract   # 统一接口，见 registry.py
+
+导入本包只设置模块搜索路径，不导入任何提取模块；属性第一次被访问时才导入对应的模块，
+所以进程池worker、thrift服务等只为自己用到的提取器付出导入时间（bs4、lxml、trafilatura、openai 等）。
+各模块本身也不在导入时做解析、连接数据库或调用模型，演示代码都在 `if __name__ == '__main__':` 下。
+冷启动时间用 `python benchmark.py startup` 测量。
+"""
+import importlib
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 提取模块在仓库根目录和 pipeline/base_model 下，模块之间直接按文件名导入；
+# 放在搜索路径最前面，metrics、profiler、storage、db 这类常见模块名不会被已安装的同名包抢先
+for _path in (os.path.join(_ROOT, 'pipeline', 'base_model'), _ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# 导出名 -> (模块, 属性)
+_EXPORTS = {
+    # 字节解码
+    'DecodedPage': ('page_decoding', 'DecodedPage'),
+    'decode_html': ('page_decoding', 'decode_html'),
+    'decode_row': ('page_decoding', 'decode_row'),
+    'parse_html': ('page_decoding', 'parse_html'),
+    # 提取
+    'clean_html': ('LLMUtils', 'clean_html'),
+    'extract_text_from_html': ('html_content_extractor', 'extract_text_from_html'),
+    'extract_content_sections': ('html_content_extractor', 'extract_content_sections'),
+    'extract_main_content_streaming': ('streaming_extractor', 'extract_main_content'),
+    'iter_content_blocks': ('streaming_extractor', 'iter_content_blocks'),
+    'XPathHTMLAnalyzer': ('html_break_down_from_DB', 'XPathHTMLAnalyzer'),
+    'print_analysis': ('html_break_down_from_DB', 'print_analysis'),
+    'process_data': ('plan_b_fromdb', 'process_data'),
+    # 统一的提取接口和策略注册表
+    'Document': ('web_content_extractor.registry', 'Document'),
+    'Extractor': ('web_content_extractor.registry', 'Extractor'),
+    'Result': ('web_content_extractor.registry', 'Result'),
+    'extract': ('web_content_extractor.registry', 'extract'),
+    'extract_sync': ('web_content_extractor.registry', 'extract_sync'),
+    'register': ('web_content_extractor.registry', 'register'),
+    'available_strategies': ('web_content_extractor.registry', 'available_strategies'),
+    # 页面和结果存储
+    'PageArchive': ('page_archive', 'PageArchive'),
+    'PageArchiveWriter': ('page_archive', 'PageArchiveWriter'),
+    'read_results': ('parquet_results', 'read_results'),
+    'iter_results': ('parquet_results', 'iter_results'),
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module_name, attribute = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name), attribute)
+    # 之后的访问直接命中模块字典，不再经过 __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
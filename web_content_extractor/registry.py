@@ -0,0 +1,378 @@
+"""
+统一的提取接口：await extract(doc) -> Result
+
+各提取实现注册为策略，按相对成本从低到高：
+- heuristic    html_content_extractor 按内容得分选正文容器；超大页面走 streaming_extractor
+- xpath        html_break_down_from_DB.print_analysis：两层结构分析、站点模板和视频链接
+- trafilatura  正文和标题、日期、作者等元数据
+- newspaper    newspaper3k（可选依赖，未安装时跳过）
+- llm          plan_b_fromdb.call_llm 从启发式正文中找作者，要调用模型服务，最贵
+
+两种模式：
+- cascade：按成本依次运行，合并结果的置信度达到 threshold 就停下，更贵的策略不再运行
+- ensemble：所有策略都运行（llm 的网络等待与其余策略并发），按字段合并
+
+同一页面的各策略共用一个 Document：解码、lxml树、<title> 只计算一次，
+策略结果也缓存在 Document 上（llm 直接用 heuristic 的正文）；设置 RESULT_CACHE_PATH 时
+各策略的结果另外按页面摘要存进 result_cache，重复页面不再运行。
+
+    python -m web_content_extractor.registry page.html --mode ensemble --strategies heuristic trafilatura
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+from functools import cached_property
+from typing import Dict, Iterable, List, Optional
+
+import metrics
+from content_rules import is_meaningful_text
+from page_decoding import decode_html, decode_row, get_site_cache, parse_html
+from result_cache import get_result_cache
+
+MODES = ('cascade', 'ensemble')
+# 默认的策略、模式和cascade的置信度阈值
+EXTRACT_STRATEGIES_ENV = 'EXTRACT_STRATEGIES'
+EXTRACT_MODE_ENV = 'EXTRACT_MODE'
+EXTRACT_THRESHOLD_ENV = 'EXTRACT_THRESHOLD'
+DEFAULT_THRESHOLD = 0.6
+
+# 正文达到这么多字符时内容置信度为1
+CONFIDENT_CHARS = 400
+# 超过这个长度（字符数）的页面启发式提取改用流式解析，与 plan_b_fromdb 相同
+STREAMING_THRESHOLD = 2 * 1024 * 1024
+# 模型无法给出作者时的回答
+UNKNOWN_AUTHOR = '无法确定'
+
+
+def content_confidence(text: Optional[str]) -> float:
+    """按正文长度估计置信度，无意义的文本（纯符号、版权声明等）减半"""
+    if not text:
+        return 0.0
+    confidence = min(1.0, len(text) / CONFIDENT_CHARS)
+    if not is_meaningful_text(text):
+        confidence /= 2
+    return confidence
+
+
+class Result:
+    """一个策略（或合并后）的提取结果，字段与 parquet_results.RESULT_SCHEMA 对应"""
+
+    FIELDS = ('title', 'content', 'date', 'author', 'videos', 'contents')
+
+    def __init__(self, strategy: str, title: str = None, content: str = None, date: str = None,
+                 author: str = None, videos: List[str] = None, contents: List[str] = None,
+                 confidence: float = None, strategies: List[str] = None):
+        self.strategy = strategy
+        self.title = title
+        self.content = content
+        self.date = date
+        self.author = author
+        self.videos = videos or []
+        self.contents = contents or []
+        self.confidence = content_confidence(content) if confidence is None else confidence
+        # 合并结果由哪些策略得到
+        self.strategies = strategies or [strategy]
+
+    def to_dict(self, page_id=None) -> Dict:
+        result = {field: getattr(self, field) for field in self.FIELDS}
+        result.update(strategy=self.strategy, confidence=self.confidence, strategies=self.strategies)
+        if page_id is not None:
+            result['id'] = page_id
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Result':
+        return cls(data['strategy'], confidence=data['confidence'], strategies=data.get('strategies'),
+                   **{field: data.get(field) for field in cls.FIELDS})
+
+    def __repr__(self):
+        return (f'Result(strategy={self.strategy!r}, confidence={self.confidence:.2f}, '
+                f'title={self.title!r}, content={len(self.content or "")} 字)')
+
+
+class Document:
+    """
+    一个待提取的页面；解析结果在第一次用到时计算并缓存，各策略共用
+    html 为解码后的文本，raw/encoding 为原始字节和编码（没有时为None）
+    """
+
+    def __init__(self, html: str, raw: bytes = None, encoding: str = None, url: str = None, page_id=None):
+        self.html = html
+        self.raw = raw
+        self.encoding = encoding
+        self.url = url
+        self.page_id = page_id
+        # 策略名 -> Result，本页面上已经运行过的策略
+        self.results: Dict[str, Result] = {}
+
+    @classmethod
+    def from_row(cls, row: Dict) -> 'Document':
+        """driver读出的一行 {'id', 'result_text', ...}，result_text 为字节时先解码"""
+        decode_row(row)
+        return cls(row['result_text'] or '', row.get('result_bytes'), row.get('encoding'), row.get('url'),
+                   row.get('id'))
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, url: str = None, page_id=None) -> 'Document':
+        page = decode_html(raw, None, get_site_cache())
+        # 替换过非法字节的页面不从字节解析，与 decode_row 相同
+        return cls(page.text, None if page.lossy else page.raw, page.encoding, url, page_id)
+
+    @classmethod
+    def of(cls, source) -> 'Document':
+        if isinstance(source, Document):
+            return source
+        if isinstance(source, dict):
+            return cls.from_row(source)
+        if isinstance(source, (bytes, bytearray)):
+            return cls.from_bytes(bytes(source))
+        return cls(source or '')
+
+    @cached_property
+    def row(self) -> Dict:
+        """与driver读出的行相同格式，交给 print_analysis 等按行处理的函数"""
+        row = {'id': self.page_id, 'result_text': self.html, 'url': self.url}
+        if self.raw is not None:
+            row.update(result_bytes=self.raw, encoding=self.encoding)
+        return row
+
+    @cached_property
+    def tree(self):
+        """etree.HTML 解析的树，XPath分析用"""
+        with metrics.timed('parse'):
+            return parse_html(self.row)
+
+    @cached_property
+    def html_tree(self):
+        """lxml.html 解析的树，trafilatura 和取标题用（trafilatura会复制一份再清理，不改动这棵树）"""
+        with metrics.timed('parse'):
+            return parse_html(self.row, html_elements=True)
+
+    @cached_property
+    def title(self) -> Optional[str]:
+        try:
+            title = self.html_tree.findtext('.//title')
+        except Exception:
+            # 空页面等无法解析
+            return None
+        return title.strip() if title else None
+
+
+class Extractor:
+    """提取策略的基类：子类设置 name、cost，实现 extract"""
+
+    name: str = None
+    # 相对成本，cascade按从低到高运行
+    cost: int = 0
+    # 可选依赖的模块名，未安装时该策略不可用
+    requires: Iterable[str] = ()
+
+    def available(self) -> bool:
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    async def extract(self, doc: Document) -> Optional[Result]:
+        raise NotImplementedError
+
+
+STRATEGIES: Dict[str, Extractor] = {}
+
+
+def register(extractor_class):
+    """类装饰器：注册一个策略，同名的后注册者覆盖先注册者"""
+    STRATEGIES[extractor_class.name] = extractor_class()
+    return extractor_class
+
+
+def get_extractor(name: str) -> Extractor:
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"未知的提取策略: {name}，可用: {', '.join(STRATEGIES)}") from None
+
+
+def available_strategies() -> List[str]:
+    return [extractor.name for extractor in sorted(STRATEGIES.values(), key=lambda e: e.cost) if extractor.available()]
+
+
+@register
+class HeuristicExtractor(Extractor):
+    name = 'heuristic'
+    cost = 1
+
+    async def extract(self, doc):
+        if len(doc.html) >= STREAMING_THRESHOLD:
+            from streaming_extractor import extract_main_content
+            source = doc.raw if doc.raw is not None else doc.html
+            content = extract_main_content(source, encoding=doc.encoding if doc.raw is not None else None)
+        else:
+            from html_content_extractor import clean_extracted_text, extract_main_content
+            content = clean_extracted_text(extract_main_content(doc.html))
+        return Result(self.name, title=doc.title, content=content)
+
+
+@register
+class XPathExtractor(Extractor):
+    name = 'xpath'
+    cost = 2
+
+    async def extract(self, doc):
+        from html_break_down_from_DB import print_analysis
+        analysis = await print_analysis(doc.row, selector=doc.tree)
+        if not analysis:
+            return None
+        contents = [text for text in analysis['contents'] if text]
+        return Result(self.name, title=doc.title, content='\n\n'.join(contents), videos=analysis['videos'],
+                      contents=contents)
+
+
+@register
+class TrafilaturaExtractor(Extractor):
+    name = 'trafilatura'
+    cost = 3
+    requires = ('trafilatura',)
+
+    async def extract(self, doc):
+        import trafilatura
+        # 直接交给已经解析好的树，不再解析一遍HTML
+        page_text = trafilatura.extract(doc.html_tree, url=doc.url, output_format='json', with_metadata=True)
+        if page_text is None:
+            return None
+        page_data = json.loads(page_text)
+        return Result(self.name, title=page_data.get('title'), content=page_data.get('raw_text'),
+                      date=page_data.get('date'), author=page_data.get('author'))
+
+
+@register
+class NewspaperExtractor(Extractor):
+    name = 'newspaper'
+    cost = 4
+    requires = ('newspaper',)
+
+    async def extract(self, doc):
+        from newspaper import Article
+        article = Article(doc.url or '')
+        article.download(input_html=doc.html)
+        article.parse()
+        return Result(self.name, title=article.title, content=article.text,
+                      date=article.publish_date.isoformat() if article.publish_date else None,
+                      author=', '.join(article.authors) or None)
+
+
+@register
+class LLMExtractor(Extractor):
+    name = 'llm'
+    cost = 10
+    requires = ('openai',)
+
+    async def extract(self, doc):
+        from plan_b_fromdb import call_llm
+        # 模型的输入与 plan_b_fromdb 相同，是启发式提取的正文；heuristic 已经运行过时直接复用
+        heuristic = await run_strategy(doc, 'heuristic')
+        if heuristic is None or not heuristic.content:
+            return None
+        answer = await call_llm(heuristic.content)
+        author = answer.get('author') if isinstance(answer, dict) else None
+        if not author or author == UNKNOWN_AUTHOR:
+            return Result(self.name, confidence=0.0)
+        # 只给出作者，不参与正文的选择
+        return Result(self.name, author=author, confidence=0.0)
+
+
+async def run_strategy(doc: Document, name: str) -> Optional[Result]:
+    """在页面上运行一个策略，结果缓存在 doc 上（以及配置了的 result_cache 中）；失败时返回None"""
+    if name in doc.results:
+        return doc.results[name]
+    extractor = get_extractor(name)
+    cache = get_result_cache()
+    digest = cache.key(doc.raw if doc.raw is not None else doc.html, f'extractor:{name}') if cache else None
+    cached = cache.get(digest) if cache is not None else None
+    if cached is not None:
+        result = Result.from_dict(cached)
+    else:
+        try:
+            with metrics.timed(f'extractor_{name}'):
+                result = await extractor.extract(doc)
+        except Exception as e:
+            logging.warning(f"提取策略 {name} 失败: {e}")
+            result = None
+        if result is not None and cache is not None:
+            cache.put(digest, result.to_dict())
+    doc.results[name] = result
+    return result
+
+
+def merge(results: List[Result]) -> Optional[Result]:
+    """
+    按字段合并多个策略的结果：正文取置信度最高的（相同时取成本低的，即列表中靠前的），
+    标题取最长的（与 plan_b_fromdb 一致），日期和作者取第一个非空的，视频链接取并集
+    """
+    results = [result for result in results if result is not None]
+    if not results:
+        return None
+    best = max(results, key=lambda result: result.confidence)
+    merged = Result(best.strategy, title=best.title, content=best.content, date=best.date, author=best.author,
+                    videos=list(dict.fromkeys(video for result in results for video in result.videos)),
+                    contents=best.contents, confidence=best.confidence,
+                    strategies=[result.strategy for result in results])
+    merged.title = max((result.title for result in results if result.title), key=len, default=None)
+    for field in ('date', 'author'):
+        if not getattr(merged, field):
+            setattr(merged, field, next((getattr(r, field) for r in results if getattr(r, field)), None))
+    return merged
+
+
+def _default_strategies() -> List[str]:
+    names = os.environ.get(EXTRACT_STRATEGIES_ENV)
+    if names:
+        return [name.strip() for name in names.split(',') if name.strip()]
+    return available_strategies()
+
+
+async def extract(doc, strategies: Iterable[str] = None, mode: str = None,
+                  threshold: float = None) -> Optional[Result]:
+    """
+    在一个页面上按 mode 运行策略并合并结果；doc 可以是 Document、driver读出的行、HTML字符串或字节
+    strategies 为空时用 EXTRACT_STRATEGIES 环境变量或全部可用策略；不可用的策略跳过
+    """
+    doc = Document.of(doc)
+    mode = mode or os.environ.get(EXTRACT_MODE_ENV, 'cascade')
+    if mode not in MODES:
+        raise ValueError(f"未知的提取模式: {mode}")
+    threshold = float(os.environ.get(EXTRACT_THRESHOLD_ENV, DEFAULT_THRESHOLD)) if threshold is None else threshold
+    names = [name for name in (strategies or _default_strategies()) if get_extractor(name).available()]
+    names.sort(key=lambda name: get_extractor(name).cost)
+
+    if mode == 'ensemble':
+        results = await asyncio.gather(*(run_strategy(doc, name) for name in names))
+        return merge(list(results))
+
+    results = []
+    for name in names:
+        results.append(await run_strategy(doc, name))
+        merged = merge(results)
+        if merged is not None and merged.confidence >= threshold:
+            return merged
+    return merge(results)
+
+
+def extract_sync(doc, strategies: Iterable[str] = None, mode: str = None, threshold: float = None):
+    """在没有事件循环的代码中调用 extract"""
+    return asyncio.run(extract(doc, strategies, mode, threshold))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='用注册的提取策略提取一个HTML文件')
+    parser.add_argument('path')
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--mode', choices=MODES, default=None)
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=None)
+    parser.add_argument('--threshold', type=float, default=None)
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        document = Document.from_bytes(f.read(), url=args.url)
+    result = extract_sync(document, args.strategies, args.mode, args.threshold)
+    print(json.dumps(result.to_dict() if result else None, ensure_ascii=False, indent=2))